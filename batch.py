@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from typing import Generic, List, TypeVar
+from pagination import MAX_BATCH_IDS
+
+# Batch lookups by id (POST /api/<resource>/batch): one ``= ANY($1)`` query
+# for the whole list instead of one request per id. Results come back in the
+# order the ids were asked for, duplicates once, with the unknown ids listed
+# separately.
+
+T = TypeVar('T')
+
+class BatchRequest(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
+    def unique_ids(self) -> list:
+        return list(dict.fromkeys(self.ids))
+
+class BatchResult(BaseModel, Generic[T]):
+    found: List[T]
+    missing: List[str]
+
+def collect(ids: list, rows, key: str) -> dict:
+    """Order rows (records or dicts) like ``ids`` and name the ids not found."""
+    by_id = {row[key]: row for row in rows}
+    return {
+        'found': [dict(by_id[id_]) for id_ in ids if id_ in by_id],
+        'missing': [id_ for id_ in ids if id_ not in by_id],
+    }
@@ -0,0 +1,117 @@
+"""Google sign-in latency with cold and warm signing-key caches.
+
+Serves a generated signing certificate from a local HTTP endpoint (with an
+artificial delay standing in for the round trip to Google), points
+``firebase_tokens`` at it, and signs ID tokens for a throwaway user. Each
+cold sign-in starts from an empty key cache; warm sign-ins reuse it. Drives
+/api/users/google-signin in-process and reports p50/p99 for both. The bench
+user is removed afterwards.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_google_signin [--requests 50] [--cert-latency-ms 80]
+"""
+import argparse
+import asyncio
+import datetime
+import statistics
+import time
+from aiohttp import web
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+import httpx
+import jwt
+import database
+import firebase_tokens
+import main
+import security
+
+PROJECT_ID = 'bench-project'
+KID = 'bench-kid'
+USER_ID = 'BENCH-GOOGLE'
+EMAIL = 'bench-google@example.com'
+
+def make_signing_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'bench')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+
+def id_token(key) -> str:
+    now = int(time.time())
+    claims = {
+        'iss': firebase_tokens.ISSUER_PREFIX + PROJECT_ID, 'aud': PROJECT_ID, 'sub': 'bench-uid',
+        'iat': now, 'exp': now + 3600, 'auth_time': now, 'email': EMAIL, 'name': 'Bench',
+    }
+    return jwt.encode(claims, key, algorithm='RS256', headers={'kid': KID})
+
+async def serve_certs(pem: str, latency: float) -> web.AppRunner:
+    async def certs(request):
+        await asyncio.sleep(latency)
+        return web.json_response({KID: pem}, headers={'Cache-Control': 'public, max-age=3600'})
+    app = web.Application()
+    app.router.add_get('/certs', certs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 8765).start()
+    return runner
+
+def summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        'n': len(samples),
+        'p50_ms': round(statistics.median(ordered) * 1000, 1),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+    }
+
+async def run(args):
+    key, pem = make_signing_key()
+    runner = await serve_certs(pem, args.cert_latency_ms / 1000)
+    firebase_tokens._config = {'project_id': PROJECT_ID}
+    security.set_keys('bench-secret')
+    async with database.acquire() as conn:
+        await conn.execute('DELETE FROM users WHERE id_user = $1', USER_ID)
+        await conn.execute('''
+            INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name,
+                               billing_account_id, email, phone, is_verified)
+            VALUES ($1, 'Customer', 'Bench', 'bench-google', 'x', 'BENCH', 'Bench', 'BENCH', $2, 'bench-google', TRUE)
+        ''', USER_ID, EMAIL)
+    token = id_token(key)
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def sign_in() -> float:
+                started = time.perf_counter()
+                resp = await client.post('/api/users/google-signin', json={'firebase_token': token})
+                resp.raise_for_status()
+                return time.perf_counter() - started
+
+            cold = []
+            for _ in range(args.requests):
+                firebase_tokens._keys = firebase_tokens.PublicKeyCache('http://127.0.0.1:8765/certs')
+                cold.append(await sign_in())
+            warm = [await sign_in() for _ in range(args.requests)]
+        print(f"cold keys: {summary(cold)}")
+        print(f"warm keys: {summary(warm)}")
+    finally:
+        await runner.cleanup()
+        async with database.acquire() as conn:
+            await conn.execute('DELETE FROM users WHERE id_user = $1', USER_ID)
+
+async def bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--cert-latency-ms', type=float, default=80)
+    args = parser.parse_args()
+
+    async with main.lifespan(main.app):
+        await run(args)
+
+if __name__ == '__main__':
+    asyncio.run(bench())
@@ -0,0 +1,92 @@
+"""Round-trip benchmark for group membership changes.
+
+Builds a throwaway group with N members and a fixed set of projects, then
+times the four membership routes and counts the statements each one sends to
+Postgres. The statement count should stay the same as N grows. All bench rows
+are removed afterwards.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_group_membership [--sizes 10 50 200] [--projects 50]
+"""
+import argparse
+import asyncio
+import time
+import database
+from routes import groups
+
+PREFIX = 'BENCH-GRP'
+GROUP_ID = f'{PREFIX}-G'
+
+CLEANUP_SQL = '''
+DELETE FROM user_projects WHERE id_user LIKE 'BENCH-GRP-%';
+DELETE FROM user_groups WHERE group_id LIKE 'BENCH-GRP-%';
+DELETE FROM group_projects WHERE group_id LIKE 'BENCH-GRP-%';
+DELETE FROM groups WHERE group_id LIKE 'BENCH-GRP-%';
+DELETE FROM projects WHERE project_id LIKE 'BENCH-GRP-%';
+DELETE FROM users WHERE id_user LIKE 'BENCH-GRP-%';
+'''
+
+async def seed(conn, users: int, projects: int):
+    await conn.execute(CLEANUP_SQL)
+    await conn.execute(
+        "INSERT INTO groups (group_id, group_name, company_id) VALUES ($1, 'Bench', 'BENCH')", GROUP_ID)
+    await conn.execute('''
+        INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name,
+                           billing_account_id, email, phone, is_verified)
+        SELECT $1 || '-U' || g, 'Customer', 'Bench', $1 || '-u' || g, 'x', 'BENCH', 'Bench', 'BENCH',
+               $1 || '-' || g || '@example.com', $1 || '-' || g, TRUE
+        FROM generate_series(1, $2) g
+    ''', PREFIX, users)
+    await conn.execute('''
+        INSERT INTO projects (project_id, company_id, billing_account_id)
+        SELECT $1 || '-P' || g, 'BENCH', 'BENCH' FROM generate_series(1, $2) g
+    ''', PREFIX, projects)
+
+async def measure(conn, label: str, call) -> dict:
+    statements = []
+    conn.add_query_logger(statements.append)
+    started = time.perf_counter()
+    try:
+        await call()
+    finally:
+        elapsed = time.perf_counter() - started
+        conn.remove_query_logger(statements.append)
+    return {'op': label, 'statements': len(statements), 'ms': round(elapsed * 1000, 1)}
+
+async def run(conn, users: int, projects: int) -> list:
+    await seed(conn, users, projects)
+    user_ids = [f'{PREFIX}-U{i}' for i in range(1, users + 1)]
+    project_ids = [f'{PREFIX}-P{i}' for i in range(1, projects + 1)]
+    results = [
+        # Projects first, then users: the user insert has to grant every project
+        await measure(conn, 'add_projects', lambda: groups.add_projects_to_group(GROUP_ID, project_ids[:1], db=conn)),
+        await measure(conn, 'add_users', lambda: groups.add_users_to_group(GROUP_ID, user_ids, db=conn)),
+        await measure(conn, 'add_projects', lambda: groups.add_projects_to_group(GROUP_ID, project_ids[1:], db=conn)),
+        await measure(conn, 'delete_project', lambda: groups.delete_project_from_group(GROUP_ID, project_ids[0], db=conn)),
+        await measure(conn, 'delete_user', lambda: groups.delete_user_from_group(GROUP_ID, user_ids[0], db=conn)),
+    ]
+    granted = await conn.fetchval("SELECT count(*) FROM user_projects WHERE on_group = $1", GROUP_ID)
+    expected = (users - 1) * (projects - 1)
+    if granted != expected:
+        raise RuntimeError(f'expected {expected} inherited grants, found {granted}')
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--projects', type=int, default=50)
+    args = parser.parse_args()
+
+    conn = await database.connect_to_db()
+    try:
+        for size in args.sizes:
+            for result in await run(conn, size, args.projects):
+                print(f"users={size:<5} projects={args.projects:<4} {result['op']:15} "
+                      f"statements={result['statements']:<3} {result['ms']} ms")
+    finally:
+        await conn.execute(CLEANUP_SQL)
+        await database.close_db_connection(conn)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""Login latency benchmark, with and without concurrent read traffic.
+
+Drives the app in-process (one event loop, like one uvicorn worker) with
+``--logins`` concurrent logins for a throwaway verified user, optionally
+while ``--readers`` clients keep requesting a cheap read endpoint. Runs each
+scenario with bcrypt inline on the event loop (the old behaviour) and
+through the ``passwords`` executor, and reports p50/p99 latency and
+requests/sec for logins and reads. The bench user is removed afterwards.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_login [--logins 200] [--concurrency 20] [--readers 4]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import bcrypt
+import httpx
+import database
+import main
+import passwords
+
+USER_ID = 'BENCH-LOGIN'
+USERNAME = 'bench-login'
+PASSWORD = 'bench-password'
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summary(samples: list, elapsed: float) -> dict:
+    if not samples:
+        return {}
+    return {
+        'n': len(samples),
+        'p50_ms': round(statistics.median(samples) * 1000, 1),
+        'p99_ms': round(percentile(samples, 99) * 1000, 1),
+        'rps': round(len(samples) / elapsed, 1),
+    }
+
+async def inline_run(fn, *args):
+    return fn(*args)
+
+async def scenario(client, logins: int, concurrency: int, readers: int) -> dict:
+    login_times, read_times = [], []
+    done = asyncio.Event()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            resp = await client.post('/api/users/login', json={'username': USERNAME, 'password': PASSWORD})
+            resp.raise_for_status()
+            login_times.append(time.perf_counter() - started)
+
+    async def reader():
+        while not done.is_set():
+            started = time.perf_counter()
+            resp = await client.get(f'/api/users/{USER_ID}')
+            resp.raise_for_status()
+            read_times.append(time.perf_counter() - started)
+
+    reader_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*reader_tasks)
+    return {'logins': summary(login_times, elapsed), 'reads': summary(read_times, elapsed)}
+
+async def run(args):
+    async with database.acquire() as conn:
+        await conn.execute('DELETE FROM users WHERE id_user = $1', USER_ID)
+        await conn.execute('''
+            INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name,
+                               billing_account_id, email, phone, is_verified)
+            VALUES ($1, 'Customer', 'Bench', $2, $3, 'BENCH', 'Bench', 'BENCH', 'bench-login@example.com', 'bench-login', TRUE)
+        ''', USER_ID, USERNAME, bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(passwords.rounds)).decode('utf-8'))
+    offloaded = passwords._run
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for mode, runner in (('inline', inline_run), ('executor', offloaded)):
+                passwords._run = runner
+                for readers in (0, args.readers):
+                    result = await scenario(client, args.logins, args.concurrency, readers)
+                    print(f'{mode:9} readers={readers} logins={result["logins"]} reads={result["reads"]}')
+    finally:
+        passwords._run = offloaded
+        async with database.acquire() as conn:
+            await conn.execute('DELETE FROM users WHERE id_user = $1', USER_ID)
+
+async def bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    async with main.lifespan(main.app):
+        await run(args)
+
+if __name__ == '__main__':
+    asyncio.run(bench())
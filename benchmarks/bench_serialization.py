@@ -0,0 +1,73 @@
+"""Response serialization benchmark for list routes.
+
+Fetches ``--sizes`` synthetic ticket rows (generate_series, nothing is
+written) and times two ways of turning the asyncpg records into the response
+body:
+
+- validated: ``[dict(r) for r in records]`` validated and dumped through the
+  ``List[Ticket]`` response model, as FastAPI does for a returned list
+- fast_json: ``fast_json.records_response`` writing the records straight to
+  JSON bytes
+
+Both bodies are checked to decode to the same JSON before timing.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_serialization [--sizes 10,100,1000,5000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+from pydantic import TypeAdapter
+import database
+import fast_json
+from routes.tickets import Ticket
+
+ROWS_SQL = '''
+    SELECT 'TICKET-' || g AS ticket_id, 'Compute Engine' AS product_list,
+           'VM cannot start' AS describe_issue, repeat('detail ', 20) AS detail_issue,
+           'High' AS priority, 'ops@example.com' AS contact, 'COMP-' || (g % 50) AS company_id,
+           'Example Company' AS company_name, NULL::text AS attachment, 'USER-' || g AS id_user,
+           'Open' AS status, now()::timestamp - g * interval '1 minute' AS created_at,
+           now()::timestamp AS updated_at
+    FROM generate_series(1, $1) AS g
+'''
+
+def validated(adapter: TypeAdapter, records) -> bytes:
+    return adapter.dump_json(adapter.validate_python([dict(record) for record in records]))
+
+def fast(records) -> bytes:
+    return fast_json.records_response(records, Ticket).body
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+async def main(sizes: list, repeat: int):
+    adapter = TypeAdapter(List[Ticket])
+    conn = await database.connect_to_db()
+    try:
+        print(f"encoder: {'orjson' if fast_json.orjson else 'json (stdlib)'}")
+        print(f"{'rows':>6} {'validated ms':>13} {'fast_json ms':>13} {'speedup':>8}")
+        for size in sizes:
+            records = await conn.fetch(ROWS_SQL, size)
+            assert json.loads(validated(adapter, records)) == json.loads(fast(records))
+            slow_s = timed(lambda: validated(adapter, records), repeat)
+            fast_s = timed(lambda: fast(records), repeat)
+            print(f"{size:>6} {slow_s * 1000:>13.2f} {fast_s * 1000:>13.2f} {slow_s / fast_s:>7.1f}x")
+    finally:
+        await database.close_db_connection(conn)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main([int(size) for size in args.sizes.split(',')], args.repeat))
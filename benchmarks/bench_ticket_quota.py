@@ -0,0 +1,91 @@
+"""Concurrency benchmark for ticket quota enforcement.
+
+Fires many parallel ticket creations at one company and checks how many got
+through. ``reserve`` is the transactional conditional increment used by
+create_ticket; ``count`` is the old COUNT(*)-then-insert check, for
+comparison. Uses a throwaway company in the configured database and removes
+it afterwards.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_ticket_quota [--limit 50] [--requests 500] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+import database
+import queries
+import quota
+
+COMPANY_ID = 'BENCH-QUOTA'
+
+async def create_with_reservation(conn, ticket_id: str) -> bool:
+    async with conn.transaction():
+        company_name = await quota.reserve_ticket(conn, COMPANY_ID)
+        if not company_name:
+            return False
+        await queries.fetchrow(conn, 'ticket_insert', ticket_id, 'bench', 'bench', 'bench', 'Low',
+                               'bench@example.com', COMPANY_ID, company_name, None, 'BENCH', 'Open')
+        return True
+
+async def create_with_count(conn, ticket_id: str) -> bool:
+    company = await queries.fetchrow(conn, 'customer_by_id', COMPANY_ID)
+    count = await queries.fetchval(conn, 'ticket_count_by_company', COMPANY_ID)
+    if count >= company['limit_ticket']:
+        return False
+    await queries.fetchrow(conn, 'ticket_insert', ticket_id, 'bench', 'bench', 'bench', 'Low',
+                           'bench@example.com', COMPANY_ID, company['company_name'], None, 'BENCH', 'Open')
+    await conn.execute('UPDATE customers SET ticket_usage = ticket_usage + 1 WHERE company_id = $1', COMPANY_ID)
+    return True
+
+async def run(mode: str, limit: int, requests: int, concurrency: int) -> dict:
+    create = create_with_reservation if mode == 'reserve' else create_with_count
+    async with database.acquire() as conn:
+        await conn.execute('DELETE FROM tickets WHERE company_id = $1', COMPANY_ID)
+        await conn.execute('DELETE FROM customers WHERE company_id = $1', COMPANY_ID)
+        await conn.execute(
+            "INSERT INTO customers (company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage) "
+            "VALUES ($1, 'Bench', 'BENCH', 'No', $2, 0)", COMPANY_ID, limit)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async def one(i: int) -> bool:
+        async with semaphore:
+            async with database.acquire() as conn:
+                return await create(conn, f'TICKET-BENCH-{uuid.uuid4().hex[:12]}')
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    async with database.acquire() as conn:
+        stored = await queries.fetchval(conn, 'ticket_count_by_company', COMPANY_ID)
+        usage = await conn.fetchval('SELECT ticket_usage FROM customers WHERE company_id = $1', COMPANY_ID)
+        await conn.execute('DELETE FROM tickets WHERE company_id = $1', COMPANY_ID)
+        await conn.execute('DELETE FROM customers WHERE company_id = $1', COMPANY_ID)
+    return {
+        'mode': mode,
+        'accepted': sum(results),
+        'stored_tickets': stored,
+        'ticket_usage': usage,
+        'limit': limit,
+        'requests_per_sec': round(requests / elapsed, 1),
+        'limit_held': stored <= limit and usage == stored,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    await database.create_db_pool()
+    try:
+        for mode in ('count', 'reserve'):
+            print(await run(mode, args.limit, args.requests, args.concurrency))
+    finally:
+        await database.close_db_pool()
+
+if __name__ == '__main__':
+    asyncio.run(main())
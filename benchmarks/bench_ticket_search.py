@@ -0,0 +1,140 @@
+"""Ticket list filter/sort/search latency on a seeded million-ticket dataset.
+
+Builds a scratch schema in the configured (local) database, applies every
+migration, seeds ``--tickets`` tickets over ``--companies`` companies and
+times the statements the ticket list routes run (``queries.ticket_list``):
+plain, filtered, sorted and full-text searched pages of 50, plus the old way
+of downloading a company's entire list for client-side filtering. Reports
+p50/p95 per case. The scratch schema is dropped afterwards.
+
+Usage (from the repository root, against a local Postgres)::
+
+    python -m benchmarks.bench_ticket_search [--tickets 1000000] [--companies 500] [--runs 30]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+import migrate
+import queries
+from database import connect_to_db, close_db_connection
+
+SCHEMA = 'bench_ticket_search'
+PAGE = 50
+
+SEED_CUSTOMERS_SQL = '''
+INSERT INTO customers (company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage)
+SELECT 'COMP-' || g, 'Company ' || g, 'BILL-' || g, 'Yes', 100000000, 0
+FROM generate_series(1, $1::int) g
+'''
+
+SEED_TICKETS_SQL = '''
+WITH words AS (
+    SELECT ARRAY['vm', 'disk', 'billing', 'network', 'login', 'database', 'quota', 'latency', 'error',
+                 'timeout', 'storage', 'bucket', 'firewall', 'certificate', 'dns', 'kubernetes', 'backup',
+                 'gagal', 'lambat', 'tidak', 'bisa', 'akses', 'tagihan', 'jaringan'] AS w
+)
+INSERT INTO tickets (ticket_id, product_list, describe_issue, detail_issue, priority, contact, company_id,
+                     company_name, attachment, id_user, status, created_at, updated_at)
+SELECT 'TICKET-' || lpad(g::text, 8, '0'),
+       (ARRAY['Compute Engine', 'Cloud Storage', 'BigQuery', 'GKE', 'Billing'])[g % 5 + 1],
+       w[g % 24 + 1] || ' ' || w[(g / 24) % 24 + 1] || ' ' || w[(g / 577) % 24 + 1],
+       'Customer reports ' || w[(g * 7) % 24 + 1] || ' ' || w[(g * 13) % 24 + 1] || ' issue. ' || repeat('log line ', 30),
+       (ARRAY['Low', 'Medium', 'High', 'Critical'])[(g / 11) % 4 + 1],
+       'contact' || (g % 1000) || '@example.com',
+       'COMP-' || (g % $2::int + 1), 'Company', NULL, 'USER_' || (g % 20000 + 1),
+       (ARRAY['Open', 'In Progress', 'Closed', 'Closed', 'Closed'])[(g / 3) % 5 + 1],
+       timestamp '2024-01-01' + g * interval '30 seconds',
+       timestamp '2024-01-01' + g * interval '30 seconds'
+FROM generate_series(1, $1::int) g, words
+'''
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def timed(conn, sql: str, args: list, runs: int):
+    rows = await conn.fetch(sql, *args)  # warm the statement and the cache
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await conn.fetch(sql, *args)
+        samples.append(time.perf_counter() - started)
+    return len(rows), statistics.median(samples), percentile(samples, 95)
+
+def filters(**values) -> list:
+    return queries.ticket_filter_args(values)
+
+def cases(companies: int, tickets: int) -> list:
+    company = 'COMP-7'
+    middle = datetime(2024, 1, 1) + timedelta(seconds=30 * tickets // 2)
+    return [
+        ('old: full company list, SELECT *', 'SELECT * FROM tickets WHERE company_id = $1', [company]),
+        ('company, summary page',
+         queries.QUERIES[queries.ticket_list(company=True, paged=True, after=False)],
+         [company, *filters(), PAGE + 1]),
+        ('company, status=Open, newest first',
+         queries.QUERIES[queries.ticket_list(company=True, sort='created_at', descending=True, paged=True,
+                                             after=False)],
+         [company, *filters(status=['Open']), PAGE + 1]),
+        ('company, status+priority, newest first',
+         queries.QUERIES[queries.ticket_list(company=True, sort='created_at', descending=True, paged=True,
+                                             after=False)],
+         [company, *filters(status=['Open', 'In Progress'], priority=['High', 'Critical']), PAGE + 1]),
+        ('company, created_at range (1 week)',
+         queries.QUERIES[queries.ticket_list(company=True, sort='created_at', paged=True, after=False)],
+         [company, *filters(created_from=middle, created_to=middle + timedelta(days=7)), PAGE + 1]),
+        ('company, newest first, cursor page',
+         queries.QUERIES[queries.ticket_list(company=True, sort='created_at', descending=True, paged=True)],
+         [company, *filters(), middle, 'TICKET-99999999', PAGE + 1]),
+        ('all, newest first',
+         queries.QUERIES[queries.ticket_list(sort='created_at', descending=True, paged=True, after=False)],
+         [*filters(), PAGE + 1]),
+        ('all, id_user filter',
+         queries.QUERIES[queries.ticket_list(sort='created_at', descending=True, paged=True, after=False)],
+         [*filters(id_user=['USER_42']), PAGE + 1]),
+        ('company, q="disk timeout" ranked',
+         queries.QUERIES[queries.ticket_list(company=True, search=True, paged=True, after=False)],
+         [company, *filters(), 'disk timeout', PAGE + 1]),
+        ('company, q="tagihan" + status, ranked',
+         queries.QUERIES[queries.ticket_list(company=True, search=True, paged=True, after=False)],
+         [company, *filters(status=['Open']), 'tagihan', PAGE + 1]),
+        ('all, q="firewall certificate dns" ranked',
+         queries.QUERIES[queries.ticket_list(search=True, paged=True, after=False)],
+         [*filters(), 'firewall certificate dns', PAGE + 1]),
+        ('all, q="kubernetes backup", newest first',
+         queries.QUERIES[queries.ticket_list(search=True, sort='created_at', descending=True, paged=True,
+                                             after=False)],
+         [*filters(), 'kubernetes backup', PAGE + 1]),
+    ]
+
+async def main(tickets: int, companies: int, runs: int):
+    conn = await connect_to_db()
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await conn.execute(f'CREATE SCHEMA {SCHEMA}')
+        await conn.execute(f'SET search_path TO {SCHEMA}')
+        await migrate.apply_migrations(conn)
+        print(f'Seeding {tickets} tickets over {companies} companies...')
+        started = time.perf_counter()
+        await conn.execute(SEED_CUSTOMERS_SQL, companies)
+        await conn.execute(SEED_TICKETS_SQL, tickets, companies)
+        await conn.execute('ANALYZE')
+        print(f'  seeded in {time.perf_counter() - started:.0f}s')
+
+        print(f"\n{'case':<42} {'rows':>6} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, sql, args in cases(companies, tickets):
+            rows, p50, p95 = await timed(conn, sql, args, runs)
+            print(f'{label:<42} {rows:>6} {p50 * 1000:>8.2f} {p95 * 1000:>8.2f}')
+    finally:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await close_db_connection(conn)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1_000_000)
+    parser.add_argument('--companies', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.tickets, args.companies, args.runs))
@@ -0,0 +1,65 @@
+"""Attachment upload benchmark against the local storage backend.
+
+Uploads N synthetic attachments concurrently, once by calling the backend
+inline on the event loop (what create_ticket used to do) and once through
+``file_storage.upload``. Reports throughput and the worst event-loop stall
+seen by a ticker task, which is what every other request on the worker
+waits for. Runs offline; files go to a temporary directory.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_uploads [--files 64] [--size-kb 2048]
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from starlette.datastructures import Headers, UploadFile
+import file_storage
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+def make_upload(payload: bytes, i: int) -> UploadFile:
+    return UploadFile(io.BytesIO(payload), size=len(payload), filename=f'file-{i}.bin',
+                      headers=Headers({'content-type': 'application/octet-stream'}))
+
+async def inline_upload(file: UploadFile, name: str) -> str:
+    return file_storage.backend.upload(file.file, name, file.content_type, file.size)
+
+async def run(label: str, upload, files: int, payload: bytes) -> dict:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(make_upload(payload, i), f'bench/{label}/{i}.bin') for i in range(files)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await ticker
+    return {
+        'mode': label,
+        'files': files,
+        'MB_per_sec': round(files * len(payload) / elapsed / 1e6, 1),
+        'max_loop_stall_ms': round(worst_lag * 1000, 1),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=64)
+    parser.add_argument('--size-kb', type=int, default=2048)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    with tempfile.TemporaryDirectory() as directory:
+        file_storage.backend = file_storage.LocalStorage(directory)
+        print(await run('inline', inline_upload, args.files, payload))
+        print(await run('offloaded', file_storage.upload, args.files, payload))
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+import asyncio
+import asyncpg
+import json
+import os
+import time
+import uuid
+import database
+import queries
+
+# In-process read-through cache for reference data that is read on almost
+# every page and changes rarely. Each cache is an LRU with a TTL; the write
+# handlers invalidate the keys they touch, the TTL bounds staleness from
+# writes made outside the API (scripts, psql).
+#
+# Invalidations are also published with Postgres NOTIFY on CACHE_BUS_CHANNEL.
+# Every worker keeps one dedicated connection LISTENing on it and evicts the
+# keys other workers invalidated. Notifications sent while that connection is
+# down are lost, so each (re)connect starts with a full flush.
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '60'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1000'))
+CACHE_BUS_ENABLED = os.getenv('CACHE_BUS_ENABLED', 'true').lower() == 'true'
+CACHE_BUS_CHANNEL = os.getenv('CACHE_BUS_CHANNEL', 'cache_invalidate')
+CACHE_BUS_RECONNECT_DELAY = float(os.getenv('CACHE_BUS_RECONNECT_DELAY', '2'))
+# How often the listener connection is pinged to notice silent drops
+CACHE_BUS_KEEPALIVE = float(os.getenv('CACHE_BUS_KEEPALIVE', '30'))
+# NOTIFY payloads are limited to 8000 bytes; larger key lists become a clear
+NOTIFY_MAX_PAYLOAD = 7900
+
+class TTLCache:
+    def __init__(self, name: str, max_size: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        # Bumped by every invalidation, so a load that started before it
+        # cannot store its (now stale) result afterwards
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        # Pass to set() after a load, as get_or_load does
+        return self._generation
+
+    def get(self, key):
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, generation: int = None):
+        if generation is not None and generation != self._generation:
+            return
+        self._items[key] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        self._generation += 1
+        for key in keys:
+            if self._items.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._generation += 1
+        self.invalidations += len(self._items)
+        self._items.clear()
+
+    async def get_or_load(self, key, loader):
+        """Cached value for key, else ``await loader()`` (cached unless None)."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self._generation
+        value = await loader()
+        if value is not None:
+            self.set(key, value, generation)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._items),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+services = TTLCache('services', ttl=float(os.getenv('CACHE_SERVICES_TTL_SECONDS', '300')))
+customers = TTLCache('customers')
+groups_by_company = TTLCache('groups_by_company')
+projects_by_company = TTLCache('projects_by_company')
+# Project access of one user (user_projects rows), by id_user
+user_projects = TTLCache('user_projects')
+
+CACHES = {c.name: c for c in (services, customers, groups_by_company, projects_by_company, user_projects)}
+
+# Identifies this worker's own notifications, which need no second eviction
+WORKER_ID = uuid.uuid4().hex[:12]
+
+_listener: asyncio.Task = None
+_bus = {'connected': False, 'published': 0, 'received': 0, 'connects': 0, 'errors': 0}
+
+def _evict(changes: dict):
+    for name, keys in changes.items():
+        if name not in CACHES:
+            continue
+        if keys is None:
+            CACHES[name].clear()
+        else:
+            CACHES[name].invalidate(*keys)
+
+def _flush_local():
+    for c in CACHES.values():
+        c.clear()
+
+async def invalidate_many(db, changes: dict):
+    """Evict ``{cache name: keys}`` here and on every other worker; None
+    instead of a key list clears that whole cache.
+
+    Call this after the transaction that changed the rows has committed:
+    the local eviction is immediate, so a request on this worker that reads
+    before the commit would cache the old rows again.
+    """
+    changes = {name: None if keys is None else list(dict.fromkeys(keys)) for name, keys in changes.items()}
+    _evict(changes)
+    if not CACHE_BUS_ENABLED:
+        return
+    payload = json.dumps({'origin': WORKER_ID, 'caches': changes})
+    if len(payload.encode('utf-8')) > NOTIFY_MAX_PAYLOAD:
+        payload = json.dumps({'origin': WORKER_ID, 'caches': dict.fromkeys(changes)})
+    await queries.execute(db, 'cache_notify', CACHE_BUS_CHANNEL, payload)
+    _bus['published'] += 1
+
+async def invalidate(db, name: str, *keys):
+    """Evict keys from one cache on every worker."""
+    if keys:
+        await invalidate_many(db, {name: keys})
+
+async def clear(db, name: str):
+    """Empty one cache on every worker."""
+    await invalidate_many(db, {name: None})
+
+async def invalidate_company(db, company_id: str):
+    """Everything cached for one company."""
+    await invalidate_many(db, {
+        'customers': [company_id],
+        'groups_by_company': [company_id],
+        'projects_by_company': [company_id],
+        # Cached per user, and the company's users are not known here
+        'user_projects': None,
+    })
+
+def _on_notify(conn, pid, channel, payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get('origin') == WORKER_ID:
+        return
+    _bus['received'] += 1
+    _evict(message.get('caches') or {})
+
+async def _listen():
+    conn = await asyncpg.connect(**database.db_config())
+    lost = asyncio.Event()
+    conn.add_termination_listener(lambda _: lost.set())
+    try:
+        await conn.add_listener(CACHE_BUS_CHANNEL, _on_notify)
+        # Whatever was invalidated while we were not listening is unknown
+        _flush_local()
+        _bus['connected'] = True
+        _bus['connects'] += 1
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), CACHE_BUS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await conn.fetchval('SELECT 1', timeout=CACHE_BUS_KEEPALIVE)
+    finally:
+        _bus['connected'] = False
+        conn.terminate()
+
+async def _listen_forever():
+    while True:
+        try:
+            await _listen()
+            print("Cache invalidation listener disconnected; reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _bus['errors'] += 1
+            print(f"Cache invalidation listener error: {e}")
+        await asyncio.sleep(CACHE_BUS_RECONNECT_DELAY)
+
+def start():
+    global _listener
+    if CACHE_BUS_ENABLED and _listener is None:
+        _listener = asyncio.create_task(_listen_forever())
+
+async def stop():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+
+def cache_stats() -> dict:
+    return {
+        **{name: c.stats() for name, c in CACHES.items()},
+        'bus': {'enabled': CACHE_BUS_ENABLED, 'channel': CACHE_BUS_CHANNEL, 'worker_id': WORKER_ID, **_bus},
+    }
@@ -1,15 +1,97 @@
+import asyncio
 import asyncpg
 import os
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import queries
 
-async def connect_to_db():
-    conn = await asyncpg.connect(
+# Shared connection pool, created once by the application lifespan
+pool = None
+
+# Number of coroutines currently waiting for a free connection
+_waiters = 0
+
+def db_config() -> dict:
+    return dict(
         user=os.getenv('DB_USER', 'magna'),
         password=os.getenv('DB_PASSWORD', 'M@gn@123'),
         database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'postgres'),
+        host=os.getenv('DB_HOST', 'localhost'),
         port=int(os.getenv('DB_PORT', '5432'))
     )
-    return conn
+
+def pool_config() -> dict:
+    return dict(
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        max_queries=int(os.getenv('DB_POOL_MAX_QUERIES', '50000')),
+        max_inactive_connection_lifetime=float(os.getenv('DB_POOL_MAX_INACTIVE_LIFETIME', '300')),
+        # Large enough to hold every statement in the query registry
+        statement_cache_size=int(os.getenv('DB_STATEMENT_CACHE_SIZE', '512')),
+    )
+
+ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+
+async def connect_to_db():
+    return await asyncpg.connect(**db_config())
 
 async def close_db_connection(conn):
-    await conn.close()
\ No newline at end of file
+    await conn.close()
+
+async def create_db_pool():
+    global pool
+    pool = await asyncpg.create_pool(**db_config(), **pool_config(), init=queries.prepare_hot_queries)
+    return pool
+
+async def close_db_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+async def _acquire_connection():
+    global _waiters
+    if pool is None:
+        raise RuntimeError('Database pool is not initialized')
+    _waiters += 1
+    try:
+        return await pool.acquire(timeout=ACQUIRE_TIMEOUT)
+    finally:
+        _waiters -= 1
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a connection from the shared pool (for code outside request handlers)."""
+    owner = pool
+    conn = await _acquire_connection()
+    try:
+        yield conn
+    finally:
+        await owner.release(conn)
+
+# FastAPI dependency shared by every router
+async def get_db():
+    owner = pool
+    try:
+        conn = await _acquire_connection()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail='Database is busy, please retry')
+    try:
+        yield conn
+    finally:
+        await owner.release(conn)
+
+def pool_stats() -> dict:
+    if pool is None:
+        return {'initialized': False}
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {
+        'initialized': True,
+        'size': size,
+        'in_use': size - idle,
+        'idle': idle,
+        'waiters': _waiters,
+        'min_size': pool.get_min_size(),
+        'max_size': pool.get_max_size(),
+    }
@@ -0,0 +1,30 @@
+from fastapi import Request, Response
+from typing import Optional
+import hashlib
+
+# Conditional GETs for polled resources. A route computes a validator from a
+# cheap query (a version counter, a timestamp) before touching the rows; when
+# the client's If-None-Match still matches, it answers 304 and skips the fetch
+# and serialization entirely.
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Weak comparison: W/"x" matches "x"
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Put the validator on the response; return a 304 to send instead when
+    the client's copy is current."""
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,258 @@
+import asyncio
+import asyncpg
+import json
+import os
+import database
+import fast_json
+import queries
+
+# Live ticket/comment change stream. The write handlers call publish() inside
+# their transaction: the event row is stored in ticket_events and NOTIFYed on
+# EVENTS_CHANNEL, both only if the transaction commits. Each worker keeps one
+# dedicated connection LISTENing and fans every event out to its subscribers
+# (the open /api/tickets/stream responses), so N dashboards cost one
+# connection instead of N pollers.
+#
+# Every subscriber has its own bounded queue. A client that does not keep up
+# overflows only its own queue and is disconnected; like any other reconnect
+# it resumes from its Last-Event-ID by replaying the stored rows. Events NOTIFYed
+# while the listener is down are lost, so a (re)connect disconnects every
+# subscriber to make them replay too.
+#
+# A NOTIFY payload is limited to 8000 bytes. An event too large for it is
+# notified by id only, and the worker loads the row; events are fanned out by
+# one dispatcher task, so they still reach subscribers in NOTIFY order.
+#
+# Event ids come from a sequence, and two transactions can commit in the
+# opposite order of their ids; a resume can therefore miss an event that
+# committed in the moment around the disconnect. Clients that need exact
+# state refetch the list on 'reset'.
+EVENTS_ENABLED = os.getenv('EVENTS_ENABLED', 'true').lower() == 'true'
+EVENTS_CHANNEL = os.getenv('EVENTS_CHANNEL', 'ticket_events')
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '256'))
+# A client further behind than this gets 'reset' instead of a replay
+EVENTS_REPLAY_LIMIT = int(os.getenv('EVENTS_REPLAY_LIMIT', '1000'))
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+EVENTS_RETENTION_HOURS = int(os.getenv('EVENTS_RETENTION_HOURS', '24'))
+EVENTS_PRUNE_INTERVAL = float(os.getenv('EVENTS_PRUNE_INTERVAL', '600'))
+EVENTS_RECONNECT_DELAY = float(os.getenv('EVENTS_RECONNECT_DELAY', '2'))
+EVENTS_KEEPALIVE = float(os.getenv('EVENTS_KEEPALIVE', '30'))
+# Browsers' EventSource cannot send an Authorization header; they open the
+# stream with a token of this scope from POST /api/tickets/stream/token
+STREAM_TOKEN_SCOPE = 'ticket_stream'
+STREAM_TOKEN_SECONDS = int(os.getenv('EVENTS_STREAM_TOKEN_SECONDS', '300'))
+# Largest event sent whole in the NOTIFY payload (the limit is 8000 bytes)
+EVENTS_NOTIFY_MAX_PAYLOAD = 7900
+
+# Sent when the client must refetch instead of relying on the stream
+RESET_FRAME = b'event: reset\ndata: {}\n\n'
+HEARTBEAT_FRAME = b': ping\n\n'
+
+class Subscriber:
+    def __init__(self, company_id: str = None):
+        # None receives every company's events
+        self.company_id = company_id
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+    def offer(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        # Drop whatever is queued; None ends the stream
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+_subscribers = set()
+# NOTIFY payloads waiting for the dispatcher
+_incoming: asyncio.Queue = None
+_stats = {'connected': False, 'published': 0, 'received': 0, 'loaded': 0, 'delivered': 0, 'overflows': 0,
+          'replayed': 0, 'resets': 0, 'connects': 0, 'errors': 0, 'pruned': 0}
+
+def frame(event_id: int, event: str, data: str) -> bytes:
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'.encode('utf-8')
+
+async def publish(db, company_id: str, event: str, ticket_id: str, data: dict = None):
+    """Record an event and notify every worker once the caller's transaction
+    commits. Call it inside the transaction that makes the change."""
+    if not EVENTS_ENABLED or company_id is None:
+        return
+    await queries.execute(db, 'ticket_event_publish', EVENTS_CHANNEL, company_id, event, ticket_id,
+                          fast_json.dumps(data or {}).decode('utf-8'), EVENTS_NOTIFY_MAX_PAYLOAD)
+    _stats['published'] += 1
+
+def _row_message(row) -> dict:
+    return {
+        'id': row['id'], 'company_id': row['company_id'], 'event': row['event'], 'ticket_id': row['ticket_id'],
+        'data': json.loads(row['data']), 'created_at': row['created_at'],
+    }
+
+def _on_notify(conn, pid, channel, payload):
+    _stats['received'] += 1
+    _incoming.put_nowait(payload)
+
+async def _dispatch_forever():
+    while True:
+        payload = await _incoming.get()
+        try:
+            message = json.loads(payload)
+            if 'event' not in message:
+                # Too large for the payload; notified by id only
+                async with database.acquire() as db:
+                    row = await queries.fetchrow(db, 'ticket_event_by_id', message['id'])
+                if row is None:
+                    continue
+                message = _row_message(row)
+                _stats['loaded'] += 1
+            _fan_out(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats['errors'] += 1
+            print(f"Ticket event dispatch error: {e}")
+
+def _fan_out(message: dict):
+    # Rendered once, shared by every subscriber; re-encoded so live and
+    # replayed events look the same
+    item = (message['id'], frame(message['id'], message['event'], fast_json.dumps(message).decode('utf-8')))
+    for subscriber in list(_subscribers):
+        if subscriber.company_id is not None and subscriber.company_id != message['company_id']:
+            continue
+        if subscriber.offer(item):
+            _stats['delivered'] += 1
+        else:
+            _stats['overflows'] += 1
+            _unsubscribe(subscriber)
+            subscriber.close()
+
+def _unsubscribe(subscriber: Subscriber):
+    _subscribers.discard(subscriber)
+
+def _disconnect_all():
+    for subscriber in list(_subscribers):
+        _unsubscribe(subscriber)
+        subscriber.close()
+
+async def _replay(company_id: str, last_id: int):
+    """Frames of the stored events after last_id; None when the client has
+    to reset (events pruned, or too far behind)."""
+    async with database.acquire() as db:
+        oldest = await queries.fetchval(db, 'ticket_events_oldest')
+        if oldest is None or oldest > last_id:
+            return None
+        if company_id is None:
+            rows = await queries.fetch(db, 'ticket_events_since', last_id, EVENTS_REPLAY_LIMIT + 1)
+        else:
+            rows = await queries.fetch(db, 'ticket_events_since_by_company', company_id, last_id, EVENTS_REPLAY_LIMIT + 1)
+    if len(rows) > EVENTS_REPLAY_LIMIT:
+        return None
+    return [(row['id'], frame(row['id'], row['event'], fast_json.dumps(_row_message(row)).decode('utf-8')))
+            for row in rows]
+
+async def stream(company_id: str = None, last_id: int = None):
+    """SSE body for one client: the events missed since last_id, then live
+    events until the client goes away or falls behind."""
+    subscriber = Subscriber(company_id)
+    # Subscribe before replaying, so nothing committed in between is missed
+    _subscribers.add(subscriber)
+    try:
+        replayed = set()
+        if last_id is not None:
+            frames = await _replay(company_id, last_id)
+            if frames is None:
+                _stats['resets'] += 1
+                yield RESET_FRAME
+            else:
+                for event_id, body in frames:
+                    replayed.add(event_id)
+                    yield body
+                _stats['replayed'] += len(frames)
+        else:
+            # Opens the stream for proxies and EventSource right away
+            yield HEARTBEAT_FRAME
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+                continue
+            if item is None:
+                return
+            event_id, body = item
+            if event_id in replayed:
+                continue
+            yield body
+    finally:
+        _unsubscribe(subscriber)
+
+async def _listen():
+    conn = await asyncpg.connect(**database.db_config())
+    lost = asyncio.Event()
+    conn.add_termination_listener(lambda _: lost.set())
+    try:
+        await conn.add_listener(EVENTS_CHANNEL, _on_notify)
+        # Subscribers may have missed events while nobody was listening; they
+        # reconnect and replay from their last id
+        _disconnect_all()
+        _stats['connected'] = True
+        _stats['connects'] += 1
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await conn.fetchval('SELECT 1', timeout=EVENTS_KEEPALIVE)
+    finally:
+        _stats['connected'] = False
+        conn.terminate()
+
+async def _listen_forever():
+    while True:
+        try:
+            await _listen()
+            print("Ticket event listener disconnected; reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats['errors'] += 1
+            print(f"Ticket event listener error: {e}")
+        await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+async def _prune_forever():
+    while True:
+        try:
+            async with database.acquire() as db:
+                result = await queries.execute(db, 'ticket_events_prune', EVENTS_RETENTION_HOURS)
+            _stats['pruned'] += int(result.split()[-1])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ticket event prune error: {e}")
+        await asyncio.sleep(EVENTS_PRUNE_INTERVAL)
+
+_tasks = []
+
+def start():
+    global _incoming
+    if EVENTS_ENABLED and not _tasks:
+        _incoming = asyncio.Queue()
+        _tasks.extend([asyncio.create_task(_listen_forever()), asyncio.create_task(_dispatch_forever()),
+                       asyncio.create_task(_prune_forever())])
+
+async def stop():
+    _disconnect_all()
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _tasks.clear()
+
+def events_stats() -> dict:
+    return {'enabled': EVENTS_ENABLED, 'channel': EVENTS_CHANNEL, 'subscribers': len(_subscribers),
+            'dispatch_backlog': _incoming.qsize() if _incoming is not None else 0, **_stats}
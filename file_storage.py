@@ -0,0 +1,115 @@
+from abc import ABC, abstractmethod
+from fastapi import HTTPException, UploadFile
+from google.cloud import storage
+import asyncio
+import os
+import shutil
+import threading
+
+# Attachment storage. STORAGE_BACKEND=gcs (default) uploads to GCS_BUCKET_NAME;
+# it honours STORAGE_EMULATOR_HOST, so a fake-gcs-server works unchanged.
+# STORAGE_BACKEND=local writes to LOCAL_STORAGE_DIR, for development and for
+# benchmarking uploads offline.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'gcs')
+GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', 'magnasight-attachment')
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'uploads')
+LOCAL_STORAGE_URL = os.getenv('LOCAL_STORAGE_URL')
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+# GCS requires resumable chunks to be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 256 * 1024)))
+
+class StorageBackend(ABC):
+    """Blocking storage client; always called from a worker thread."""
+
+    @abstractmethod
+    def upload(self, fileobj, name: str, content_type: str = None, size: int = None) -> str:
+        """Store the file under ``name`` and return its public URL."""
+
+    def close(self):
+        pass
+
+class GCSStorage(StorageBackend):
+    def __init__(self, bucket_name: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self._client = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def _get_bucket(self):
+        # One client per process, created on first upload so the app starts
+        # without credentials in environments that never upload
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    self._client = storage.Client()
+                    self._bucket = self._client.bucket(self.bucket_name)
+        return self._bucket
+
+    def upload(self, fileobj, name: str, content_type: str = None, size: int = None) -> str:
+        # A chunk size makes the client use a resumable upload, sent and
+        # retried chunk by chunk instead of as one request body
+        blob = self._get_bucket().blob(name, chunk_size=self.chunk_size)
+        blob.upload_from_file(fileobj, content_type=content_type, size=size, rewind=True)
+        # Return public URL (karena bucket sudah public)
+        return f"https://storage.googleapis.com/{self.bucket_name}/{name}"
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._bucket = None
+
+class LocalStorage(StorageBackend):
+    def __init__(self, directory: str, base_url: str = None, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.directory = os.path.abspath(directory)
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.chunk_size = chunk_size
+
+    def upload(self, fileobj, name: str, content_type: str = None, size: int = None) -> str:
+        path = os.path.join(self.directory, name)
+        if not os.path.abspath(path).startswith(self.directory + os.sep):
+            raise ValueError(f'Invalid object name: {name}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fileobj.seek(0)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(fileobj, out, self.chunk_size)
+        if self.base_url:
+            return f"{self.base_url}/{name}"
+        return f"file://{path}"
+
+def create_backend() -> StorageBackend:
+    if STORAGE_BACKEND == 'gcs':
+        return GCSStorage(GCS_BUCKET_NAME)
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL)
+    raise RuntimeError(f'Unknown STORAGE_BACKEND: {STORAGE_BACKEND}')
+
+backend: StorageBackend = create_backend()
+
+_upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+def upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+async def upload(file: UploadFile, name: str) -> str:
+    """Upload an attachment off the event loop and return its URL.
+
+    Raises 413 above MAX_UPLOAD_BYTES. At most UPLOAD_CONCURRENCY uploads run
+    at once per worker; the rest wait here without holding a thread.
+    """
+    size = upload_size(file)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f'Attachment exceeds {MAX_UPLOAD_BYTES} bytes')
+    async with _upload_slots:
+        return await asyncio.to_thread(backend.upload, file.file, name, file.content_type, size)
+
+def close():
+    backend.close()
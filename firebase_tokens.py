@@ -0,0 +1,173 @@
+from cryptography import x509
+import aiohttp
+import asyncio
+import json
+import os
+import re
+import time
+import jwt
+
+# Firebase ID-token verification without blocking the event loop. Google's
+# signing certificates are fetched with aiohttp and kept for as long as their
+# Cache-Control max-age allows; a background task refreshes them before they
+# expire, so a sign-in normally never waits on the network. The signature
+# check itself runs in a worker thread.
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+CLOCK_SKEW_SECONDS = int(os.getenv('FIREBASE_CLOCK_SKEW_SECONDS', '10'))
+# Refresh this long before the certificates expire
+CERT_REFRESH_MARGIN = float(os.getenv('FIREBASE_CERT_REFRESH_MARGIN', '300'))
+# A token signed with an unknown kid triggers at most one refetch per interval
+CERT_MIN_REFETCH_INTERVAL = float(os.getenv('FIREBASE_CERT_MIN_REFETCH_INTERVAL', '60'))
+
+class InvalidIdToken(Exception):
+    pass
+
+class ExpiredIdToken(InvalidIdToken):
+    pass
+
+_config = None
+
+def firebase_config() -> dict:
+    """Service account settings, read from the environment on first use."""
+    global _config
+    if _config is not None:
+        return _config
+    _config = {}
+    # Priority 1: Firebase config from the JSON secret
+    firebase_sa_json = os.getenv("FIREBASE_SA_JSON")
+    if firebase_sa_json:
+        try:
+            _config = json.loads(firebase_sa_json)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing FIREBASE_SA_JSON: {e}")
+    # Priority 2: individual environment variables
+    if not _config.get('project_id'):
+        _config = {'project_id': os.getenv('FIREBASE_PROJECT_ID') or os.getenv('GOOGLE_CLOUD_PROJECT')}
+    return _config
+
+def project_id():
+    return firebase_config().get('project_id')
+
+def _max_age(cache_control: str) -> float:
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return float(match.group(1)) if match else 3600.0
+
+class PublicKeyCache:
+    """Google's ID-token signing keys by kid, valid until their max-age."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.keys = {}
+        self.expires_at = 0.0
+        self.fetched_at = 0.0
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            # Someone else refreshed while we waited for the lock
+            if self.fresh() and not force:
+                return
+            if force and time.time() - self.fetched_at < CERT_MIN_REFETCH_INTERVAL:
+                return
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(self.url) as resp:
+                    resp.raise_for_status()
+                    certs = await resp.json(content_type=None)
+                    max_age = _max_age(resp.headers.get('Cache-Control'))
+            self.keys = {
+                kid: x509.load_pem_x509_certificate(pem.encode('utf-8')).public_key()
+                for kid, pem in certs.items()
+            }
+            self.fetched_at = time.time()
+            self.expires_at = self.fetched_at + max_age
+            self.refreshes += 1
+
+    async def get(self, kid: str):
+        if not self.fresh():
+            await self.refresh()
+        elif kid not in self.keys:
+            # Keys may have rotated early; refetch, but not once per bad token
+            await self.refresh(force=True)
+        return self.keys.get(kid)
+
+    def stats(self) -> dict:
+        return {
+            'keys': len(self.keys),
+            'expires_in': max(0, round(self.expires_at - time.time())),
+            'refreshes': self.refreshes,
+        }
+
+_keys = PublicKeyCache(GOOGLE_CERTS_URL)
+_refresher: asyncio.Task = None
+
+def _decode(token: str, key, audience: str) -> dict:
+    try:
+        claims = jwt.decode(
+            token, key, algorithms=['RS256'], audience=audience, issuer=ISSUER_PREFIX + audience,
+            leeway=CLOCK_SKEW_SECONDS, options={'require': ['exp', 'iat', 'sub']},
+        )
+    except jwt.ExpiredSignatureError:
+        raise ExpiredIdToken('Firebase ID token has expired')
+    except jwt.InvalidTokenError as e:
+        raise InvalidIdToken(str(e))
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise InvalidIdToken('Firebase ID token has an invalid "sub" claim')
+    if claims.get('auth_time', 0) > time.time() + CLOCK_SKEW_SECONDS:
+        raise InvalidIdToken('Firebase ID token has a future "auth_time" claim')
+    claims['uid'] = subject
+    return claims
+
+async def verify_id_token(token: str) -> dict:
+    """Verify a Firebase ID token and return its claims (with ``uid``)."""
+    audience = project_id()
+    if not audience:
+        raise RuntimeError('Firebase project is not configured. Please check FIREBASE_SA_JSON secret configuration.')
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError as e:
+        raise InvalidIdToken(str(e))
+    if header.get('alg') != 'RS256' or not header.get('kid'):
+        raise InvalidIdToken('Firebase ID token must be RS256 with a "kid" header')
+    key = await _keys.get(header['kid'])
+    if key is None:
+        raise InvalidIdToken('Firebase ID token is signed with an unknown key')
+    return await asyncio.to_thread(_decode, token, key, audience)
+
+async def _refresh_forever():
+    force = False
+    while True:
+        try:
+            await _keys.refresh(force=force)
+            delay = max(_keys.expires_at - time.time() - CERT_REFRESH_MARGIN, CERT_MIN_REFETCH_INTERVAL)
+        except Exception as e:
+            print(f"Failed to refresh Firebase signing keys: {e}")
+            delay = CERT_MIN_REFETCH_INTERVAL
+        await asyncio.sleep(delay)
+        # The keys are still fresh at this point; fetch anyway, ahead of expiry
+        force = True
+
+def start():
+    """Keep the signing keys warm in the background (if Firebase is configured)."""
+    global _refresher
+    if project_id() and _refresher is None:
+        _refresher = asyncio.create_task(_refresh_forever())
+
+async def stop():
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        try:
+            await _refresher
+        except asyncio.CancelledError:
+            pass
+        _refresher = None
+
+def key_stats() -> dict:
+    return {'project_configured': bool(project_id()), 'background_refresh': _refresher is not None, **_keys.stats()}
@@ -0,0 +1,308 @@
+from collections import OrderedDict
+from email.message import EmailMessage
+from html import escape
+import aiohttp
+import aiosmtplib
+import asyncio
+import os
+import database
+import queries
+
+# Outgoing mail. Request handlers call enqueue(), which only writes the message
+# to the mail_outbox table and wakes the worker. The worker runs in the app
+# lifespan: it claims due messages in batches and sends them over a small pool
+# of authenticated SMTP connections that stay open between messages. Failed
+# sends are retried with exponential backoff until MAIL_MAX_ATTEMPTS.
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USER = os.getenv('SMTP_USER')
+SMTP_PASS = os.getenv('SMTP_PASS')
+SMTP_START_TLS = os.getenv('SMTP_START_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '2'))
+
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@email.com")
+MAIL_FROM = os.getenv('MAIL_FROM', SMTP_USER or ADMIN_EMAIL)
+
+MAIL_WORKER_ENABLED = os.getenv('MAIL_WORKER_ENABLED', 'true').lower() == 'true'
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', '20'))
+# How long the worker waits for more messages before sending a batch
+MAIL_BATCH_LINGER = float(os.getenv('MAIL_BATCH_LINGER', '0.05'))
+# Fallback poll for retries and for mail enqueued by other workers
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', '10'))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', '5'))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', '30'))
+MAIL_RETRY_MAX = float(os.getenv('MAIL_RETRY_MAX', '3600'))
+MAIL_LEASE_SECONDS = float(os.getenv('MAIL_LEASE_SECONDS', '300'))
+# Attachments above this size are sent as a link instead of as bytes
+MAIL_ATTACHMENT_MAX_BYTES = int(os.getenv('MAIL_ATTACHMENT_MAX_BYTES', str(5 * 1024 * 1024)))
+MAIL_ATTACHMENT_CACHE_BYTES = int(os.getenv('MAIL_ATTACHMENT_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+_queue: asyncio.Queue = None
+_worker: asyncio.Task = None
+_pool = None
+_session: aiohttp.ClientSession = None
+_stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+
+async def enqueue(db, to_email: str, subject: str, text: str = None, html: str = None,
+                  attachment_url: str = None, from_email: str = None) -> int:
+    """Queue one message and return its outbox id.
+
+    Runs on the caller's connection. Inside a transaction the message is only
+    sent if the transaction commits, but the worker cannot see it when woken
+    and it goes out with the next poll instead.
+    """
+    mail_id = await queries.fetchval(
+        db, 'mail_enqueue', from_email or MAIL_FROM, to_email, subject, text, html, attachment_url
+    )
+    _stats['enqueued'] += 1
+    if _queue is not None:
+        _queue.put_nowait(mail_id)
+    return mail_id
+
+def retry_delay(attempts: int) -> float:
+    return min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+
+class AttachmentCache:
+    """LRU of attachment bytes keyed by URL, bounded by their total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str):
+        data = self._items.get(url)
+        if data is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(url)
+        self.hits += 1
+        return data
+
+    def put(self, url: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self._items.pop(url, None)
+        if old is not None:
+            self._size -= len(old)
+        self._items[url] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
+
+    def stats(self) -> dict:
+        return {'entries': len(self._items), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+_attachments = AttachmentCache(MAIL_ATTACHMENT_CACHE_BYTES)
+_downloads = {}
+
+def remember_attachment(url: str, data: bytes):
+    """Keep the bytes of a just-uploaded attachment for the emails about it,
+    so they are not downloaded back from storage."""
+    if len(data) <= MAIL_ATTACHMENT_MAX_BYTES:
+        _attachments.put(url, data)
+
+async def _download(url: str):
+    session = _session or aiohttp.ClientSession()
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                return None
+            if resp.content_length and resp.content_length > MAIL_ATTACHMENT_MAX_BYTES:
+                return None
+            data = await resp.content.read(MAIL_ATTACHMENT_MAX_BYTES + 1)
+            if len(data) > MAIL_ATTACHMENT_MAX_BYTES:
+                return None
+    except Exception:
+        return None
+    finally:
+        if session is not _session:
+            await session.close()
+    _attachments.put(url, data)
+    return data
+
+async def load_attachment(url: str):
+    """Attachment bytes from the cache, downloaded once on a miss. None when
+    the file is too large to attach or cannot be fetched."""
+    data = _attachments.get(url)
+    if data is not None:
+        return data
+    # Emails in the same batch share one download
+    task = _downloads.get(url)
+    if task is None:
+        task = asyncio.ensure_future(_download(url))
+        _downloads[url] = task
+        task.add_done_callback(lambda _: _downloads.pop(url, None))
+    return await task
+
+def attachment_type(filename: str):
+    if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        return 'image', filename.split('.')[-1].lower()
+    return 'application', 'octet-stream'
+
+async def build_message(row) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = row['from_email']
+    message["To"] = row['to_email']
+    message["Subject"] = row['subject']
+    text, html = row['text_body'] or '', row['html_body']
+    url = row['attachment_url']
+    data = await load_attachment(url) if url else None
+    filename = url.split("/")[-1].split("?")[0] if url else None
+    if url and data is None:
+        # Too large (or unavailable) to attach: link to it instead
+        text += f"\n\nAttachment: {url}\n"
+        if html:
+            html += f'<p>Attachment: <a href="{escape(url)}">{escape(filename)}</a></p>'
+    message.set_content(text)
+    if html:
+        message.add_alternative(html, subtype="html")
+    if data is not None:
+        maintype, subtype = attachment_type(filename)
+        message.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+    return message
+
+class SMTPPool:
+    """Fixed set of SMTP connections, each opened and authenticated on first
+    use and kept open for later messages."""
+
+    def __init__(self, size: int):
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(self._new_client())
+
+    @staticmethod
+    def _new_client() -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=SMTP_HOST, port=SMTP_PORT, username=SMTP_USER, password=SMTP_PASS,
+            start_tls=SMTP_START_TLS, timeout=SMTP_TIMEOUT,
+        )
+
+    async def send(self, message: EmailMessage):
+        client = await self._idle.get()
+        try:
+            try:
+                if not client.is_connected:
+                    await client.connect()
+                await client.send_message(message)
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                # The server dropped the idle connection; reconnect once
+                client.close()
+                await client.connect()
+                await client.send_message(message)
+        except Exception:
+            client.close()
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def close(self):
+        while not self._idle.empty():
+            client = self._idle.get_nowait()
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except Exception:
+                    client.close()
+
+async def _send(row):
+    try:
+        await _pool.send(await build_message(row))
+        return None
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+
+async def send_batch(mail_ids: list) -> int:
+    """Claim up to MAIL_BATCH_SIZE due messages (mail_ids first), send them and
+    record the outcome. Returns the number of messages claimed."""
+    async with database.acquire() as conn:
+        rows = await queries.fetch(conn, 'mail_claim', mail_ids, MAIL_BATCH_SIZE, MAIL_LEASE_SECONDS)
+    if not rows:
+        return 0
+    errors = await asyncio.gather(*(_send(row) for row in rows))
+    sent = [row['id'] for row, error in zip(rows, errors) if error is None]
+    async with database.acquire() as conn:
+        if sent:
+            await queries.execute(conn, 'mail_mark_sent', sent)
+        for row, error in zip(rows, errors):
+            if error is None:
+                continue
+            await queries.execute(conn, 'mail_mark_failed', row['id'], error, MAIL_MAX_ATTEMPTS,
+                                  retry_delay(row['attempts']))
+            if row['attempts'] >= MAIL_MAX_ATTEMPTS:
+                _stats['failed'] += 1
+                print(f"Giving up on mail {row['id']} to {row['to_email']}: {error}")
+            else:
+                _stats['retried'] += 1
+    _stats['sent'] += len(sent)
+    _stats['batches'] += 1
+    return len(rows)
+
+async def _next_ids() -> list:
+    # Block until something is enqueued (or the poll interval passes), then
+    # linger briefly so bursts go out as one batch
+    try:
+        mail_ids = [await asyncio.wait_for(_queue.get(), MAIL_POLL_INTERVAL)]
+    except asyncio.TimeoutError:
+        return []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAIL_BATCH_LINGER
+    while len(mail_ids) < MAIL_BATCH_SIZE:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            mail_ids.append(await asyncio.wait_for(_queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return mail_ids
+
+async def _run():
+    while True:
+        mail_ids = await _next_ids()
+        try:
+            # Keep going while full batches come back (backlog after a restart)
+            while await send_batch(mail_ids) >= MAIL_BATCH_SIZE:
+                mail_ids = []
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Mail worker error: {e}")
+            await asyncio.sleep(1)
+
+async def start():
+    global _queue, _worker, _pool, _session
+    _queue = asyncio.Queue()
+    if not MAIL_WORKER_ENABLED:
+        return
+    _pool = SMTPPool(SMTP_POOL_SIZE)
+    _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+    _worker = asyncio.create_task(_run())
+
+async def stop():
+    global _queue, _worker, _pool, _session
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    if _pool is not None:
+        await _pool.close()
+    if _session is not None:
+        await _session.close()
+    # Anything still queued stays pending in the outbox for the next start
+    _queue = _worker = _pool = _session = None
+
+def mail_stats() -> dict:
+    return {
+        'worker_running': _worker is not None and not _worker.done(),
+        'queued': _queue.qsize() if _queue is not None else 0,
+        'smtp_pool_size': SMTP_POOL_SIZE,
+        **_stats,
+        'attachment_cache': _attachments.stats(),
+    }
@@ -1,10 +1,41 @@
+from contextlib import asynccontextmanager
 from typing import Union
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import users, customers, tickets, groups, projects, services
-from database import connect_to_db, close_db_connection
+import database
+import file_storage
+import mailer
+import passwords
+import security
+import firebase_tokens
+import queries
+import cache
+import events
+import purge
 
-app = FastAPI(title="Magnasight API", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db_pool = await database.create_db_pool()
+    cache.start()
+    events.start()
+    purge.start()
+    await mailer.start()
+    await passwords.calibrate()
+    firebase_tokens.start()
+    try:
+        yield
+    finally:
+        await firebase_tokens.stop()
+        await mailer.stop()
+        await purge.stop()
+        await events.stop()
+        await cache.stop()
+        await database.close_db_pool()
+        file_storage.close()
+        passwords.shutdown()
+
+app = FastAPI(title="Magnasight API", version="0.2.0", lifespan=lifespan)
 
 origins = ["*"]
 
@@ -14,16 +45,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-@app.on_event("startup")
-async def startup():
-    app.state.db = await connect_to_db()
-
-@app.on_event("shutdown")
-async def shutdown():
-    await close_db_connection(app.state.db)
-
 app.include_router(customers.router, prefix="/api/customers", tags=["Customers"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(groups.router, prefix="/api/groups", tags=["Groups"])
@@ -32,6 +56,34 @@ app.include_router(tickets.router, prefix="/api/tickets", tags=["Tickets"])
 app.include_router(services.router, prefix="/api/services", tags=["Services"])
 
 
+@app.get("/api/health/db-pool", tags=["Health"])
+def db_pool_stats():
+    return database.pool_stats()
+
+@app.get("/api/health/queries", tags=["Health"])
+def query_stats():
+    return queries.statement_stats()
+
+@app.get("/api/health/mail", tags=["Health"])
+def mail_stats():
+    return mailer.mail_stats()
+
+@app.get("/api/health/auth", tags=["Health"])
+def auth_stats():
+    return {**security.auth_stats(), 'firebase': firebase_tokens.key_stats()}
+
+@app.get("/api/health/cache", tags=["Health"])
+def cache_stats():
+    return cache.cache_stats()
+
+@app.get("/api/health/events", tags=["Health"])
+def events_stats():
+    return events.events_stats()
+
+@app.get("/api/health/purge", tags=["Health"])
+def purge_stats():
+    return purge.purge_stats()
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
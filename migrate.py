@@ -0,0 +1,84 @@
+"""Apply versioned schema migrations from ``migrations/``.
+
+Files are named ``NNNN_description.sql`` and applied in version order, each in
+its own transaction. Applied versions are recorded in ``schema_migrations``.
+
+Usage::
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending versions
+"""
+import asyncio
+import os
+import re
+import sys
+from database import connect_to_db, close_db_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Arbitrary constant shared by every process running migrations
+MIGRATION_LOCK_ID = 7262461
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = re.match(r'^(\d+)_(.+)\.sql$', filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError('Duplicate migration version in migrations/')
+    return migrations
+
+async def applied_versions(conn) -> set:
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    rows = await conn.fetch('SELECT version FROM schema_migrations')
+    return {row['version'] for row in rows}
+
+async def apply_migrations(conn, directory: str = MIGRATIONS_DIR) -> list:
+    """Apply pending migrations and return the versions that were applied."""
+    applied = []
+    # Serialize concurrent deploys/workers starting at the same time
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        done = await applied_versions(conn)
+        for version, name, sql in load_migrations(directory):
+            if version in done:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    'INSERT INTO schema_migrations (version, name) VALUES ($1, $2)', version, name
+                )
+            print(f'Applied migration {version:04d}_{name}')
+            applied.append(version)
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+    return applied
+
+async def main(argv: list) -> int:
+    conn = await connect_to_db()
+    try:
+        if '--status' in argv:
+            done = await applied_versions(conn)
+            for version, name, _ in load_migrations():
+                state = 'applied' if version in done else 'pending'
+                print(f'{version:04d}_{name}: {state}')
+            return 0
+        applied = await apply_migrations(conn)
+        if not applied:
+            print('Schema is up to date')
+        return 0
+    finally:
+        await close_db_connection(conn)
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,84 @@
+-- Baseline schema as deployed before versioned migrations existed.
+-- Every statement is idempotent so it is a no-op on existing databases.
+
+CREATE TABLE IF NOT EXISTS customers (
+    company_id VARCHAR(20) PRIMARY KEY,
+    company_name VARCHAR(100) NOT NULL,
+    billing_account_id VARCHAR(50),
+    maintenance VARCHAR(50),
+    limit_ticket INTEGER NOT NULL DEFAULT 0,
+    ticket_usage INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id_user VARCHAR(20) PRIMARY KEY,
+    role VARCHAR(20) NOT NULL DEFAULT 'Customer',
+    full_name VARCHAR(50) NOT NULL,
+    username VARCHAR(20) NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    company_id VARCHAR(20),
+    company_name VARCHAR(100),
+    billing_account_id VARCHAR(50),
+    email VARCHAR(50) NOT NULL,
+    phone VARCHAR(15),
+    is_verified BOOLEAN NOT NULL DEFAULT FALSE,
+    verification_code VARCHAR(6),
+    verification_expires TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    group_id VARCHAR(20) PRIMARY KEY,
+    group_name VARCHAR(100) NOT NULL,
+    company_id VARCHAR(20)
+);
+
+CREATE TABLE IF NOT EXISTS user_groups (
+    id_user VARCHAR(20) NOT NULL,
+    group_id VARCHAR(20) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS projects (
+    project_id VARCHAR(100) PRIMARY KEY,
+    company_id VARCHAR(20),
+    billing_account_id VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS group_projects (
+    group_id VARCHAR(20) NOT NULL,
+    project_id VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_projects (
+    id_user VARCHAR(20) NOT NULL,
+    project_id VARCHAR(100) NOT NULL,
+    billing_id VARCHAR(50),
+    on_group VARCHAR(20)
+);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id VARCHAR(50) PRIMARY KEY,
+    product_list VARCHAR(100),
+    describe_issue VARCHAR(255),
+    detail_issue TEXT,
+    priority VARCHAR(20),
+    contact VARCHAR(100),
+    company_id VARCHAR(20),
+    company_name VARCHAR(100),
+    attachment TEXT,
+    id_user VARCHAR(20),
+    status VARCHAR(20) NOT NULL DEFAULT 'Open',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ticket_comments (
+    id SERIAL PRIMARY KEY,
+    ticket_id VARCHAR(50) NOT NULL,
+    id_user VARCHAR(20) NOT NULL,
+    comment TEXT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS services (
+    id SERIAL PRIMARY KEY,
+    service_name VARCHAR(100) NOT NULL
+);
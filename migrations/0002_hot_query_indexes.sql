@@ -0,0 +1,42 @@
+-- Indexes for the filters used by the hot query paths.
+
+-- Link tables had no uniqueness guarantee; drop exact duplicate rows before
+-- adding the unique indexes.
+DELETE FROM user_projects a USING user_projects b
+WHERE a.ctid < b.ctid AND a.id_user = b.id_user AND a.project_id = b.project_id;
+
+DELETE FROM user_groups a USING user_groups b
+WHERE a.ctid < b.ctid AND a.group_id = b.group_id AND a.id_user = b.id_user;
+
+DELETE FROM group_projects a USING group_projects b
+WHERE a.ctid < b.ctid AND a.group_id = b.group_id AND a.project_id = b.project_id;
+
+-- tickets: company scoped lists (also serves keyset pagination by ticket_id)
+CREATE INDEX IF NOT EXISTS idx_tickets_company_ticket ON tickets (company_id, ticket_id);
+
+-- ticket_comments: comments per ticket, comment cleanup per user
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket ON ticket_comments (ticket_id);
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_user ON ticket_comments (id_user);
+
+-- user_projects: access checks by (user, project), reverse lookup by project
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_projects_user_project ON user_projects (id_user, project_id);
+CREATE INDEX IF NOT EXISTS idx_user_projects_project ON user_projects (project_id);
+
+-- user_groups: members of a group, groups of a user
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_groups_group_user ON user_groups (group_id, id_user);
+CREATE INDEX IF NOT EXISTS idx_user_groups_user ON user_groups (id_user);
+
+-- group_projects: projects of a group, groups of a project
+CREATE UNIQUE INDEX IF NOT EXISTS uq_group_projects_group_project ON group_projects (group_id, project_id);
+CREATE INDEX IF NOT EXISTS idx_group_projects_project ON group_projects (project_id);
+
+-- users: login and uniqueness checks, company listings
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_username ON users (username);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email ON users (email);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_phone ON users (phone);
+CREATE INDEX IF NOT EXISTS idx_users_company ON users (company_id);
+
+-- company scoped lookups on the remaining tables
+CREATE INDEX IF NOT EXISTS idx_groups_company ON groups (company_id);
+CREATE INDEX IF NOT EXISTS idx_projects_company ON projects (company_id);
+CREATE INDEX IF NOT EXISTS idx_customers_billing_account ON customers (billing_account_id);
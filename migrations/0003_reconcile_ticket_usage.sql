@@ -0,0 +1,11 @@
+-- ticket_usage becomes the authoritative quota counter (live tickets per
+-- company). Align it with the real counts once.
+UPDATE customers c
+SET ticket_usage = counts.actual
+FROM (
+    SELECT c2.company_id, COUNT(t.ticket_id)::int AS actual
+    FROM customers c2
+    LEFT JOIN tickets t ON t.company_id = c2.company_id
+    GROUP BY c2.company_id
+) counts
+WHERE c.company_id = counts.company_id AND c.ticket_usage IS DISTINCT FROM counts.actual;
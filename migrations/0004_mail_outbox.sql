@@ -0,0 +1,21 @@
+-- Outgoing mail. Request handlers insert here; the mail worker (mailer.py)
+-- claims due rows, sends them and records the outcome, so queued mail
+-- survives restarts and failed sends are retried with backoff.
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    from_email TEXT NOT NULL,
+    to_email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    text_body TEXT,
+    html_body TEXT,
+    attachment_url TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | sent | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_until TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (next_attempt_at) WHERE status = 'pending';
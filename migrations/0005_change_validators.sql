@@ -0,0 +1,57 @@
+-- Change tracking for conditional GETs (ETag / If-None-Match) on tickets and
+-- comments.
+
+-- Last write to a ticket; set by the insert default and by ticket_update
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+UPDATE tickets SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL;
+ALTER TABLE tickets
+    ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP,
+    ALTER COLUMN updated_at SET NOT NULL;
+
+ALTER TABLE ticket_comments ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+UPDATE ticket_comments SET updated_at = COALESCE(timestamp, CURRENT_TIMESTAMP) WHERE updated_at IS NULL;
+ALTER TABLE ticket_comments
+    ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP,
+    ALTER COLUMN updated_at SET NOT NULL;
+
+-- Per-company ticket list version. max(updated_at) is not enough to validate
+-- a list: a transaction that started earlier can commit a smaller timestamp
+-- after a client has already seen a larger one. The counter is bumped under
+-- the customer's row lock, so every committed change moves it forward.
+-- Statement-level triggers, so bulk deletes bump each company once.
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS ticket_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_ticket_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE customers SET ticket_version = ticket_version + 1
+        WHERE company_id IN (SELECT company_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE customers SET ticket_version = ticket_version + 1
+        WHERE company_id IN (SELECT company_id FROM old_rows);
+    ELSE
+        UPDATE customers SET ticket_version = ticket_version + 1
+        WHERE company_id IN (SELECT company_id FROM old_rows UNION SELECT company_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_version_insert ON tickets;
+CREATE TRIGGER tickets_version_insert AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_ticket_version();
+
+DROP TRIGGER IF EXISTS tickets_version_update ON tickets;
+CREATE TRIGGER tickets_version_update AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_ticket_version();
+
+DROP TRIGGER IF EXISTS tickets_version_delete ON tickets;
+CREATE TRIGGER tickets_version_delete AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_ticket_version();
+
+-- Comment validator: count and newest id per ticket from the index alone
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket_id ON ticket_comments (ticket_id, id);
+DROP INDEX IF EXISTS idx_ticket_comments_ticket;
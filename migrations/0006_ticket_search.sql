@@ -0,0 +1,25 @@
+-- Server-side filtering, sorting and full-text search for ticket lists.
+
+-- Keyset pagination by created_at needs a value on every row
+UPDATE tickets SET created_at = updated_at WHERE created_at IS NULL;
+ALTER TABLE tickets ALTER COLUMN created_at SET NOT NULL;
+
+-- Search document: the subject weighs more than the description. A stored
+-- generated column, so Postgres keeps it current on every insert and update.
+-- 'simple' does no stemming or stop words: tickets mix Indonesian and English.
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(describe_issue, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(detail_issue, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_tickets_search ON tickets USING GIN (search_vector);
+
+-- Sorted lists (newest first) per company and overall, with ticket_id as the
+-- keyset tie-breaker
+CREATE INDEX IF NOT EXISTS idx_tickets_company_created ON tickets (company_id, created_at, ticket_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets (created_at, ticket_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_company_updated ON tickets (company_id, updated_at, ticket_id);
+
+-- The common list filters
+CREATE INDEX IF NOT EXISTS idx_tickets_company_status ON tickets (company_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_user_created ON tickets (id_user, created_at);
@@ -0,0 +1,116 @@
+-- Ticket counts for the dashboards, kept current by triggers so reading them
+-- costs the same however many tickets there are.
+
+-- Counts per company by status, priority and product
+CREATE TABLE IF NOT EXISTS ticket_stats (
+    company_id VARCHAR(20) NOT NULL,
+    dimension VARCHAR(10) NOT NULL,
+    value VARCHAR(100) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (company_id, dimension, value)
+);
+
+-- Tickets created per company per day (UTC)
+CREATE TABLE IF NOT EXISTS ticket_daily_stats (
+    company_id VARCHAR(20) NOT NULL,
+    day DATE NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (company_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_ticket_daily_stats_day ON ticket_daily_stats (day);
+
+-- One upsert per changed bucket per statement: old rows count -1, new rows
+-- +1, and buckets that net to zero (an edit that kept status, priority and
+-- product) are not written at all. The customer rows are locked first, in a
+-- fixed order. The version trigger locks them anyway; taking them before the
+-- counters lets ticket_stats.rebuild_company hold the same lock to recount a
+-- company without racing with writers.
+CREATE OR REPLACE FUNCTION apply_ticket_stats() RETURNS trigger AS $$
+DECLARE
+    delta TEXT;
+BEGIN
+    -- Transition tables only exist for the operations that have them
+    delta := CASE TG_OP
+        WHEN 'INSERT' THEN $q$
+            SELECT company_id, status, priority, product_list, created_at, 1 AS n FROM new_rows $q$
+        WHEN 'DELETE' THEN $q$
+            SELECT company_id, status, priority, product_list, created_at, -1 AS n FROM old_rows $q$
+        ELSE $q$
+            SELECT company_id, status, priority, product_list, created_at, -1 AS n FROM old_rows
+            UNION ALL
+            SELECT company_id, status, priority, product_list, created_at, 1 FROM new_rows $q$
+    END;
+
+    EXECUTE format($q$
+        WITH delta AS (%s)
+        SELECT 1 FROM customers
+        WHERE company_id IN (SELECT company_id FROM delta)
+        ORDER BY company_id
+        FOR UPDATE $q$, delta);
+
+    EXECUTE format($q$
+        WITH delta AS (%s)
+        INSERT INTO ticket_stats AS s (company_id, dimension, value, total)
+        SELECT company_id, dimension, value, sum(n)
+        FROM (
+            SELECT company_id, 'status' AS dimension, coalesce(status, '') AS value, n FROM delta
+            UNION ALL
+            SELECT company_id, 'priority', coalesce(priority, ''), n FROM delta
+            UNION ALL
+            SELECT company_id, 'product', coalesce(product_list, ''), n FROM delta
+        ) d
+        WHERE company_id IS NOT NULL
+        GROUP BY company_id, dimension, value
+        HAVING sum(n) <> 0
+        ORDER BY company_id, dimension, value
+        ON CONFLICT (company_id, dimension, value) DO UPDATE SET total = s.total + excluded.total $q$, delta);
+
+    EXECUTE format($q$
+        WITH delta AS (%s)
+        INSERT INTO ticket_daily_stats AS s (company_id, day, total)
+        SELECT company_id, created_at::date, sum(n)
+        FROM delta
+        WHERE company_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY company_id, created_at::date
+        HAVING sum(n) <> 0
+        ORDER BY company_id, created_at::date
+        ON CONFLICT (company_id, day) DO UPDATE SET total = s.total + excluded.total $q$, delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_stats_insert ON tickets;
+CREATE TRIGGER tickets_stats_insert AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_ticket_stats();
+
+DROP TRIGGER IF EXISTS tickets_stats_update ON tickets;
+CREATE TRIGGER tickets_stats_update AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_ticket_stats();
+
+DROP TRIGGER IF EXISTS tickets_stats_delete ON tickets;
+CREATE TRIGGER tickets_stats_delete AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_ticket_stats();
+
+-- Backfill; scripts/rebuild_ticket_stats.py does the same later, online
+TRUNCATE ticket_stats, ticket_daily_stats;
+
+INSERT INTO ticket_stats (company_id, dimension, value, total)
+SELECT company_id, dimension, value, count(*)
+FROM (
+    SELECT company_id, 'status' AS dimension, coalesce(status, '') AS value FROM tickets
+    UNION ALL
+    SELECT company_id, 'priority', coalesce(priority, '') FROM tickets
+    UNION ALL
+    SELECT company_id, 'product', coalesce(product_list, '') FROM tickets
+) t
+WHERE company_id IS NOT NULL
+GROUP BY company_id, dimension, value;
+
+INSERT INTO ticket_daily_stats (company_id, day, total)
+SELECT company_id, created_at::date, count(*)
+FROM tickets
+WHERE company_id IS NOT NULL
+GROUP BY company_id, created_at::date;
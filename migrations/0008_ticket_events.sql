@@ -0,0 +1,15 @@
+-- Ticket and comment change events for the live stream (/api/tickets/stream,
+-- events.py). Handlers insert a row in the same transaction as the change and
+-- NOTIFY it; the rows let a reconnecting client replay what it missed
+-- (Last-Event-ID). Rows older than EVENTS_RETENTION_HOURS are pruned.
+CREATE TABLE IF NOT EXISTS ticket_events (
+    id BIGSERIAL PRIMARY KEY,
+    company_id VARCHAR(20) NOT NULL,
+    event VARCHAR(30) NOT NULL,
+    ticket_id VARCHAR(50) NOT NULL,
+    data JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ticket_events_company ON ticket_events (company_id, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_events_created ON ticket_events (created_at);
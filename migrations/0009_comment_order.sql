@@ -0,0 +1,7 @@
+-- Comments are listed oldest first and paged by (timestamp, id); the id
+-- breaks ties between comments written in the same transaction.
+UPDATE ticket_comments SET timestamp = updated_at WHERE timestamp IS NULL;
+ALTER TABLE ticket_comments ALTER COLUMN timestamp SET NOT NULL;
+
+-- Also serves the newest comment per ticket for the batch summary (backwards)
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket_time ON ticket_comments (ticket_id, timestamp, id);
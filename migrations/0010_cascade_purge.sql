@@ -0,0 +1,63 @@
+-- Foreign keys for the rows that only exist as part of another row: comments
+-- of a ticket or of a user, and the user/group/project link tables. Deleting
+-- the parent now removes them in the same statement.
+--
+-- Tenant ownership (company_id on tickets, users, groups, projects) gets no
+-- cascading key on purpose: one DELETE on customers would then remove a whole
+-- tenant in a single long statement. purge.py removes a tenant in batches.
+--
+-- The keys are added NOT VALID: they are enforced for new rows (and cascade
+-- deletes) at once, and adding them does not scan the tables. Existing rows
+-- are checked by 0011, in its own transaction, after these ALTER TABLE locks
+-- have been released.
+ALTER TABLE ticket_comments
+    DROP CONSTRAINT IF EXISTS fk_ticket_comments_ticket,
+    ADD CONSTRAINT fk_ticket_comments_ticket FOREIGN KEY (ticket_id)
+        REFERENCES tickets (ticket_id) ON DELETE CASCADE NOT VALID,
+    DROP CONSTRAINT IF EXISTS fk_ticket_comments_user,
+    ADD CONSTRAINT fk_ticket_comments_user FOREIGN KEY (id_user)
+        REFERENCES users (id_user) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE user_groups
+    DROP CONSTRAINT IF EXISTS fk_user_groups_group,
+    ADD CONSTRAINT fk_user_groups_group FOREIGN KEY (group_id)
+        REFERENCES groups (group_id) ON DELETE CASCADE NOT VALID,
+    DROP CONSTRAINT IF EXISTS fk_user_groups_user,
+    ADD CONSTRAINT fk_user_groups_user FOREIGN KEY (id_user)
+        REFERENCES users (id_user) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE group_projects
+    DROP CONSTRAINT IF EXISTS fk_group_projects_group,
+    ADD CONSTRAINT fk_group_projects_group FOREIGN KEY (group_id)
+        REFERENCES groups (group_id) ON DELETE CASCADE NOT VALID,
+    DROP CONSTRAINT IF EXISTS fk_group_projects_project,
+    ADD CONSTRAINT fk_group_projects_project FOREIGN KEY (project_id)
+        REFERENCES projects (project_id) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE user_projects
+    DROP CONSTRAINT IF EXISTS fk_user_projects_user,
+    ADD CONSTRAINT fk_user_projects_user FOREIGN KEY (id_user)
+        REFERENCES users (id_user) ON DELETE CASCADE NOT VALID,
+    DROP CONSTRAINT IF EXISTS fk_user_projects_project,
+    ADD CONSTRAINT fk_user_projects_project FOREIGN KEY (project_id)
+        REFERENCES projects (project_id) ON DELETE CASCADE NOT VALID;
+
+-- Deleting a group revokes the project access its members got through it
+CREATE INDEX IF NOT EXISTS idx_user_projects_on_group ON user_projects (on_group) WHERE on_group IS NOT NULL;
+
+-- Background tenant purges (purge.py). The customer row is deleted when the
+-- purge is requested; this row keeps the company id reserved and records
+-- progress until the tenant's data is gone.
+CREATE TABLE IF NOT EXISTS tenant_purges (
+    company_id VARCHAR(20) PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done
+    deleted JSONB NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    locked_until TIMESTAMPTZ,
+    requested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_tenant_purges_open ON tenant_purges (requested_at) WHERE status <> 'done';
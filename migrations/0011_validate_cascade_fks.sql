@@ -0,0 +1,25 @@
+-- Check the existing rows against the foreign keys 0010 added NOT VALID.
+-- VALIDATE CONSTRAINT scans the tables but takes only SHARE UPDATE EXCLUSIVE
+-- on them, so reads and writes continue meanwhile; that is why it runs here,
+-- in its own transaction, and not in 0010 under the ALTER TABLE locks. A key
+-- whose table has orphaned rows stays NOT VALID (still enforced for new rows)
+-- instead of failing the migration; clean up and validate it by hand.
+DO $$
+DECLARE
+    c RECORD;
+BEGIN
+    FOR c IN
+        SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+        WHERE contype = 'f' AND NOT convalidated AND connamespace = current_schema()::regnamespace
+          AND conname IN ('fk_ticket_comments_ticket', 'fk_ticket_comments_user', 'fk_user_groups_group',
+                          'fk_user_groups_user', 'fk_group_projects_group', 'fk_group_projects_project',
+                          'fk_user_projects_user', 'fk_user_projects_project')
+    LOOP
+        BEGIN
+            EXECUTE format('ALTER TABLE %s VALIDATE CONSTRAINT %I', c.tbl, c.conname);
+        EXCEPTION WHEN foreign_key_violation THEN
+            RAISE NOTICE '% stays NOT VALID: % has orphaned rows', c.conname, c.tbl;
+        END;
+    END LOOP;
+END;
+$$;
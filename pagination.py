@@ -0,0 +1,88 @@
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Optional, Union
+import base64
+import json
+import os
+import database
+import fast_json
+import queries
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+# Most ids one batch request may ask for
+MAX_BATCH_IDS = int(os.getenv('MAX_BATCH_IDS', '500'))
+STREAM_PREFETCH = int(os.getenv('STREAM_PREFETCH', '500'))
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+class PageParams(BaseModel):
+    limit: Optional[int] = None
+    # The last key of the previous page; [sort value, key] for sorted lists
+    after: Optional[Union[str, list]] = None
+    stream: bool = False
+
+def encode_cursor(value) -> str:
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+def _page(limit: Optional[int], cursor: Optional[str], stream: bool, sorted_keys: bool) -> PageParams:
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if not (isinstance(after, str) or (sorted_keys and isinstance(after, list) and len(after) == 2)):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+    if after is not None and limit is None:
+        limit = MAX_PAGE_SIZE
+    return PageParams(limit=limit, after=after, stream=stream)
+
+# Dependency for list routes. Without `limit` a route keeps returning the full
+# list; with it, rows come back in key order and the header carries the
+# cursor for the next page. `stream=true` returns NDJSON instead.
+def page_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+) -> PageParams:
+    return _page(limit, cursor, stream, sorted_keys=False)
+
+# Same, for lists that can also be sorted by something other than their key:
+# the cursor is then a [sort value, key] pair
+def sorted_page_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+) -> PageParams:
+    return _page(limit, cursor, stream, sorted_keys=True)
+
+async def fetch_page(db, name: str, key: str, page: PageParams, response: Response, *args):
+    """Run a keyset statement (``... AND key > $n ORDER BY key LIMIT $m``) and
+    set the next-page cursor header."""
+    results = await queries.fetch(db, name, *args, page.after or '', page.limit + 1)
+    if len(results) > page.limit:
+        results = results[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(results[-1][key])
+    return results
+
+def ndjson_line(record, columns: tuple = None) -> bytes:
+    row = dict(record) if columns is None else {name: record[name] for name in columns}
+    return fast_json.dumps(row) + b'\n'
+
+async def _stream_rows(name: str, args: tuple, columns: tuple = None):
+    # Own connection: the request's connection is released before the body is sent
+    async with database.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for record in queries.cursor(conn, name, *args, prefetch=STREAM_PREFETCH):
+                yield ndjson_line(record, columns)
+
+def stream_ndjson(name: str, *args, columns: tuple = None) -> StreamingResponse:
+    """Stream a registered statement as NDJSON through a server-side cursor,
+    optionally only some of its columns."""
+    return StreamingResponse(_stream_rows(name, args, columns), media_type='application/x-ndjson')
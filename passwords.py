@@ -0,0 +1,113 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+import asyncio
+import os
+import statistics
+import time
+import bcrypt
+
+# bcrypt is deliberately slow (tens to hundreds of ms of CPU per call), so it
+# never runs on the event loop. Calls go to a dedicated executor: threads by
+# default (bcrypt releases the GIL while hashing), or processes with
+# PASSWORD_EXECUTOR=process. At most PASSWORD_WORKERS run at once and
+# PASSWORD_QUEUE_SIZE more may wait; beyond that requests get 503 instead of
+# piling up behind a login burst.
+PASSWORD_EXECUTOR = os.getenv('PASSWORD_EXECUTOR', 'thread')
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_SIZE = int(os.getenv('PASSWORD_QUEUE_SIZE', '64'))
+
+# Hashing policy. The cost (log2 rounds) is picked at startup as the highest
+# one whose hash time on this host stays within BCRYPT_TARGET_MS, clamped to
+# [BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS]. Setting BCRYPT_ROUNDS pins it
+# instead. The cost is part of every bcrypt hash. With a pin, hashes with
+# another cost are upgraded (or downgraded) on the user's next login; without
+# one, workers may calibrate a round apart, so only hashes more than one round
+# below this worker's cost, or above BCRYPT_MAX_ROUNDS, are rehashed.
+BCRYPT_TARGET_MS = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', '10'))
+BCRYPT_MAX_ROUNDS = int(os.getenv('BCRYPT_MAX_ROUNDS', '14'))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS')) if os.getenv('BCRYPT_ROUNDS') else None
+
+# Cost used for new hashes; set by calibrate()
+rounds = BCRYPT_ROUNDS or 12
+
+_executor: Executor = None
+_slots = asyncio.Semaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_SIZE)
+
+def _hash(password: bytes, cost: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(cost))
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+def _time_hash(cost: int, samples: int = 3) -> float:
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(cost))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def pick_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Highest cost whose hash time on this host is within target_ms."""
+    # Each extra round doubles the work, so one measurement at the minimum
+    # cost predicts the others
+    seconds = _time_hash(BCRYPT_MIN_ROUNDS)
+    cost = BCRYPT_MIN_ROUNDS
+    while cost < BCRYPT_MAX_ROUNDS and seconds * 2 ** (cost + 1 - BCRYPT_MIN_ROUNDS) * 1000 <= target_ms:
+        cost += 1
+    return cost
+
+async def calibrate() -> int:
+    """Set the cost for new hashes; run once at startup."""
+    global rounds
+    if BCRYPT_ROUNDS:
+        rounds = BCRYPT_ROUNDS
+    else:
+        # Own thread, so the calibration is not skewed by queued password work
+        rounds = await asyncio.to_thread(pick_rounds)
+    print(f"bcrypt cost {rounds} (target {BCRYPT_TARGET_MS:.0f} ms)")
+    return rounds
+
+def hash_cost(hashed: str):
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed: str) -> bool:
+    cost = hash_cost(hashed)
+    if cost is None:
+        return True
+    if BCRYPT_ROUNDS:
+        return cost != BCRYPT_ROUNDS
+    return cost < rounds - 1 or cost > BCRYPT_MAX_ROUNDS
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='bcrypt')
+    return _executor
+
+async def _run(fn, *args):
+    if _slots.locked():
+        raise HTTPException(status_code=503, detail='Server busy, please retry')
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+
+async def hash_password(password: str) -> str:
+    hashed = await _run(_hash, password.encode('utf-8'), rounds)
+    return hashed.decode('utf-8')
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import database
+import queries
+
+# Deleting a tenant. Small tenants are deleted in one transaction by
+# delete_now(). Large ones (more than PURGE_SYNC_MAX_TICKETS tickets) are
+# purged in the background: request() deletes the customer row at once, so
+# the tenant disappears from the API and can take no new tickets or users,
+# and records a tenant_purges row. The worker then deletes the tenant's
+# tickets, groups, projects and users in batches of PURGE_BATCH_SIZE, each
+# batch its own short transaction, so no lock is held long enough to stall
+# ticket traffic. Comments and link rows go with their parents (ON DELETE
+# CASCADE, migration 0010).
+#
+# Progress is written after every batch. Purges are claimed with a lease like
+# the mail outbox: a worker that dies mid-purge leaves the row claimable again
+# once PURGE_LEASE_SECONDS pass, and the purge continues where it stopped.
+PURGE_WORKER_ENABLED = os.getenv('PURGE_WORKER_ENABLED', 'true').lower() == 'true'
+PURGE_SYNC_MAX_TICKETS = int(os.getenv('PURGE_SYNC_MAX_TICKETS', '1000'))
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '500'))
+# Breathing room for other transactions between batches
+PURGE_BATCH_PAUSE = float(os.getenv('PURGE_BATCH_PAUSE', '0.05'))
+PURGE_POLL_INTERVAL = float(os.getenv('PURGE_POLL_INTERVAL', '30'))
+PURGE_LEASE_SECONDS = float(os.getenv('PURGE_LEASE_SECONDS', '120'))
+PURGE_RETRY_SECONDS = float(os.getenv('PURGE_RETRY_SECONDS', '60'))
+
+# In dependency order: tickets first, users last
+STEPS = (
+    ('tickets', 'purge_tickets_batch'),
+    ('groups', 'purge_groups_batch'),
+    ('projects', 'purge_projects_batch'),
+    ('users', 'purge_users_batch'),
+)
+
+_wake: asyncio.Event = None
+_worker: asyncio.Task = None
+_stats = {'requested': 0, 'completed': 0, 'batches': 0, 'rows': 0, 'errors': 0}
+
+def _count(status: str) -> int:
+    # 'DELETE 42' -> 42
+    return int(status.split()[-1])
+
+async def delete_now(db, company_id: str) -> bool:
+    """Delete a tenant and all its data in one transaction. Returns False if
+    there is no such customer."""
+    async with db.transaction():
+        if await queries.execute(db, 'customer_delete', company_id) == 'DELETE 0':
+            return False
+        await queries.execute(db, 'customer_delete_tickets', company_id)
+        await queries.execute(db, 'customer_delete_groups', company_id)
+        await queries.execute(db, 'customer_delete_projects', company_id)
+        await queries.execute(db, 'customer_delete_users', company_id)
+        await queries.execute(db, 'customer_delete_rollups', company_id)
+    return True
+
+async def request(db, company_id: str) -> bool:
+    """Remove the customer now and queue the purge of its data. Returns False
+    if there is no such customer."""
+    async with db.transaction():
+        if await queries.execute(db, 'customer_delete', company_id) == 'DELETE 0':
+            return False
+        await queries.execute(db, 'purge_request', company_id)
+    _stats['requested'] += 1
+    if _wake is not None:
+        _wake.set()
+    return True
+
+async def status(db, company_id: str):
+    row = await queries.fetchrow(db, 'purge_status', company_id)
+    if row is None:
+        return None
+    return {**dict(row), 'deleted': json.loads(row['deleted'])}
+
+async def _purge(conn, company_id: str, deleted: dict):
+    for table, name in STEPS:
+        while True:
+            async with conn.transaction():
+                removed = _count(await queries.execute(conn, name, company_id, PURGE_BATCH_SIZE))
+                deleted[table] = deleted.get(table, 0) + removed
+                await queries.execute(conn, 'purge_progress', company_id, json.dumps(deleted), PURGE_LEASE_SECONDS)
+            _stats['batches'] += 1
+            _stats['rows'] += removed
+            if removed < PURGE_BATCH_SIZE:
+                break
+            await asyncio.sleep(PURGE_BATCH_PAUSE)
+    async with conn.transaction():
+        await queries.execute(conn, 'customer_delete_rollups', company_id)
+        await queries.execute(conn, 'purge_done', company_id, json.dumps(deleted))
+    _stats['completed'] += 1
+
+async def run_pending() -> int:
+    """Work through every claimable purge; returns how many were finished."""
+    finished = 0
+    async with database.acquire() as conn:
+        while True:
+            job = await queries.fetchrow(conn, 'purge_claim', PURGE_LEASE_SECONDS)
+            if job is None:
+                return finished
+            try:
+                await _purge(conn, job['company_id'], json.loads(job['deleted']))
+                finished += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Stays claimed until the retry delay passes, then resumes
+                _stats['errors'] += 1
+                print(f"Purge of {job['company_id']} failed: {e}")
+                await queries.execute(conn, 'purge_failed', job['company_id'], str(e), PURGE_RETRY_SECONDS)
+
+async def _run():
+    while True:
+        try:
+            await run_pending()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats['errors'] += 1
+            print(f"Purge worker error: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), PURGE_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+def start():
+    global _wake, _worker
+    _wake = asyncio.Event()
+    if PURGE_WORKER_ENABLED and _worker is None:
+        _worker = asyncio.create_task(_run())
+
+async def stop():
+    global _wake, _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    # An unfinished purge is picked up again after its lease runs out
+    _wake = _worker = None
+
+def purge_stats() -> dict:
+    return {'worker_running': _worker is not None and not _worker.done(), **_stats}
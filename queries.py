@@ -0,0 +1,648 @@
+import re
+
+# Central registry of every SQL statement used by the routers.
+# Routes refer to statements by name so the text is identical on every call
+# and asyncpg can reuse one server-side prepared statement per connection.
+
+def _partial_update(table: str, fields: tuple, key: str) -> str:
+    # One canonical statement per table: $1 lists the fields being set, every
+    # other field keeps its current value. The text never changes with the
+    # set of fields, so it is prepared once instead of once per combination.
+    assignments = ',\n        '.join(
+        f"{field} = CASE WHEN '{field}' = ANY($1::text[]) THEN ${i + 2} ELSE {field} END"
+        for i, field in enumerate(fields)
+    )
+    return f'UPDATE {table} SET\n        {assignments}\n    WHERE {key} = ${len(fields) + 2}'
+
+USER_UPDATE_FIELDS = (
+    'full_name', 'username', 'password', 'company_id', 'role', 'email', 'phone',
+    'is_verified', 'verification_code', 'verification_expires',
+)
+
+# Ticket list statements select one of a fixed set of projections; see
+# ticket_list(). Routes trim the rows to the fields a client asked for.
+TICKET_COLUMNS = (
+    'ticket_id', 'product_list', 'describe_issue', 'detail_issue', 'priority', 'contact',
+    'company_id', 'company_name', 'attachment', 'id_user', 'status', 'created_at', 'updated_at',
+)
+# What list views show; the default projection of every ticket list route
+TICKET_SUMMARY_COLUMNS = ('ticket_id', 'describe_issue', 'status', 'priority', 'created_at')
+TICKET_PROJECTIONS = {'summary': TICKET_SUMMARY_COLUMNS, 'all': TICKET_COLUMNS}
+# List filters in argument order; the list ones take several values. Every
+# statement takes all of them, NULL for a filter that is not used, so the
+# filters a client combines do not multiply the statements.
+TICKET_FILTERS = {
+    'status': '({0}::text[] IS NULL OR status = ANY({0}::text[]))',
+    'priority': '({0}::text[] IS NULL OR priority = ANY({0}::text[]))',
+    'product_list': '({0}::text[] IS NULL OR product_list = ANY({0}::text[]))',
+    'contact': '({0}::text[] IS NULL OR contact = ANY({0}::text[]))',
+    'id_user': '({0}::text[] IS NULL OR id_user = ANY({0}::text[]))',
+    'created_from': '({0}::timestamp IS NULL OR created_at >= {0}::timestamp)',
+    'created_to': '({0}::timestamp IS NULL OR created_at < {0}::timestamp)',
+}
+# Keyset-paginable sort keys; 'rank' only together with a search
+TICKET_SORTS = ('ticket_id', 'created_at', 'updated_at', 'rank')
+# Text search configuration of tickets.search_vector (migration 0006)
+TICKET_SEARCH_CONFIG = 'simple'
+
+USER_COLUMNS = 'id_user, role, full_name, username, company_id, company_name, billing_account_id, email, phone, is_verified'
+CUSTOMER_COLUMNS = 'company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage'
+
+COMMENT_SELECT = '''
+    SELECT tc.id, tc.ticket_id, tc.comment, u.full_name, tc.timestamp
+    FROM ticket_comments tc
+    JOIN users u ON tc.id_user = u.id_user
+'''
+
+QUERIES = {
+    # customers
+    # Refused (INSERT 0 0) while a purge of the same id is still running
+    'customer_insert': '''
+        INSERT INTO customers (company_id, company_name, billing_account_id, maintenance, limit_ticket)
+        SELECT $1::varchar, $2::varchar, $3::varchar, $4::varchar, $5::int
+        WHERE NOT EXISTS (SELECT 1 FROM tenant_purges WHERE company_id = $1 AND status <> 'done')
+    ''',
+    'customers_all': f'SELECT {CUSTOMER_COLUMNS} FROM customers',
+    'customers_page': f'SELECT {CUSTOMER_COLUMNS} FROM customers WHERE company_id > $1 ORDER BY company_id LIMIT $2',
+    'customer_by_id': f'SELECT {CUSTOMER_COLUMNS} FROM customers WHERE company_id = $1',
+    'customers_by_ids': f'SELECT {CUSTOMER_COLUMNS} FROM customers WHERE company_id = ANY($1::text[])',
+    'customer_by_billing_account': 'SELECT company_id FROM customers WHERE billing_account_id = $1',
+    'customer_update': '''
+        UPDATE customers
+        SET company_name = $1, billing_account_id = $2, maintenance = $3, limit_ticket = $4
+        WHERE company_id = $5
+    ''',
+    'customer_ids': 'SELECT company_id FROM customers ORDER BY company_id',
+    'customer_reserve_ticket': '''
+        UPDATE customers
+        SET ticket_usage = ticket_usage + 1
+        WHERE company_id = $1 AND ticket_usage < limit_ticket
+        RETURNING company_name
+    ''',
+    'customer_release_ticket': 'UPDATE customers SET ticket_usage = GREATEST(ticket_usage - 1, 0) WHERE company_id = $1',
+    'customer_lock_usage': 'SELECT ticket_usage FROM customers WHERE company_id = $1 FOR UPDATE',
+    'customer_set_usage': 'UPDATE customers SET ticket_usage = $1 WHERE company_id = $2',
+    'customer_delete': 'DELETE FROM customers WHERE company_id = $1',
+    # Tenant data; comments and the link tables go with it (ON DELETE CASCADE)
+    'customer_delete_tickets': 'DELETE FROM tickets WHERE company_id = $1',
+    'customer_delete_groups': 'DELETE FROM groups WHERE company_id = $1',
+    'customer_delete_projects': 'DELETE FROM projects WHERE company_id = $1',
+    'customer_delete_users': 'DELETE FROM users WHERE company_id = $1',
+    'customer_delete_rollups': '''
+        WITH stats AS (DELETE FROM ticket_stats WHERE company_id = $1),
+             daily AS (DELETE FROM ticket_daily_stats WHERE company_id = $1)
+        DELETE FROM ticket_events WHERE company_id = $1
+    ''',
+
+    # users
+    'user_by_username': 'SELECT * FROM users WHERE username = $1',
+    'user_by_email': 'SELECT * FROM users WHERE email = $1',
+    'user_by_id': f'SELECT {USER_COLUMNS} FROM users WHERE id_user = $1',
+    'users_by_ids': f'SELECT {USER_COLUMNS} FROM users WHERE id_user = ANY($1::text[])',
+    'users_all': f'SELECT {USER_COLUMNS} FROM users',
+    'users_page': f'SELECT {USER_COLUMNS} FROM users WHERE id_user > $1 ORDER BY id_user LIMIT $2',
+    'users_by_company': f'SELECT {USER_COLUMNS} FROM users WHERE company_id = $1',
+    'user_role_company': 'SELECT role, company_id FROM users WHERE id_user = $1',
+    'user_full_name': 'SELECT full_name FROM users WHERE id_user = $1',
+    'user_name_email': 'SELECT full_name, email FROM users WHERE id_user = $1',
+    'user_email': 'SELECT email FROM users WHERE id_user = $1',
+    'user_username_exists': 'SELECT 1 FROM users WHERE username = $1',
+    'user_email_exists': 'SELECT 1 FROM users WHERE email = $1',
+    'user_phone_exists': 'SELECT 1 FROM users WHERE phone = $1',
+    'user_username_taken': 'SELECT 1 FROM users WHERE username = $1 AND id_user != $2',
+    'user_email_taken': 'SELECT 1 FROM users WHERE email = $1 AND id_user != $2',
+    'user_phone_taken': 'SELECT 1 FROM users WHERE phone = $1 AND id_user != $2',
+    'user_insert': '''
+        INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name, billing_account_id, email, phone, is_verified)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+    ''',
+    'user_update': _partial_update('users', USER_UPDATE_FIELDS, 'id_user'),
+    'user_delete': 'DELETE FROM users WHERE id_user = $1',
+    'user_otp_target': 'SELECT id_user, full_name, is_verified FROM users WHERE email = $1',
+    'user_verification_state': '''
+        SELECT id_user, verification_code, verification_expires, is_verified
+        FROM users
+        WHERE email = $1
+    ''',
+    'user_set_verification_code': '''
+        UPDATE users
+        SET verification_code = $1, verification_expires = $2
+        WHERE email = $3
+    ''',
+    'user_reset_password': '''
+        UPDATE users
+        SET password = $1, verification_code = NULL, verification_expires = NULL
+        WHERE email = $2
+    ''',
+    'user_confirm_email': '''
+        UPDATE users
+        SET is_verified = TRUE, verification_code = NULL, verification_expires = NULL
+        WHERE email = $1
+    ''',
+    # Only if the password was not changed since the login that triggered it
+    'user_rehash_password': 'UPDATE users SET password = $1 WHERE id_user = $2 AND password = $3',
+    'user_mark_verified': 'UPDATE users SET is_verified = TRUE WHERE email = $1',
+
+    # user <-> project access
+    'user_project_exists': 'SELECT 1 FROM user_projects WHERE id_user = $1 AND project_id = $2',
+    'user_project_on_group': 'SELECT on_group FROM user_projects WHERE id_user = $1 AND project_id = $2',
+    'user_project_insert': 'INSERT INTO user_projects (id_user, project_id, billing_id, on_group) VALUES ($1, $2, $3, $4)',
+    'user_project_delete': 'DELETE FROM user_projects WHERE id_user = $1 AND project_id = $2',
+    'user_projects_with_billing': '''
+        SELECT up.project_id, up.billing_id
+        FROM user_projects up
+        WHERE up.id_user = $1
+    ''',
+    'project_user_ids': 'SELECT id_user FROM user_projects WHERE project_id = $1',
+
+    # groups
+    'group_insert': '''
+        INSERT INTO groups (group_id, group_name, company_id)
+        VALUES ($1, $2, $3)
+    ''',
+    'groups_all': 'SELECT group_id, group_name, company_id FROM groups',
+    'groups_page': 'SELECT group_id, group_name, company_id FROM groups WHERE group_id > $1 ORDER BY group_id LIMIT $2',
+    'group_by_id': 'SELECT group_id, group_name, company_id FROM groups WHERE group_id = $1',
+    'groups_by_company': 'SELECT group_id, group_name, company_id FROM groups WHERE company_id = $1',
+    # Returns the company the group belonged to before the update
+    'group_update': '''
+        UPDATE groups g
+        SET group_name = $1, company_id = $2
+        FROM groups old
+        WHERE g.group_id = $3 AND old.group_id = g.group_id
+        RETURNING old.company_id
+    ''',
+    # Members and project links go with the group (ON DELETE CASCADE)
+    'group_delete': 'DELETE FROM groups WHERE group_id = $1 RETURNING company_id',
+    # Project access the group's members got through it
+    'group_revoke_all': 'DELETE FROM user_projects WHERE on_group = $1 RETURNING id_user',
+    'group_member_ids': 'SELECT id_user FROM user_groups WHERE group_id = $1',
+    'group_members_add': '''
+        INSERT INTO user_groups (id_user, group_id)
+        SELECT DISTINCT new.id_user, $1 FROM unnest($2::text[]) AS new(id_user)
+        ON CONFLICT (group_id, id_user) DO NOTHING
+        RETURNING id_user
+    ''',
+    'group_member_delete': 'DELETE FROM user_groups WHERE group_id = $1 AND id_user = $2',
+    'group_members_detail': '''
+        SELECT u.id_user, u.role, u.full_name, u.username, u.company_id, u.company_name, u.billing_account_id, u.email, u.phone
+        FROM users u
+        JOIN user_groups ug ON u.id_user = ug.id_user
+        WHERE ug.group_id = $1
+    ''',
+    'groups_for_user': '''
+        SELECT g.group_id, g.group_name
+        FROM groups g
+        JOIN user_groups ug ON g.group_id = ug.group_id
+        WHERE ug.id_user = $1
+    ''',
+    'group_project_ids': 'SELECT project_id FROM group_projects WHERE group_id = $1',
+    'group_projects_add': '''
+        INSERT INTO group_projects (group_id, project_id)
+        SELECT DISTINCT $1, new.project_id FROM unnest($2::text[]) AS new(project_id)
+        ON CONFLICT (group_id, project_id) DO NOTHING
+        RETURNING project_id
+    ''',
+    'group_project_delete': 'DELETE FROM group_projects WHERE group_id = $1 AND project_id = $2',
+    # Project access inherited from group membership (user_projects.on_group)
+    'group_grant_projects_to_users': '''
+        INSERT INTO user_projects (id_user, project_id, billing_id, on_group)
+        SELECT member.id_user, gp.project_id, p.billing_account_id, $1
+        FROM unnest($2::text[]) AS member(id_user)
+        JOIN group_projects gp ON gp.group_id = $1
+        JOIN projects p ON p.project_id = gp.project_id
+        ON CONFLICT (id_user, project_id) DO NOTHING
+    ''',
+    'group_grant_users_to_projects': '''
+        INSERT INTO user_projects (id_user, project_id, billing_id, on_group)
+        SELECT ug.id_user, new.project_id, p.billing_account_id, $1
+        FROM unnest($2::text[]) AS new(project_id)
+        JOIN user_groups ug ON ug.group_id = $1
+        LEFT JOIN projects p ON p.project_id = new.project_id
+        ON CONFLICT (id_user, project_id) DO NOTHING
+        RETURNING id_user
+    ''',
+    'group_revoke_user_projects': '''
+        DELETE FROM user_projects up
+        USING group_projects gp
+        WHERE gp.group_id = $1 AND up.project_id = gp.project_id
+          AND up.id_user = $2 AND up.on_group = $1
+    ''',
+    'group_revoke_project_users': '''
+        DELETE FROM user_projects up
+        USING user_groups ug
+        WHERE ug.group_id = $1 AND up.id_user = ug.id_user AND up.project_id = $2
+        RETURNING up.id_user
+    ''',
+
+    # projects
+    'project_exists': 'SELECT 1 FROM projects WHERE project_id = $1',
+    'project_insert': '''
+        INSERT INTO projects (project_id, company_id, billing_account_id)
+        VALUES ($1, $2, $3)
+    ''',
+    'projects_all': 'SELECT project_id, company_id, billing_account_id FROM projects',
+    'projects_page': 'SELECT project_id, company_id, billing_account_id FROM projects WHERE project_id > $1 ORDER BY project_id LIMIT $2',
+    'project_by_id': 'SELECT project_id, company_id, billing_account_id FROM projects WHERE project_id = $1',
+    'projects_by_ids': 'SELECT project_id, company_id, billing_account_id FROM projects WHERE project_id = ANY($1::text[])',
+    'projects_by_company': 'SELECT project_id, company_id, billing_account_id FROM projects WHERE company_id = $1',
+    'project_billing_account': 'SELECT billing_account_id FROM projects WHERE project_id = $1',
+    'customer_billing_account': 'SELECT billing_account_id FROM customers WHERE company_id = $1',
+    # Returns the company the project belonged to before the update
+    'project_update': '''
+        UPDATE projects p
+        SET company_id = $1, billing_account_id = $2
+        FROM projects old
+        WHERE p.project_id = $3 AND old.project_id = p.project_id
+        RETURNING old.company_id
+    ''',
+    'project_delete': 'DELETE FROM projects WHERE project_id = $1 RETURNING company_id',
+    # billing import: current rows for the imported ids and for the account
+    'projects_for_import': '''
+        SELECT project_id, company_id, billing_account_id
+        FROM projects
+        WHERE project_id = ANY($1::text[]) OR (company_id = $2 AND billing_account_id = $3)
+        FOR UPDATE
+    ''',
+    'projects_insert_many': '''
+        INSERT INTO projects (project_id, company_id, billing_account_id)
+        SELECT new.project_id, $2, $3 FROM unnest($1::text[]) AS new(project_id)
+        ON CONFLICT (project_id) DO NOTHING
+    ''',
+    'projects_reassign_many': 'UPDATE projects SET company_id = $2, billing_account_id = $3 WHERE project_id = ANY($1::text[])',
+    'projects_delete_many': 'DELETE FROM projects WHERE project_id = ANY($1::text[])',
+    'project_links_delete_user': 'DELETE FROM user_projects WHERE project_id = ANY($1::text[]) RETURNING id_user',
+    'project_links_delete_group': 'DELETE FROM group_projects WHERE project_id = ANY($1::text[])',
+
+    # tickets
+    'ticket_count_by_company': 'SELECT COUNT(*) FROM tickets WHERE company_id = $1',
+    'ticket_insert': '''
+        INSERT INTO tickets (ticket_id, product_list, describe_issue, detail_issue, priority, contact, company_id, company_name, attachment, id_user, status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+        RETURNING ''' + ', '.join(TICKET_COLUMNS),
+    'ticket_by_id': f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets WHERE ticket_id = $1",
+    'tickets_by_ids': f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets WHERE ticket_id = ANY($1::text[])",
+    'ticket_update': '''
+        UPDATE tickets
+        SET product_list = $1, describe_issue = $2, detail_issue = $3, priority = $4, contact = $5, status = $6,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE ticket_id = $7
+    ''',
+    'ticket_delete': 'DELETE FROM tickets WHERE ticket_id = $1 RETURNING company_id',
+    # Returns the new comment id and the ticket's company (None: no such ticket)
+    'comment_insert': '''
+        WITH c AS (
+            INSERT INTO ticket_comments (ticket_id, id_user, comment) VALUES ($1, $2, $3)
+            RETURNING id, ticket_id
+        )
+        SELECT c.id, t.company_id FROM c LEFT JOIN tickets t ON t.ticket_id = c.ticket_id
+    ''',
+    'comments_by_ticket': f'{COMMENT_SELECT} WHERE tc.ticket_id = $1 ORDER BY tc.timestamp, tc.id',
+    'comments_by_ticket_first_page': f'{COMMENT_SELECT} WHERE tc.ticket_id = $1 ORDER BY tc.timestamp, tc.id LIMIT $2',
+    'comments_by_ticket_page': f'''
+        {COMMENT_SELECT}
+        WHERE tc.ticket_id = $1 AND (tc.timestamp, tc.id) > ($2, $3)
+        ORDER BY tc.timestamp, tc.id LIMIT $4
+    ''',
+    # Count and newest comment of each ticket, in the order of $1
+    'comment_summary': '''
+        SELECT t.ticket_id, c.total, l.id, l.comment, u.full_name, l.timestamp
+        FROM unnest($1::text[]) WITH ORDINALITY AS t(ticket_id, n)
+        CROSS JOIN LATERAL (SELECT count(*) AS total FROM ticket_comments WHERE ticket_id = t.ticket_id) c
+        LEFT JOIN LATERAL (
+            SELECT id, id_user, comment, timestamp FROM ticket_comments
+            WHERE ticket_id = t.ticket_id
+            ORDER BY timestamp DESC, id DESC LIMIT 1
+        ) l ON TRUE
+        LEFT JOIN users u ON u.id_user = l.id_user
+        ORDER BY t.n
+    ''',
+    # ETag validators (etags.py); cheap enough to run on every poll
+    'ticket_version': 'SELECT updated_at FROM tickets WHERE ticket_id = $1',
+    'company_ticket_version': 'SELECT ticket_version FROM customers WHERE company_id = $1',
+    'comments_version': 'SELECT count(*) AS total, max(id) AS last_id FROM ticket_comments WHERE ticket_id = $1',
+    # dashboard rollups (migration 0007, ticket_stats.py)
+    'ticket_stats_by_company': 'SELECT dimension, value, total FROM ticket_stats WHERE company_id = $1 AND total <> 0',
+    'ticket_stats_all': '''
+        SELECT dimension, value, sum(total)::bigint AS total FROM ticket_stats
+        GROUP BY dimension, value HAVING sum(total) <> 0
+    ''',
+    'ticket_daily_stats_by_company': '''
+        SELECT day, total FROM ticket_daily_stats
+        WHERE company_id = $1 AND day >= $2 AND total <> 0 ORDER BY day
+    ''',
+    'ticket_daily_stats_all': '''
+        SELECT day, sum(total)::bigint AS total FROM ticket_daily_stats
+        WHERE day >= $1 GROUP BY day HAVING sum(total) <> 0 ORDER BY day
+    ''',
+    'ticket_stats_company_ids': 'SELECT company_id FROM customers UNION SELECT company_id FROM ticket_stats ORDER BY company_id',
+    'ticket_stats_clear_company': 'DELETE FROM ticket_stats WHERE company_id = $1',
+    'ticket_daily_stats_clear_company': 'DELETE FROM ticket_daily_stats WHERE company_id = $1',
+    'ticket_stats_fill_company': '''
+        INSERT INTO ticket_stats (company_id, dimension, value, total)
+        SELECT $1::varchar, dimension, value, count(*)
+        FROM (
+            SELECT 'status' AS dimension, coalesce(status, '') AS value FROM tickets WHERE company_id = $1
+            UNION ALL
+            SELECT 'priority', coalesce(priority, '') FROM tickets WHERE company_id = $1
+            UNION ALL
+            SELECT 'product', coalesce(product_list, '') FROM tickets WHERE company_id = $1
+        ) t
+        GROUP BY dimension, value
+    ''',
+    'ticket_daily_stats_fill_company': '''
+        INSERT INTO ticket_daily_stats (company_id, day, total)
+        SELECT $1::varchar, created_at::date, count(*) FROM tickets WHERE company_id = $1 GROUP BY created_at::date
+    ''',
+
+    # services
+    'services_all': 'SELECT id, service_name FROM services',
+    'service_by_id': 'SELECT id, service_name FROM services WHERE id = $1',
+
+    # mail outbox (mailer.py)
+    'mail_enqueue': '''
+        INSERT INTO mail_outbox (from_email, to_email, subject, text_body, html_body, attachment_url)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING id
+    ''',
+    # Due rows, the ids just enqueued in this process first. The lease keeps
+    # other workers off a batch while it is being sent; a crashed worker's
+    # batch becomes claimable again once the lease runs out.
+    'mail_claim': '''
+        UPDATE mail_outbox
+        SET attempts = attempts + 1, locked_until = now() + make_interval(secs => $3)
+        WHERE id IN (
+            SELECT id FROM mail_outbox
+            WHERE status = 'pending' AND next_attempt_at <= now()
+              AND (locked_until IS NULL OR locked_until < now())
+            ORDER BY id = ANY($1::bigint[]) DESC, next_attempt_at
+            LIMIT $2
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, from_email, to_email, subject, text_body, html_body, attachment_url, attempts
+    ''',
+    'mail_mark_sent': '''
+        UPDATE mail_outbox SET status = 'sent', sent_at = now(), locked_until = NULL, last_error = NULL
+        WHERE id = ANY($1::bigint[])
+    ''',
+    'mail_mark_failed': '''
+        UPDATE mail_outbox
+        SET status = CASE WHEN attempts >= $3 THEN 'failed' ELSE 'pending' END,
+            next_attempt_at = now() + make_interval(secs => $4),
+            locked_until = NULL, last_error = $2
+        WHERE id = $1
+    ''',
+
+    # background tenant purge (purge.py)
+    'purge_request': '''
+        INSERT INTO tenant_purges (company_id) VALUES ($1)
+        ON CONFLICT (company_id) DO UPDATE
+        SET status = 'pending', deleted = '{}', attempts = 0, last_error = NULL, locked_until = NULL,
+            requested_at = now(), started_at = NULL, finished_at = NULL
+        WHERE tenant_purges.status = 'done'
+    ''',
+    'purge_claim': '''
+        UPDATE tenant_purges
+        SET status = 'running', attempts = attempts + 1, started_at = coalesce(started_at, now()),
+            locked_until = now() + make_interval(secs => $1)
+        WHERE company_id = (
+            SELECT company_id FROM tenant_purges
+            WHERE status <> 'done' AND (locked_until IS NULL OR locked_until < now())
+            ORDER BY requested_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING company_id, deleted
+    ''',
+    'purge_progress': '''
+        UPDATE tenant_purges SET deleted = $2::jsonb, locked_until = now() + make_interval(secs => $3)
+        WHERE company_id = $1
+    ''',
+    'purge_failed': '''
+        UPDATE tenant_purges SET last_error = $2, locked_until = now() + make_interval(secs => $3)
+        WHERE company_id = $1
+    ''',
+    'purge_done': '''
+        UPDATE tenant_purges SET status = 'done', deleted = $2::jsonb, finished_at = now(), locked_until = NULL, last_error = NULL
+        WHERE company_id = $1
+    ''',
+    'purge_status': '''
+        SELECT company_id, status, deleted, attempts, last_error, requested_at, started_at, finished_at
+        FROM tenant_purges WHERE company_id = $1
+    ''',
+    # One bounded batch per table; each runs in its own short transaction
+    'purge_tickets_batch': 'DELETE FROM tickets WHERE ticket_id IN (SELECT ticket_id FROM tickets WHERE company_id = $1 LIMIT $2)',
+    'purge_groups_batch': 'DELETE FROM groups WHERE group_id IN (SELECT group_id FROM groups WHERE company_id = $1 LIMIT $2)',
+    'purge_projects_batch': 'DELETE FROM projects WHERE project_id IN (SELECT project_id FROM projects WHERE company_id = $1 LIMIT $2)',
+    'purge_users_batch': 'DELETE FROM users WHERE id_user IN (SELECT id_user FROM users WHERE company_id = $1 LIMIT $2)',
+
+    # cross-worker cache invalidation (cache.py)
+    'cache_notify': 'SELECT pg_notify($1, $2)',
+
+    # ticket change stream (events.py); the NOTIFY is delivered on commit
+    # The whole event if it fits in $6 bytes, else only its id; NOTIFY
+    # payloads are limited to 8000 bytes
+    'ticket_event_publish': '''
+        WITH e AS (
+            INSERT INTO ticket_events (company_id, event, ticket_id, data) VALUES ($2, $3, $4, $5::jsonb)
+            RETURNING id, company_id, event, ticket_id, data, created_at
+        ), m AS (
+            SELECT id, json_build_object(
+                'id', id, 'company_id', company_id, 'event', event, 'ticket_id', ticket_id,
+                'data', data, 'created_at', created_at)::text AS message
+            FROM e
+        )
+        SELECT pg_notify($1, CASE WHEN octet_length(message) <= $6 THEN message
+                                  ELSE json_build_object('id', id)::text END)
+        FROM m
+    ''',
+    'ticket_event_by_id': 'SELECT id, company_id, event, ticket_id, data, created_at FROM ticket_events WHERE id = $1',
+    'ticket_events_since': '''
+        SELECT id, company_id, event, ticket_id, data, created_at FROM ticket_events
+        WHERE id > $1 ORDER BY id LIMIT $2
+    ''',
+    'ticket_events_since_by_company': '''
+        SELECT id, company_id, event, ticket_id, data, created_at FROM ticket_events
+        WHERE company_id = $1 AND id > $2 ORDER BY id LIMIT $3
+    ''',
+    'ticket_events_oldest': 'SELECT min(id) FROM ticket_events',
+    # Keeps the newest expired row, so a resume from before it can be told
+    # apart from one that missed nothing
+    'ticket_events_prune': '''
+        DELETE FROM ticket_events
+        WHERE id < (SELECT max(id) FROM ticket_events WHERE created_at < now() - make_interval(hours => $1))
+    ''',
+}
+
+# Statements prepared on every new pool connection, before it serves a request.
+# Warmed by running them once with NULL arguments, which matches no rows but
+# leaves the statement in the connection's statement cache.
+HOT_QUERIES = (
+    'ticket_by_id',
+    'user_role_company',
+    'user_by_username',
+    'user_by_id',
+    'customer_by_id',
+    'comments_by_ticket',
+    'ticket_version',
+    'company_ticket_version',
+    'comments_version',
+)
+
+# Registered statement names this process has used on each backend
+# connection, keyed by server pid. asyncpg keeps the prepared statements
+# themselves in its per-connection cache (sized by DB_STATEMENT_CACHE_SIZE in
+# database.py) and does not report its own hits.
+_used = {}
+
+# Per-statement use counters: the first use of a name on a connection, and
+# every later one. A repeat use normally runs the cached prepared statement,
+# but asyncpg re-prepares it after an LRU eviction or a schema change, which
+# these counters cannot see; read them as upper bounds on reuse.
+_stats = {name: {'first_uses': 0, 'repeat_uses': 0} for name in QUERIES}
+
+def _param_count(sql: str) -> int:
+    return max((int(n) for n in re.findall(r'\$(\d+)', sql)), default=0)
+
+def _forget_connection(conn):
+    _used.pop(conn.get_server_pid(), None)
+
+async def prepare_hot_queries(conn):
+    """Pool ``init`` hook: prepare the hot statements on a fresh connection."""
+    seen = set()
+    _used[conn.get_server_pid()] = seen
+    conn.add_termination_listener(_forget_connection)
+    for name in HOT_QUERIES:
+        sql = QUERIES[name]
+        await conn.fetch(sql, *([None] * _param_count(sql)))
+        seen.add(name)
+
+def _sql(db, name: str) -> str:
+    seen = _used.setdefault(db.get_server_pid(), set())
+    if name in seen:
+        _stats[name]['repeat_uses'] += 1
+    else:
+        _stats[name]['first_uses'] += 1
+        seen.add(name)
+    return QUERIES[name]
+
+async def fetch(db, name: str, *args):
+    return await db.fetch(_sql(db, name), *args)
+
+async def fetchrow(db, name: str, *args):
+    return await db.fetchrow(_sql(db, name), *args)
+
+async def fetchval(db, name: str, *args):
+    return await db.fetchval(_sql(db, name), *args)
+
+async def execute(db, name: str, *args) -> str:
+    """Run a statement and return its status tag, e.g. ``'UPDATE 1'``."""
+    return await db.execute(_sql(db, name), *args)
+
+def cursor(db, name: str, *args, prefetch=None):
+    """Iterate a statement through a server-side cursor (needs a transaction)."""
+    return db.cursor(_sql(db, name), *args, prefetch=prefetch)
+
+async def executemany(db, name: str, args):
+    await db.executemany(_sql(db, name), args)
+
+def register(name: str, sql: str) -> str:
+    """Add a statement built at runtime to the registry; returns its name."""
+    if name not in QUERIES:
+        QUERIES[name] = sql
+        _stats[name] = {'first_uses': 0, 'repeat_uses': 0}
+    return name
+
+def ticket_projection(columns) -> str:
+    """The smallest projection that selects all of ``columns``."""
+    for projection, selected in TICKET_PROJECTIONS.items():
+        if set(columns) <= set(selected):
+            return projection
+    raise ValueError(f'Unknown ticket columns: {sorted(set(columns) - set(TICKET_COLUMNS))}')
+
+def ticket_filter_args(filters: dict) -> list:
+    """The filter arguments of a ticket list statement, None where unused."""
+    return [filters.get(name) for name in TICKET_FILTERS]
+
+def ticket_list(projection: str = 'summary', company: bool = False, search: bool = False,
+                sort: str = None, descending: bool = False, paged: bool = False, after: bool = True) -> str:
+    """Name of the ticket list statement for one query shape.
+
+    Arguments, in order: ``[company_id] [one per filter, in TICKET_FILTERS
+    order, see ticket_filter_args()] [search text] [cursor] [limit]``. The
+    cursor is the last ticket_id, or ``(sort value, ticket_id)`` for the other
+    sorts; pages without one (``after=False``) start from the beginning. With
+    a search, rows carry a ``rank`` column and the default sort is by rank.
+    Only the projection, company scope, search, sort and paging make a shape,
+    so there are fewer than 200 of these statements, each registered on first
+    use.
+    """
+    columns = TICKET_PROJECTIONS[projection]
+    if search and sort is None:
+        sort, descending = 'rank', True
+    if paged and sort is None:
+        sort = 'ticket_id'
+    if sort == 'rank' and not search:
+        raise ValueError('sort by rank needs a search')
+    parts = ['tickets'] + (['by_company'] if company else []) + [projection]
+    if search:
+        parts.append('search')
+    if sort and not (paged and sort == 'ticket_id' and not descending):
+        parts.append(f"sort_{'desc_' if descending else ''}{sort}")
+    if paged:
+        parts.append('page' if after else 'first_page')
+    name = '_'.join(parts)
+    if name in QUERIES:
+        return name
+
+    conditions, n = [], 0
+    def arg() -> str:
+        nonlocal n
+        n += 1
+        return f'${n}'
+    if company:
+        conditions.append(f'company_id = {arg()}')
+    for template in TICKET_FILTERS.values():
+        conditions.append(template.format(arg()))
+    select = list(columns)
+    if search:
+        tsquery = f"websearch_to_tsquery('{TICKET_SEARCH_CONFIG}', {arg()})"
+        conditions.append(f'search_vector @@ {tsquery}')
+        select.append(f'ts_rank(search_vector, {tsquery}) AS rank')
+    sort_expr = f'ts_rank(search_vector, {tsquery})' if sort == 'rank' else sort
+    direction = ' DESC' if descending else ''
+    if paged and after:
+        op = '<' if descending else '>'
+        if sort == 'ticket_id':
+            conditions.append(f'ticket_id {op} {arg()}')
+        else:
+            conditions.append(f'({sort_expr}, ticket_id) {op} ({arg()}, {arg()})')
+    sql = f"SELECT {', '.join(select)} FROM tickets WHERE " + ' AND '.join(conditions)
+    if sort == 'ticket_id':
+        sql += f' ORDER BY ticket_id{direction}'
+    elif sort:
+        sql += f' ORDER BY {sort_expr}{direction}, ticket_id{direction}'
+    if paged:
+        sql += f' LIMIT {arg()}'
+    return register(name, sql)
+
+# The dashboard's company list in its default projection
+HOT_QUERIES += (ticket_list('summary', company=True),)
+
+def partial_update_args(fields: tuple, key, data: dict) -> list:
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ValueError(f'Unsupported update fields: {sorted(unknown)}')
+    return [list(data)] + [data.get(field) for field in fields] + [key]
+
+def statement_stats() -> dict:
+    first = sum(s['first_uses'] for s in _stats.values())
+    repeat = sum(s['repeat_uses'] for s in _stats.values())
+    return {
+        'connections': len(_used),
+        'statements_used': sum(len(seen) for seen in _used.values()),
+        'first_uses': first,
+        'repeat_uses': repeat,
+        'repeat_ratio': round(repeat / (first + repeat), 4) if first + repeat else None,
+        'statements': {name: dict(s) for name, s in _stats.items() if s['first_uses'] or s['repeat_uses']},
+    }
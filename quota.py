@@ -0,0 +1,42 @@
+import queries
+
+# customers.ticket_usage is the number of live tickets of a company. It is
+# changed only inside the transaction that inserts or deletes a ticket, so the
+# customer row lock taken by the conditional UPDATE serializes concurrent
+# submissions and the limit cannot be overshot.
+
+async def reserve_ticket(db, company_id: str):
+    """Take one ticket from the company's quota.
+
+    Must run inside the transaction that inserts the ticket. Returns the
+    company name, or None when the company is at its limit (or unknown).
+    """
+    return await queries.fetchval(db, 'customer_reserve_ticket', company_id)
+
+async def release_ticket(db, company_id: str):
+    """Give one ticket back; call in the transaction that deletes it."""
+    await queries.execute(db, 'customer_release_ticket', company_id)
+
+async def reconcile_company(conn, company_id: str):
+    """Repair ticket_usage for one company. Returns (recorded, actual) when it
+    had drifted, otherwise None."""
+    async with conn.transaction():
+        # Row lock first: creations and deletions for this company wait until
+        # we are done, so the count below cannot race with them
+        recorded = await queries.fetchval(conn, 'customer_lock_usage', company_id)
+        if recorded is None:
+            return None
+        actual = await queries.fetchval(conn, 'ticket_count_by_company', company_id)
+        if recorded == actual:
+            return None
+        await queries.execute(conn, 'customer_set_usage', actual, company_id)
+        return recorded, actual
+
+async def reconcile_all(conn) -> dict:
+    """Repair drift for every company, one short transaction per company."""
+    drift = {}
+    for row in await queries.fetch(conn, 'customer_ids'):
+        fixed = await reconcile_company(conn, row['company_id'])
+        if fixed:
+            drift[row['company_id']] = {'recorded': fixed[0], 'actual': fixed[1]}
+    return drift
@@ -1,27 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Response
 from pydantic import BaseModel
-from typing import List
-import asyncpg
-import os
+from typing import Dict, List, Optional
+from datetime import datetime
 import random
 import requests
+from database import get_db
+import queries
+import cache
+import purge
+from pagination import PageParams, page_params, fetch_page, stream_ndjson
+from fast_json import records_response
+from batch import BatchRequest, BatchResult, collect
 
 router = APIRouter()
 
-# Database connection
-async def get_db():
-    conn = await asyncpg.connect(
-        user=os.getenv('DB_USER', 'magna'),
-        password=os.getenv('DB_PASSWORD', 'M@gn@123'),
-        database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=int(os.getenv('DB_PORT', '5432'))
-    )
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
 # Models
 class Customer(BaseModel):
     company_id: str
@@ -31,6 +23,16 @@ class Customer(BaseModel):
     limit_ticket: int
     ticket_usage: int  # tambahkan field ini
 
+class PurgeStatus(BaseModel):
+    company_id: str
+    status: str
+    deleted: Dict[str, int]
+    attempts: int
+    last_error: Optional[str] = None
+    requested_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class CustomerCreate(BaseModel):
     company_name: str
     billing_account_id: str
@@ -41,16 +43,41 @@ class CustomerCreate(BaseModel):
 def generate_company_id() -> str:
     return f"COMP-{random.randint(10000, 99999)}"
 
+async def load_customer(db, company_id: str):
+    result = await queries.fetchrow(db, 'customer_by_id', company_id)
+    return dict(result) if result else None
+
+async def get_cached_customer(db, company_id: str):
+    """Customer row (dict) through the reference-data cache, or None"""
+    return await cache.customers.get_or_load(company_id, lambda: load_customer(db, company_id))
+
+async def get_cached_customers(db, company_ids: list) -> list:
+    """Customer rows (dicts) for the ids found, through the cache; the ids
+    not cached are loaded with one query."""
+    found, misses = [], []
+    for company_id in company_ids:
+        customer = cache.customers.get(company_id)
+        if customer is None:
+            misses.append(company_id)
+        else:
+            found.append(customer)
+    if misses:
+        generation = cache.customers.generation
+        for record in await queries.fetch(db, 'customers_by_ids', misses):
+            customer = dict(record)
+            cache.customers.set(customer['company_id'], customer, generation)
+            found.append(customer)
+    return found
+
 # Endpoints
 @router.post('/')
 async def create_customer(customer: CustomerCreate, background_tasks: BackgroundTasks, db=Depends(get_db)):
     try:
         company_id = generate_company_id()
-        query = '''
-            INSERT INTO customers (company_id, company_name, billing_account_id, maintenance, limit_ticket) 
-            VALUES ($1, $2, $3, $4, $5)
-        '''
-        await db.execute(query, company_id, customer.company_name, customer.billing_account_id, customer.maintenance, customer.limit_ticket)
+        result = await queries.execute(db, 'customer_insert', company_id, customer.company_name, customer.billing_account_id, customer.maintenance, customer.limit_ticket)
+        if result == 'INSERT 0 0':
+            # The id still belongs to a tenant being purged
+            raise HTTPException(status_code=409, detail='Company id is still being purged, try again')
         
         # Tambahkan background task untuk import project
         def import_projects(billing_account_id: str):
@@ -65,26 +92,39 @@ async def create_customer(customer: CustomerCreate, background_tasks: Background
         background_tasks.add_task(import_projects, customer.billing_account_id)
 
         return {'message': 'Customer created successfully', 'company_id': company_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to create customer: {str(e)}')
 
 @router.get('/', response_model=List[Customer])
-async def get_customers(db=Depends(get_db)):
+async def get_customers(response: Response, page: PageParams = Depends(page_params), db=Depends(get_db)):
     try:
-        query = 'SELECT company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage FROM customers'
-        results = await db.fetch(query)
-        return [dict(result) for result in results]
+        if page.stream:
+            return stream_ndjson('customers_all')
+        if page.limit:
+            results = await fetch_page(db, 'customers_page', 'company_id', page, response)
+        else:
+            results = await queries.fetch(db, 'customers_all')
+        return records_response(results, Customer, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get customers: {str(e)}')
 
+@router.post('/batch', response_model=BatchResult[Customer])
+async def get_customers_by_ids(body: BatchRequest, db=Depends(get_db)):
+    try:
+        ids = body.unique_ids()
+        return collect(ids, await get_cached_customers(db, ids), 'company_id')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get customers by ids: {str(e)}')
+
 @router.get('/{company_id}', response_model=Customer)
 async def get_customer(company_id: str, db=Depends(get_db)):
     try:
-        query = 'SELECT company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage FROM customers WHERE company_id = $1'
-        result = await db.fetchrow(query, company_id)
+        result = await get_cached_customer(db, company_id)
         if not result:
             raise HTTPException(status_code=404, detail='Customer not found')
-        return dict(result)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -93,14 +133,10 @@ async def get_customer(company_id: str, db=Depends(get_db)):
 @router.put('/{company_id}')
 async def update_customer(company_id: str, customer: CustomerCreate, db=Depends(get_db)):
     try:
-        query = '''
-            UPDATE customers 
-            SET company_name = $1, billing_account_id = $2, maintenance = $3, limit_ticket = $4 
-            WHERE company_id = $5
-        '''
-        result = await db.execute(query, customer.company_name, customer.billing_account_id, customer.maintenance, customer.limit_ticket, company_id)
+        result = await queries.execute(db, 'customer_update', customer.company_name, customer.billing_account_id, customer.maintenance, customer.limit_ticket, company_id)
         if result == 'UPDATE 0':
             raise HTTPException(status_code=404, detail='Customer not found')
+        await cache.invalidate(db, 'customers', company_id)
         return {'message': 'Customer updated successfully'}
     except HTTPException:
         raise
@@ -108,30 +144,40 @@ async def update_customer(company_id: str, customer: CustomerCreate, db=Depends(
         raise HTTPException(status_code=500, detail=f'Failed to update customer: {str(e)}')
 
 @router.delete('/{company_id}')
-async def delete_customer(company_id: str, db=Depends(get_db)):
+async def delete_customer(company_id: str, response: Response, background: bool = False, db=Depends(get_db)):
+    """Delete a customer with all its tickets, users, groups and projects.
+    Large tenants (or ``?background=true``) are purged in the background:
+    the customer is gone at once, its data in batches (202, see /purge)."""
     try:
-        # 1. Hapus comment ticket
-        await db.execute('DELETE FROM ticket_comments WHERE ticket_id IN (SELECT ticket_id FROM tickets WHERE company_id = $1)', company_id)
-        # 2. Hapus ticket
-        await db.execute('DELETE FROM tickets WHERE company_id = $1', company_id)
-        # 3. Hapus user_groups (relasi user ke group)
-        await db.execute('DELETE FROM user_groups WHERE id_user IN (SELECT id_user FROM users WHERE company_id = $1)', company_id)
-        # 4. Hapus user_projects (relasi user ke project)
-        await db.execute('DELETE FROM user_projects WHERE id_user IN (SELECT id_user FROM users WHERE company_id = $1)', company_id)
-        # 5. Hapus group_projects (relasi group ke project)
-        await db.execute('DELETE FROM group_projects WHERE group_id IN (SELECT group_id FROM groups WHERE company_id = $1)', company_id)
-        # 6. Hapus groups
-        await db.execute('DELETE FROM groups WHERE company_id = $1', company_id)
-        # 7. Hapus projects
-        await db.execute('DELETE FROM projects WHERE company_id = $1', company_id)
-        # 8. Hapus users
-        await db.execute('DELETE FROM users WHERE company_id = $1', company_id)
-        # 9. Hapus customer
-        result = await db.execute('DELETE FROM customers WHERE company_id = $1', company_id)
-        if result == 'DELETE 0':
+        customer = await load_customer(db, company_id)
+        if customer is None:
             raise HTTPException(status_code=404, detail='Customer not found')
+        background = background or customer['ticket_usage'] > purge.PURGE_SYNC_MAX_TICKETS
+        if background:
+            deleted = await purge.request(db, company_id)
+        else:
+            deleted = await purge.delete_now(db, company_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail='Customer not found')
+        await cache.invalidate_company(db, company_id)
+        if background:
+            response.status_code = 202
+            return {'message': 'Customer deleted; related data is being purged',
+                    'status_url': f'/api/customers/{company_id}/purge'}
         return {'message': 'Customer and all related data deleted successfully'}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to delete customer: {str(e)}')
+
+@router.get('/{company_id}/purge', response_model=PurgeStatus)
+async def get_purge_status(company_id: str, db=Depends(get_db)):
+    try:
+        result = await purge.status(db, company_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail='No purge for this customer')
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get purge status: {str(e)}')
@@ -1,27 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi import APIRouter, HTTPException, Depends, Body, Response
 from pydantic import BaseModel
 from typing import List
-import asyncpg
-import os
 import random
 import requests
+from database import get_db
+import queries
+import cache
+from pagination import PageParams, page_params, fetch_page, stream_ndjson
+from fast_json import records_response
+from batch import BatchRequest, BatchResult, collect
 
 router = APIRouter()
 
-# Database connection
-async def get_db():
-    conn = await asyncpg.connect(
-        user=os.getenv('DB_USER', 'magna'),
-        password=os.getenv('DB_PASSWORD', 'M@gn@123'),
-        database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=int(os.getenv('DB_PORT', '5432'))
-    )
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
 # Models
 class Project(BaseModel):
     project_id: str
@@ -45,13 +35,47 @@ class ProjectImportRequest(BaseModel):
 def generate_project_id() -> str:
     return f"PROJ-{random.randint(10000, 99999)}"
 
+# Helper function to compare billing projects with the stored ones
+def diff_projects(existing, incoming: List[str], company_id: str, billing_account_id: str) -> dict:
+    current = {row['project_id']: row for row in existing}
+    incoming_ids = set(incoming)
+    inserted, reassigned, unchanged = [], [], []
+    for project_id in incoming:
+        row = current.get(project_id)
+        if row is None:
+            inserted.append(project_id)
+        elif row['company_id'] != company_id or row['billing_account_id'] != billing_account_id:
+            reassigned.append(project_id)
+        else:
+            unchanged.append(project_id)
+    removed = [
+        project_id for project_id, row in current.items()
+        if project_id not in incoming_ids
+        and row['company_id'] == company_id and row['billing_account_id'] == billing_account_id
+    ]
+    return {'inserted': inserted, 'reassigned': reassigned, 'removed': removed, 'skipped_existing': unchanged}
+
+async def load_projects_by_company(db, company_id: str):
+    return [dict(result) for result in await queries.fetch(db, 'projects_by_company', company_id)]
+
+async def load_user_projects(db, id_user: str):
+    return [dict(result) for result in await queries.fetch(db, 'user_projects_with_billing', id_user)]
+
 # Endpoints
+# Declared before POST /{billing_account_id}, which would otherwise match it
+@router.post('/batch', response_model=BatchResult[Project])
+async def get_projects_by_ids(body: BatchRequest, db=Depends(get_db)):
+    try:
+        ids = body.unique_ids()
+        return collect(ids, await queries.fetch(db, 'projects_by_ids', ids), 'project_id')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get projects by ids: {str(e)}')
+
 @router.post('/{billing_account_id}')
 async def import_projects_from_billing(billing_account_id: str, db=Depends(get_db)):
     try:
         # Cari company_id berdasarkan billing_account_id
-        company_query = 'SELECT company_id FROM customers WHERE billing_account_id = $1'
-        company = await db.fetchrow(company_query, billing_account_id)
+        company = await queries.fetchrow(db, 'customer_by_billing_account', billing_account_id)
         if not company:
             raise HTTPException(status_code=404, detail='Company not found for this billing_account_id')
         company_id = company['company_id']
@@ -67,26 +91,28 @@ async def import_projects_from_billing(billing_account_id: str, db=Depends(get_d
         projects = data.get('projects data', [])
         if not projects:
             raise HTTPException(status_code=404, detail='No projects found from external API')
-        inserted, skipped = [], []
-        for proj in projects:
-            project_id = proj.get('project_id')
-            if not project_id:
-                skipped.append('null_or_empty')
-                continue
-            # Cek apakah sudah ada
-            exists = await db.fetchrow('SELECT 1 FROM projects WHERE project_id = $1', project_id)
-            if exists:
-                skipped.append(project_id)
-                continue
-            query = '''
-                INSERT INTO projects (project_id, company_id, billing_account_id)
-                VALUES ($1, $2, $3)
-            '''
-            await db.execute(query, project_id, company_id, billing_account_id)
-            inserted.append(project_id)
+        incoming = list(dict.fromkeys(proj.get('project_id') for proj in projects if proj.get('project_id')))
+        unlinked = []
+        async with db.transaction():
+            existing = await queries.fetch(db, 'projects_for_import', incoming, company_id, billing_account_id)
+            diff = diff_projects(existing, incoming, company_id, billing_account_id)
+            if diff['inserted']:
+                await queries.execute(db, 'projects_insert_many', diff['inserted'], company_id, billing_account_id)
+            if diff['reassigned']:
+                await queries.execute(db, 'projects_reassign_many', diff['reassigned'], company_id, billing_account_id)
+            if diff['removed']:
+                # Project sudah tidak ada di billing account: cabut juga aksesnya
+                unlinked = await queries.fetch(db, 'project_links_delete_user', diff['removed'])
+                await queries.execute(db, 'project_links_delete_group', diff['removed'])
+                await queries.execute(db, 'projects_delete_many', diff['removed'])
+        previous_owners = {row['company_id'] for row in existing if row['project_id'] in diff['reassigned']}
+        await cache.invalidate_many(db, {
+            'projects_by_company': [company_id, *previous_owners],
+            'user_projects': [record['id_user'] for record in unlinked],
+        })
         return {
-            'inserted': inserted,
-            'skipped_existing': skipped,
+            **diff,
+            'skipped_invalid': len(projects) - sum(1 for proj in projects if proj.get('project_id')),
             'company_id': company_id
         }
     except HTTPException:
@@ -95,19 +121,22 @@ async def import_projects_from_billing(billing_account_id: str, db=Depends(get_d
         raise HTTPException(status_code=500, detail=f'Failed to import projects: {str(e)}')
 
 @router.get('/', response_model=List[Project])
-async def get_projects(db=Depends(get_db)):
+async def get_projects(response: Response, page: PageParams = Depends(page_params), db=Depends(get_db)):
     try:
-        query = 'SELECT project_id, company_id, billing_account_id FROM projects'
-        results = await db.fetch(query)
-        return [dict(result) for result in results]
+        if page.stream:
+            return stream_ndjson('projects_all')
+        if page.limit:
+            results = await fetch_page(db, 'projects_page', 'project_id', page, response)
+        else:
+            results = await queries.fetch(db, 'projects_all')
+        return records_response(results, Project, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get projects: {str(e)}')
 
 @router.get('/{project_id}', response_model=Project)
 async def get_project(project_id: str, db=Depends(get_db)):
     try:
-        query = 'SELECT project_id, company_id, billing_account_id FROM projects WHERE project_id = $1'
-        result = await db.fetchrow(query, project_id)
+        result = await queries.fetchrow(db, 'project_by_id', project_id)
         if not result:
             raise HTTPException(status_code=404, detail='Project not found')
         return dict(result)
@@ -121,16 +150,14 @@ async def get_projects_by_company_id(company_id: str, db=Depends(get_db)):
     try:
         # Logika khusus untuk company COMP-73655 - mendapatkan semua project
         if company_id == "COMP-73655":
-            query = 'SELECT project_id, company_id, billing_account_id FROM projects'
-            results = await db.fetch(query)
+            results = await queries.fetch(db, 'projects_all')
         else:
             # Logika normal untuk company lain - hanya project milik company tersebut
-            query = 'SELECT project_id, company_id, billing_account_id FROM projects WHERE company_id = $1'
-            results = await db.fetch(query, company_id)
+            results = await cache.projects_by_company.get_or_load(company_id, lambda: load_projects_by_company(db, company_id))
         
         if not results:
             raise HTTPException(status_code=404, detail='No projects found for this company')
-        return [dict(result) for result in results]
+        return records_response(results, Project)
     except HTTPException:
         raise
     except Exception as e:
@@ -139,19 +166,14 @@ async def get_projects_by_company_id(company_id: str, db=Depends(get_db)):
 @router.put('/{project_id}')
 async def update_project(project_id: str, project: ProjectCreate, db=Depends(get_db)):
     try:
-        company_query = 'SELECT billing_account_id FROM customers WHERE company_id = $1'
-        company = await db.fetchrow(company_query, project.company_id)
+        company = await queries.fetchrow(db, 'customer_billing_account', project.company_id)
         if not company:
             raise HTTPException(status_code=404, detail='Company not found')
         billing_account_id = company['billing_account_id']
-        query = '''
-            UPDATE projects 
-            SET company_id = $1, billing_account_id = $2 
-            WHERE project_id = $3
-        '''
-        result = await db.execute(query, project.company_id, billing_account_id, project_id)
-        if result == 'UPDATE 0':
+        old_company_id = await queries.fetchval(db, 'project_update', project.company_id, billing_account_id, project_id)
+        if old_company_id is None:
             raise HTTPException(status_code=404, detail='Project not found')
+        await cache.invalidate(db, 'projects_by_company', old_company_id, project.company_id)
         return {'message': 'Project updated successfully'}
     except HTTPException:
         raise
@@ -161,10 +183,16 @@ async def update_project(project_id: str, project: ProjectCreate, db=Depends(get
 @router.delete('/{project_id}')
 async def delete_project(project_id: str, db=Depends(get_db)):
     try:
-        query = 'DELETE FROM projects WHERE project_id = $1'
-        result = await db.execute(query, project_id)
-        if result == 'DELETE 0':
-            raise HTTPException(status_code=404, detail='Project not found')
+        async with db.transaction():
+            # Cascade juga menghapus user_projects; ambil id_user dulu untuk invalidasi cache
+            unlinked = await queries.fetch(db, 'project_links_delete_user', [project_id])
+            company_id = await queries.fetchval(db, 'project_delete', project_id)
+            if company_id is None:
+                raise HTTPException(status_code=404, detail='Project not found')
+        await cache.invalidate_many(db, {
+            'projects_by_company': [company_id],
+            'user_projects': [record['id_user'] for record in unlinked],
+        })
         return {'message': 'Project deleted successfully'}
     except HTTPException:
         raise
@@ -174,12 +202,7 @@ async def delete_project(project_id: str, db=Depends(get_db)):
 @router.get('/group/{group_id}/projects', response_model=List[str])
 async def get_projects_by_group(group_id: str, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT project_id
-            FROM group_projects
-            WHERE group_id = $1
-        '''
-        results = await db.fetch(query, group_id)
+        results = await queries.fetch(db, 'group_project_ids', group_id)
         return [record['project_id'] for record in results]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get projects by group: {str(e)}')
@@ -187,8 +210,7 @@ async def get_projects_by_group(group_id: str, db=Depends(get_db)):
 @router.get('/user/{id_user}/projects', response_model=List[str])
 async def get_projects_for_user(id_user: str, db=Depends(get_db)):
     try:
-        query = 'SELECT project_id FROM user_projects WHERE id_user = $1'
-        results = await db.fetch(query, id_user)
+        results = await cache.user_projects.get_or_load(id_user, lambda: load_user_projects(db, id_user))
         return [row['project_id'] for row in results]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get projects for user: {str(e)}')
\ No newline at end of file
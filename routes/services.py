@@ -1,39 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List
-import asyncpg
-import os
+from database import get_db
+import queries
+import cache
 
 router = APIRouter()
 
-# Database connection
-async def get_db():
-    conn = await asyncpg.connect(
-        user=os.getenv('DB_USER', 'magna'),
-        password=os.getenv('DB_PASSWORD', 'M@gn@123'),
-        database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=int(os.getenv('DB_PORT', '5432'))
-    )
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
 # Models
 class Service(BaseModel):
     id: int
     service_name: str
 
+async def load_services(db):
+    return [dict(result) for result in await queries.fetch(db, 'services_all')]
+
+async def load_service(db, service_id: int):
+    result = await queries.fetchrow(db, 'service_by_id', service_id)
+    return dict(result) if result else None
+
 # Endpoints
 @router.get('/', response_model=List[Service])
 async def get_services(db=Depends(get_db)):
     try:
-        query = 'SELECT id, service_name FROM services'
-        results = await db.fetch(query)
+        results = await cache.services.get_or_load('all', lambda: load_services(db))
         if not results:
             raise HTTPException(status_code=404, detail="No services found")
-        return [dict(result) for result in results]
+        return results
     except HTTPException:
         raise
     except Exception as e:
@@ -42,11 +35,10 @@ async def get_services(db=Depends(get_db)):
 @router.get('/{service_id}', response_model=Service)
 async def get_service(service_id: int, db=Depends(get_db)):
     try:
-        query = 'SELECT id, service_name FROM services WHERE id = $1'
-        result = await db.fetchrow(query, service_id)
+        result = await cache.services.get_or_load(service_id, lambda: load_service(db, service_id))
         if not result:
             raise HTTPException(status_code=404, detail='Service not found')
-        return dict(result)
+        return result
     except HTTPException:
         raise
     except Exception as e:
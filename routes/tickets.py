@@ -1,33 +1,30 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
-from google.cloud import storage
-from pydantic import BaseModel
-from typing import List, Optional
-import asyncpg
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 import os
 import random
+import asyncpg
 import json
-from datetime import datetime, timedelta
-from email.message import EmailMessage
-import aiosmtplib
+from datetime import date, datetime, timedelta, timezone
 from jinja2 import Environment, FileSystemLoader
-import aiohttp
+from database import get_db
+import queries
+import quota
+import file_storage
+import mailer
+import cache
+import events
+import ticket_stats
+from routes.customers import get_cached_customer
+from security import AuthUser, bearer_or_scoped_user, create_scoped_token, current_user
+from pagination import MAX_BATCH_IDS, NEXT_CURSOR_HEADER, PageParams, encode_cursor, sorted_page_params, stream_ndjson
+from etags import make_etag, not_modified
+from fast_json import records_response
+from batch import BatchRequest, BatchResult, collect
 
 router = APIRouter()
 
-# Database connection
-async def get_db():
-    conn = await asyncpg.connect(
-        user=os.getenv('DB_USER', 'magna'),
-        password=os.getenv('DB_PASSWORD', 'M@gn@123'),
-        database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=int(os.getenv('DB_PORT', '5432'))
-    )
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
 # Models
 class Ticket(BaseModel):
     ticket_id: str
@@ -42,6 +39,56 @@ class Ticket(BaseModel):
     id_user: str
     status: str
     created_at: Optional[datetime]
+    updated_at: Optional[datetime] = None
+
+# Shape of a ticket list row with ``fields=``: only the requested columns
+class TicketFields(BaseModel):
+    ticket_id: str
+    product_list: Optional[str] = None
+    describe_issue: Optional[str] = None
+    detail_issue: Optional[str] = None
+    priority: Optional[str] = None
+    contact: Optional[str] = None
+    company_id: Optional[str] = None
+    company_name: Optional[str] = None
+    attachment: Optional[str] = None
+    id_user: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    # Search relevance, with q=
+    rank: Optional[float] = None
+
+class DailyCount(BaseModel):
+    day: date
+    total: int
+
+# Dashboard counts; company_id is None for the all-companies view
+class TicketStats(BaseModel):
+    company_id: Optional[str]
+    total: int
+    status: Dict[str, int]
+    priority: Dict[str, int]
+    product: Dict[str, int]
+    daily: List[DailyCount]
+
+class StreamToken(BaseModel):
+    token: str
+    expires_in: int
+
+class LatestComment(BaseModel):
+    id: int
+    comment: str
+    full_name: Optional[str]
+    timestamp: datetime
+
+class CommentSummary(BaseModel):
+    ticket_id: str
+    total: int
+    latest: Optional[LatestComment]
+
+class TicketIds(BaseModel):
+    ticket_ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_IDS)
 
 class TicketCreate(BaseModel):
     product_list: str
@@ -66,57 +113,116 @@ def generate_ticket_id() -> str:
     random_string = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=6))
     return f"TICKET-{timestamp}-{random_string}"
 
-GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', 'magnasight-attachment')
-
-def upload_file_to_gcs(file: UploadFile, destination_blob_name: str) -> str:
-    client = storage.Client()
-    bucket = client.bucket(GCS_BUCKET_NAME)
-    blob = bucket.blob(destination_blob_name)
-
-    # Upload file ke GCS
-    blob.upload_from_file(file.file, content_type=file.content_type)
-
-    # Return public URL (karena bucket sudah public)
-    url = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/{destination_blob_name}"
-    return url
-
-# Email configuration
-ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@email.com")  # set di .env atau environment
-
-async def send_ticket_email(to_email: str, subject: str, content: str, is_html: bool = False, attachment_url: str = None):
-    message = EmailMessage()
-    message["From"] = ADMIN_EMAIL
-    message["To"] = to_email
-    message["Subject"] = subject
-    if is_html:
-        message.set_content("New ticket created")  # fallback plain text
-        message.add_alternative(content, subtype="html")
-    else:
-        message.set_content(content)
-
-    # Jika ada attachment_url, download dan attach ke email
-    if attachment_url:
-        filename = attachment_url.split("/")[-1].split("?")[0]
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(attachment_url) as resp:
-                    if resp.status == 200:
-                        file_bytes = await resp.read()
-                        maintype, subtype = 'application', 'octet-stream'
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                            maintype, subtype = 'image', filename.split('.')[-1].lower()
-                        message.add_attachment(file_bytes, maintype=maintype, subtype=subtype, filename=filename)
-        except Exception:
-            pass  # Jika gagal download attachment, email tetap dikirim tanpa attachment
-
-    await aiosmtplib.send(
-        message,
-        hostname=os.getenv("SMTP_HOST", "smtp.gmail.com"),
-        port=int(os.getenv("SMTP_PORT", 587)),
-        username=os.getenv("SMTP_USER"),
-        password=os.getenv("SMTP_PASS"),
-        start_tls=True,
+def ticket_fields(
+    fields: Optional[str] = Query(
+        None, description="Comma separated ticket columns, or 'all'. Defaults to ticket_id, describe_issue, status, priority and created_at."
+    ),
+) -> tuple:
+    """Dependency: the columns a ticket list route selects."""
+    if not fields:
+        return queries.TICKET_SUMMARY_COLUMNS
+    if fields == 'all':
+        return queries.TICKET_COLUMNS
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - set(queries.TICKET_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f'Unknown ticket fields: {sorted(unknown)}')
+    # ticket_id is the pagination key
+    return tuple(column for column in queries.TICKET_COLUMNS if column in requested or column == 'ticket_id')
+
+class TicketQuery(BaseModel):
+    status: Optional[List[str]] = None
+    priority: Optional[List[str]] = None
+    product_list: Optional[List[str]] = None
+    contact: Optional[List[str]] = None
+    id_user: Optional[List[str]] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    q: Optional[str] = None
+    sort: Optional[str] = None
+    descending: bool = False
+
+    def filters(self) -> dict:
+        return {name: getattr(self, name) for name in queries.TICKET_FILTERS if getattr(self, name) is not None}
+
+def ticket_query(
+    status: Optional[List[str]] = Query(None),
+    priority: Optional[List[str]] = Query(None),
+    product_list: Optional[List[str]] = Query(None),
+    contact: Optional[List[str]] = Query(None),
+    # Not named id_user: /user/{id_user} has a path parameter of that name
+    user_ids: Optional[List[str]] = Query(None, alias='id_user'),
+    created_from: Optional[datetime] = Query(None, description='created_at >= this'),
+    created_to: Optional[datetime] = Query(None, description='created_at < this'),
+    q: Optional[str] = Query(None, max_length=200, description='Full-text search in subject and description'),
+    sort: Optional[str] = Query(
+        None, description="ticket_id, created_at, updated_at or rank (with q); prefix '-' for descending"
+    ),
+) -> TicketQuery:
+    """Dependency: filters, search and sort order of a ticket list."""
+    descending = bool(sort) and sort.startswith('-')
+    key = sort.lstrip('-') if sort else None
+    if key is not None and key not in queries.TICKET_SORTS:
+        raise HTTPException(status_code=400, detail=f'Unsupported sort: {sort}')
+    q = q.strip() if q else None
+    # created_at is a timestamp without time zone, in the database time zone (UTC)
+    created_from, created_to = (
+        value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value
+        for value in (created_from, created_to)
     )
+    if key == 'rank' and not q:
+        raise HTTPException(status_code=400, detail='sort=rank needs q')
+    return TicketQuery(status=status, priority=priority, product_list=product_list, contact=contact, id_user=user_ids,
+                       created_from=created_from, created_to=created_to, q=q or None, sort=key, descending=descending)
+
+def _cursor_args(page: PageParams, sort: str) -> list:
+    if sort == 'ticket_id':
+        if not isinstance(page.after, str):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+        return [page.after]
+    if not isinstance(page.after, list) or not isinstance(page.after[1], str):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    value, ticket_id = page.after
+    try:
+        value = float(value) if sort == 'rank' else datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return [value, ticket_id]
+
+def _next_cursor(record, sort: str):
+    if sort == 'ticket_id':
+        return record['ticket_id']
+    value = record[sort]
+    return [value.isoformat() if isinstance(value, datetime) else value, record['ticket_id']]
+
+async def list_tickets(db, page: PageParams, response: Response, columns: tuple, query: TicketQuery, company_id: str = None):
+    """All tickets, or one company's, filtered, searched and sorted as
+    ``query`` says, with only ``columns`` (and rank with a search) in each row."""
+    company = company_id is not None
+    search = query.q is not None
+    output = columns + (('rank',) if search else ())
+    shape = dict(company=company, search=search, sort=query.sort, descending=query.descending)
+    args = ([company_id] if company else []) + queries.ticket_filter_args(query.filters()) + ([query.q] if search else [])
+    if page.stream:
+        return stream_ndjson(queries.ticket_list(queries.ticket_projection(columns), **shape), *args, columns=output)
+    if not page.limit:
+        results = await queries.fetch(db, queries.ticket_list(queries.ticket_projection(columns), **shape), *args)
+        return records_response(results, response=response, columns=output)
+
+    sort = query.sort or ('rank' if search else 'ticket_id')
+    # The cursor is built from the last row's sort value, selected even when
+    # the client did not ask for it
+    projection = queries.ticket_projection(columns + ((sort,) if sort in queries.TICKET_COLUMNS else ()))
+    if page.after is None:
+        name = queries.ticket_list(projection, paged=True, after=False, **shape)
+    else:
+        name = queries.ticket_list(projection, paged=True, **shape)
+        args += _cursor_args(page, sort)
+    results = await queries.fetch(db, name, *args, page.limit + 1)
+    if len(results) > page.limit:
+        results = results[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(_next_cursor(results[-1], sort))
+    return records_response(results, response=response, columns=output)
 
 # Setup Jinja2 environment (letakkan di awal file)
 template_env = Environment(loader=FileSystemLoader('templates'))
@@ -132,47 +238,46 @@ def build_ticket_close_email_html(**context):
 # Endpoints
 @router.post('/', response_model=Ticket)
 async def create_ticket(
-    background_tasks: BackgroundTasks,
     ticket: str = Form(...),
     attachment: UploadFile = File(None),
     db=Depends(get_db),
 ):
     try:
         ticket_data = TicketCreate(**json.loads(ticket))
-        company_query = 'SELECT company_name, limit_ticket FROM customers WHERE company_id = $1'
-        company = await db.fetchrow(company_query, ticket_data.company_id)
+        company = await get_cached_customer(db, ticket_data.company_id)
         if not company:
             raise HTTPException(status_code=404, detail='Company not found')
 
-        ticket_count_query = 'SELECT COUNT(*) FROM tickets WHERE company_id = $1'
-        ticket_count = await db.fetchval(ticket_count_query, ticket_data.company_id)
-        if ticket_count >= company['limit_ticket']:
+        # Cheap early reject before uploading (on cached usage); the reservation below is authoritative
+        if company['ticket_usage'] >= company['limit_ticket']:
             raise HTTPException(status_code=403, detail='Ticket limit reached for this company')
 
         ticket_id = generate_ticket_id()
         attachment_url = None
         if attachment:
             ext = os.path.splitext(attachment.filename)[1]
-            gcs_filename = f"tickets/{company['company_name']}/{ticket_id}{ext}"
-            attachment_url = upload_file_to_gcs(attachment, gcs_filename)
-
-        ticket_query = '''
-            INSERT INTO tickets (ticket_id, product_list, describe_issue, detail_issue, priority, contact, company_id, company_name, attachment, id_user, status) 
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-        '''
-        await db.execute(ticket_query, ticket_id, ticket_data.product_list, ticket_data.describe_issue, ticket_data.detail_issue, ticket_data.priority, ticket_data.contact, ticket_data.company_id, company['company_name'], attachment_url, ticket_data.id_user, 'Open')
-
-        update_usage_query = 'UPDATE customers SET ticket_usage = ticket_usage + 1 WHERE company_id = $1'
-        await db.execute(update_usage_query, ticket_data.company_id)
-
-        # Ambil data ticket yang baru saja dibuat, termasuk created_at
-        result = await db.fetchrow('SELECT * FROM tickets WHERE ticket_id = $1', ticket_id)
-
-        user_query = 'SELECT full_name FROM users WHERE id_user = $1'
-        user = await db.fetchrow(user_query, ticket_data.id_user)
+            object_name = f"tickets/{company['company_name']}/{ticket_id}{ext}"
+            attachment_url = await file_storage.upload(attachment, object_name)
+            # Keep the bytes for the notification emails instead of downloading them back
+            if file_storage.upload_size(attachment) <= mailer.MAIL_ATTACHMENT_MAX_BYTES:
+                await attachment.seek(0)
+                mailer.remember_attachment(attachment_url, await attachment.read())
+
+        # Reserve quota and insert atomically so parallel submissions cannot overshoot the limit
+        async with db.transaction():
+            if not await quota.reserve_ticket(db, ticket_data.company_id):
+                raise HTTPException(status_code=403, detail='Ticket limit reached for this company')
+            result = await queries.fetchrow(db, 'ticket_insert', ticket_id, ticket_data.product_list, ticket_data.describe_issue, ticket_data.detail_issue, ticket_data.priority, ticket_data.contact, ticket_data.company_id, company['company_name'], attachment_url, ticket_data.id_user, 'Open')
+            await events.publish(db, ticket_data.company_id, 'ticket.created', ticket_id, {
+                'status': result['status'], 'priority': result['priority'],
+                'product_list': result['product_list'], 'describe_issue': result['describe_issue'],
+            })
+        await cache.invalidate(db, 'customers', ticket_data.company_id)
+
+        user = await queries.fetchrow(db, 'user_full_name', ticket_data.id_user)
         user_name = user['full_name'] if user else ticket_data.id_user
 
-        # Kirim email di background
+        # Antrikan email notifikasi
         subject = f"[{ticket_id}] {ticket_data.describe_issue}"
         content = f"Ticket ID: {ticket_id}\nPriority: {ticket_data.priority}\nStatus: Open"
         html_content = build_ticket_email_html(
@@ -188,8 +293,8 @@ async def create_ticket(
             user_name=user_name
         )
 
-        background_tasks.add_task(send_ticket_email, ticket_data.contact, subject, html_content, True, attachment_url)
-        background_tasks.add_task(send_ticket_email, ADMIN_EMAIL, subject, content, False, attachment_url)
+        await mailer.enqueue(db, ticket_data.contact, subject, text="New ticket created", html=html_content, attachment_url=attachment_url, from_email=mailer.ADMIN_EMAIL)
+        await mailer.enqueue(db, mailer.ADMIN_EMAIL, subject, text=content, attachment_url=attachment_url, from_email=mailer.ADMIN_EMAIL)
 
         return dict(result)
     except HTTPException:
@@ -197,43 +302,129 @@ async def create_ticket(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to create ticket: {str(e)}')
 
-@router.get('/', response_model=List[Ticket])
-async def get_tickets(db=Depends(get_db)):
+@router.get('/', response_model=List[TicketFields], response_model_exclude_unset=True)
+async def get_tickets(response: Response, page: PageParams = Depends(sorted_page_params), columns: tuple = Depends(ticket_fields), query: TicketQuery = Depends(ticket_query), db=Depends(get_db)):
     try:
-        query = 'SELECT * FROM tickets'
-        results = await db.fetch(query)
-        return [dict(result) for result in results]
+        return await list_tickets(db, page, response, columns, query)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get tickets: {str(e)}')
 
-@router.get('/user/{id_user}', response_model=List[Ticket])
-async def get_tickets_by_user(id_user: str, db=Depends(get_db)):
+@router.get('/user/{id_user}', response_model=List[TicketFields], response_model_exclude_unset=True)
+async def get_tickets_by_user(id_user: str, response: Response, page: PageParams = Depends(sorted_page_params), columns: tuple = Depends(ticket_fields), query: TicketQuery = Depends(ticket_query), auth: AuthUser = Depends(current_user), db=Depends(get_db)):
     try:
-        user_query = 'SELECT role, company_id FROM users WHERE id_user = $1'
-        user = await db.fetchrow(user_query, id_user)
-        if not user:
-            raise HTTPException(status_code=404, detail='User not found')
-
-        if user['role'] == 'Admin':
-            query = 'SELECT * FROM tickets'
-            results = await db.fetch(query)
-        elif user['role'] in ['Customer Admin', 'Customer']:
-            query = 'SELECT * FROM tickets WHERE company_id = $1'
-            results = await db.fetch(query, user['company_id'])
+        # Scope comes from the token; only admins may look at another user's scope
+        if id_user == auth.id_user:
+            user = {'role': auth.role, 'company_id': auth.company_id}
+        elif auth.role == 'Admin':
+            user = await queries.fetchrow(db, 'user_role_company', id_user)
+            if not user:
+                raise HTTPException(status_code=404, detail='User not found')
         else:
             raise HTTPException(status_code=403, detail='Access denied')
 
-        return [dict(result) for result in results]
+        if user['role'] == 'Admin':
+            return await list_tickets(db, page, response, columns, query)
+        if user['role'] in ['Customer Admin', 'Customer']:
+            return await list_tickets(db, page, response, columns, query, user['company_id'])
+        raise HTTPException(status_code=403, detail='Access denied')
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get tickets by user: {str(e)}')
 
+@router.get('/stats', response_model=TicketStats)
+async def get_ticket_stats(
+    request: Request,
+    response: Response,
+    company_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=366, description='Days of per-day counts, today (UTC) included'),
+    auth: AuthUser = Depends(current_user),
+    db=Depends(get_db),
+):
+    try:
+        # Customers see their own company; admins any company, or all of them
+        if auth.role != 'Admin':
+            if company_id not in (None, auth.company_id) or not auth.company_id:
+                raise HTTPException(status_code=403, detail='Access denied')
+            company_id = auth.company_id
+        since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        if company_id is not None:
+            version = await queries.fetchval(db, 'company_ticket_version', company_id)
+            if version is None:
+                raise HTTPException(status_code=404, detail='Company not found')
+            cached = not_modified(request, response, make_etag('ticket_stats', company_id, version, since))
+            if cached:
+                return cached
+        return await ticket_stats.company_stats(db, company_id, since)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get ticket stats: {str(e)}')
+
+@router.post('/stream/token', response_model=StreamToken)
+async def create_stream_token(auth: AuthUser = Depends(current_user)):
+    """Token for opening /stream from a browser EventSource, which cannot
+    send an Authorization header: ``new EventSource('/api/tickets/stream?token=...')``.
+    It only opens streams, and only until it expires; an open stream is not
+    cut off then."""
+    token = create_scoped_token(auth, events.STREAM_TOKEN_SCOPE, timedelta(seconds=events.STREAM_TOKEN_SECONDS))
+    return {'token': token, 'expires_in': events.STREAM_TOKEN_SECONDS}
+
+@router.get('/stream')
+async def stream_ticket_events(
+    company_id: Optional[str] = None,
+    last_event_id: Optional[int] = Header(None, description='Resume after this event (sent by EventSource on reconnect)'),
+    resume_after: Optional[int] = Query(
+        None, alias='last_event_id', description='Resume after this event, for a new EventSource (the header wins)'
+    ),
+    auth: AuthUser = Depends(bearer_or_scoped_user(events.STREAM_TOKEN_SCOPE)),
+):
+    """Server-sent events: ticket.created, ticket.status_changed,
+    ticket.updated, ticket.deleted and comment.added for one company, or for
+    all companies (admins without company_id). 'reset' means events were
+    missed and the client should refetch its lists.
+
+    Authenticate with a bearer token, or from a browser EventSource with
+    ``?token=`` from POST /stream/token. EventSource reconnects by itself
+    with the same URL; once that token has expired the reconnect gets 401, and
+    the client opens a new EventSource with a fresh token and
+    ``&last_event_id=`` of the last event it saw."""
+    # Holds no pool connection while open; the events come from the worker's
+    # shared listener
+    if last_event_id is None:
+        last_event_id = resume_after
+    if auth.role != 'Admin':
+        if company_id not in (None, auth.company_id) or not auth.company_id:
+            raise HTTPException(status_code=403, detail='Access denied')
+        company_id = auth.company_id
+    if not events.EVENTS_ENABLED:
+        raise HTTPException(status_code=503, detail='Event stream is disabled')
+    return StreamingResponse(
+        events.stream(company_id, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@router.post('/batch', response_model=BatchResult[Ticket])
+async def get_tickets_by_ids(body: BatchRequest, db=Depends(get_db)):
+    try:
+        ids = body.unique_ids()
+        return collect(ids, await queries.fetch(db, 'tickets_by_ids', ids), 'ticket_id')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get tickets by ids: {str(e)}')
+
 @router.get('/{ticket_id}', response_model=Ticket)
-async def get_ticket(ticket_id: str, db=Depends(get_db)):
+async def get_ticket(ticket_id: str, request: Request, response: Response, db=Depends(get_db)):
     try:
-        query = 'SELECT * FROM tickets WHERE ticket_id = $1'
-        result = await db.fetchrow(query, ticket_id)
+        updated_at = await queries.fetchval(db, 'ticket_version', ticket_id)
+        if updated_at is None:
+            raise HTTPException(status_code=404, detail='Ticket not found')
+        cached = not_modified(request, response, make_etag('ticket', ticket_id, updated_at.isoformat()))
+        if cached:
+            return cached
+        result = await queries.fetchrow(db, 'ticket_by_id', ticket_id)
         if not result:
             raise HTTPException(status_code=404, detail='Ticket not found')
         return dict(result)
@@ -243,24 +434,27 @@ async def get_ticket(ticket_id: str, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=f'Failed to get ticket: {str(e)}')
 
 @router.put('/{ticket_id}')
-async def update_ticket(ticket_id: str, ticket: TicketUpdate, db=Depends(get_db), background_tasks: BackgroundTasks = None):
+async def update_ticket(ticket_id: str, ticket: TicketUpdate, db=Depends(get_db)):
     try:
         # Ambil data ticket sebelum update
-        old_ticket = await db.fetchrow('SELECT * FROM tickets WHERE ticket_id = $1', ticket_id)
-        query = '''
-            UPDATE tickets 
-            SET product_list = $1, describe_issue = $2, detail_issue = $3, priority = $4, contact = $5, status = $6 
-            WHERE ticket_id = $7
-        '''
-        result = await db.execute(query, ticket.product_list, ticket.describe_issue, ticket.detail_issue, ticket.priority, ticket.contact, ticket.status, ticket_id)
-        if result == 'UPDATE 0':
-            raise HTTPException(status_code=404, detail='Ticket not found')
-        # Ambil data ticket setelah update
-        updated_ticket = await db.fetchrow('SELECT * FROM tickets WHERE ticket_id = $1', ticket_id)
+        old_ticket = await queries.fetchrow(db, 'ticket_by_id', ticket_id)
+        async with db.transaction():
+            result = await queries.execute(db, 'ticket_update', ticket.product_list, ticket.describe_issue, ticket.detail_issue, ticket.priority, ticket.contact, ticket.status, ticket_id)
+            if result == 'UPDATE 0':
+                raise HTTPException(status_code=404, detail='Ticket not found')
+            # Ambil data ticket setelah update
+            updated_ticket = await queries.fetchrow(db, 'ticket_by_id', ticket_id)
+            if old_ticket and old_ticket['status'] != updated_ticket['status']:
+                await events.publish(db, updated_ticket['company_id'], 'ticket.status_changed', ticket_id, {
+                    'status': updated_ticket['status'], 'previous_status': old_ticket['status'],
+                })
+            else:
+                await events.publish(db, updated_ticket['company_id'], 'ticket.updated', ticket_id, {
+                    'status': updated_ticket['status'], 'priority': updated_ticket['priority'],
+                })
         # Jika status berubah menjadi Closed, kirim email notifikasi
         if old_ticket and old_ticket['status'] != 'Closed' and ticket.status == 'Closed':
-            user_query = 'SELECT full_name, email FROM users WHERE id_user = $1'
-            user = await db.fetchrow(user_query, updated_ticket['id_user'])
+            user = await queries.fetchrow(db, 'user_name_email', updated_ticket['id_user'])
             user_name = user['full_name'] if user else updated_ticket['id_user']
             to_email = user['email'] if user else updated_ticket['contact']
             subject = f"[{updated_ticket['ticket_id']}] {updated_ticket['describe_issue']}"
@@ -274,10 +468,7 @@ async def update_ticket(ticket_id: str, ticket: TicketUpdate, db=Depends(get_db)
                 closed_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 user_name=user_name
             )
-            if background_tasks:
-                background_tasks.add_task(send_ticket_email, to_email, subject, html_content, True, updated_ticket['attachment'])
-            else:
-                await send_ticket_email(to_email, subject, html_content, True, updated_ticket['attachment'])
+            await mailer.enqueue(db, to_email, subject, text="Ticket closed", html=html_content, attachment_url=updated_ticket["attachment"], from_email=mailer.ADMIN_EMAIL)
         return {'message': 'Ticket updated successfully'}
     except HTTPException:
         raise
@@ -287,13 +478,13 @@ async def update_ticket(ticket_id: str, ticket: TicketUpdate, db=Depends(get_db)
 @router.delete('/{ticket_id}')
 async def delete_ticket(ticket_id: str, db=Depends(get_db)):
     try:
-        delete_comments_query = 'DELETE FROM ticket_comments WHERE ticket_id = $1'
-        await db.execute(delete_comments_query, ticket_id)
-
-        delete_ticket_query = 'DELETE FROM tickets WHERE ticket_id = $1'
-        result = await db.execute(delete_ticket_query, ticket_id)
-        if result == 'DELETE 0':
-            raise HTTPException(status_code=404, detail='Ticket not found')
+        async with db.transaction():
+            company_id = await queries.fetchval(db, 'ticket_delete', ticket_id)
+            if company_id is None:
+                raise HTTPException(status_code=404, detail='Ticket not found')
+            await quota.release_ticket(db, company_id)
+            await events.publish(db, company_id, 'ticket.deleted', ticket_id)
+        await cache.invalidate(db, 'customers', company_id)
         return {'message': 'Ticket and related comments deleted successfully'}
     except HTTPException:
         raise
@@ -303,35 +494,86 @@ async def delete_ticket(ticket_id: str, db=Depends(get_db)):
 @router.post('/comment/{ticket_id}')
 async def add_comment(ticket_id: str, id_user: str, comment: str, db=Depends(get_db)):
     try:
-        query = 'INSERT INTO ticket_comments (ticket_id, id_user, comment) VALUES ($1, $2, $3)'
-        await db.execute(query, ticket_id, id_user, comment)
+        async with db.transaction():
+            added = await queries.fetchrow(db, 'comment_insert', ticket_id, id_user, comment)
+            await events.publish(db, added['company_id'], 'comment.added', ticket_id, {
+                'comment_id': added['id'], 'id_user': id_user,
+            })
         return {'message': 'Comment added successfully'}
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(status_code=404, detail='Ticket or user not found')
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to add comment: {str(e)}')
 
+def _comment_cursor(after) -> tuple:
+    # [timestamp, id] of the last comment on the previous page
+    try:
+        timestamp, comment_id = after
+        return datetime.fromisoformat(timestamp), int(comment_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
 @router.get('/comment/{ticket_id}')
-async def get_comments(ticket_id: str, db=Depends(get_db)):
+async def get_comments(ticket_id: str, request: Request, response: Response, page: PageParams = Depends(sorted_page_params), db=Depends(get_db)):
     try:
-        query = '''
-            SELECT tc.ticket_id, tc.comment, u.full_name, tc.timestamp
-            FROM ticket_comments tc
-            JOIN users u ON tc.id_user = u.id_user
-            WHERE tc.ticket_id = $1
-        '''
-        results = await db.fetch(query, ticket_id)
-        if not results:
+        # Comments are only inserted or deleted, so count plus newest id
+        # changes with every write
+        version = await queries.fetchrow(db, 'comments_version', ticket_id)
+        if version['total']:
+            # Each page is its own representation
+            cached = not_modified(request, response, make_etag('comments', ticket_id, version['total'], version['last_id'], request.url.query))
+            if cached:
+                return cached
+        if page.stream:
+            return stream_ndjson('comments_by_ticket', ticket_id)
+        # Oldest first; with `limit`, keyset pages by (timestamp, id)
+        if page.limit is None:
+            results = await queries.fetch(db, 'comments_by_ticket', ticket_id)
+        elif page.after is None:
+            results = await queries.fetch(db, 'comments_by_ticket_first_page', ticket_id, page.limit + 1)
+        else:
+            results = await queries.fetch(db, 'comments_by_ticket_page', ticket_id, *_comment_cursor(page.after), page.limit + 1)
+        if page.limit is not None and len(results) > page.limit:
+            results = results[:page.limit]
+            last = results[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([last['timestamp'].isoformat(), last['id']])
+        if not results and page.after is None:
             raise HTTPException(status_code=404, detail='No comments found')
-        return [dict(result) for result in results]
+        return records_response(results, response=response)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get comments: {str(e)}')
 
-@router.get('/company/{company_id}', response_model=List[Ticket])
-async def get_tickets_by_company(company_id: str, db=Depends(get_db)):
+# Comment counts and the newest comment for a whole ticket list in one query,
+# instead of one comment request per ticket
+@router.post('/comments/summary', response_model=List[CommentSummary])
+async def get_comment_summary(body: TicketIds, db=Depends(get_db)):
+    try:
+        results = await queries.fetch(db, 'comment_summary', list(dict.fromkeys(body.ticket_ids)))
+        return [{
+            'ticket_id': row['ticket_id'],
+            'total': row['total'],
+            'latest': None if row['id'] is None else {
+                'id': row['id'], 'comment': row['comment'], 'full_name': row['full_name'], 'timestamp': row['timestamp'],
+            },
+        } for row in results]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get comment summary: {str(e)}')
+
+@router.get('/company/{company_id}', response_model=List[TicketFields], response_model_exclude_unset=True)
+async def get_tickets_by_company(company_id: str, request: Request, response: Response, page: PageParams = Depends(sorted_page_params), columns: tuple = Depends(ticket_fields), query: TicketQuery = Depends(ticket_query), db=Depends(get_db)):
     try:
-        query = 'SELECT * FROM tickets WHERE company_id = $1'
-        results = await db.fetch(query, company_id)
-        return [dict(result) for result in results]
+        if page.stream:
+            return await list_tickets(db, page, response, columns, query, company_id)
+        version = await queries.fetchval(db, 'company_ticket_version', company_id)
+        if version is not None:
+            # Each page (limit/cursor) and projection is its own representation
+            cached = not_modified(request, response, make_etag('tickets', company_id, version, request.url.query))
+            if cached:
+                return cached
+        return await list_tickets(db, page, response, columns, query, company_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get tickets by company: {str(e)}')
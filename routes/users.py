@@ -1,25 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response, BackgroundTasks
 from pydantic import BaseModel, constr
 from typing import List, Optional
 import asyncpg
-import bcrypt
-import jwt
-import os
 import random
 import string
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from jinja2 import Environment, FileSystemLoader
-import firebase_admin
-from firebase_admin import credentials, auth
-import json
+import database
+from database import get_db
+import queries
+import mailer
+from routes.customers import get_cached_customer
+from routes.projects import load_user_projects
+import cache
+import passwords
+import security
+import firebase_tokens
+from pagination import PageParams, page_params, fetch_page, stream_ndjson
+from fast_json import records_response
+from batch import BatchRequest, BatchResult, collect
 
 router = APIRouter()
 
-SECRET_KEY = 'A1b2C3d4E5f6G7h8I9J0kLmNoPqRsTuVwXyZ1234567890!@#$%^&*()'
-
 # Setup Jinja2 environment for email templates
 template_env = Environment(loader=FileSystemLoader('templates'))
 
@@ -31,20 +33,6 @@ def build_reset_password_email_html(**context):
     template = template_env.get_template('reset_password_email.html')
     return template.render(**context)
 
-# Database connection
-async def get_db():
-    conn = await asyncpg.connect(
-        user=os.getenv('DB_USER', 'magna'),
-        password=os.getenv('DB_PASSWORD', 'M@gn@123'),
-        database=os.getenv('DB_NAME', 'support_ticket_db'),
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=int(os.getenv('DB_PORT', '5432'))
-    )
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
 # Models
 class User(BaseModel):
     id_user: str
@@ -112,186 +100,82 @@ def generate_unique_id(prefix: str) -> str:
     random_string = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     return f"{prefix}_{random_string}"
 
-# Initialize Firebase Admin
-def init_firebase():
-    try:
-        # Skip if already initialized
-        if firebase_admin._apps:
-            print("Firebase already initialized")
-            return True
-            
-        # Priority 1: Try to get Firebase config from JSON secret first
-        firebase_sa_json = os.getenv("FIREBASE_SA_JSON")
-        
-        if firebase_sa_json:
-            try:
-                # Parse JSON string to dict
-                firebase_config = json.loads(firebase_sa_json)
-                cred = credentials.Certificate(firebase_config)
-                firebase_admin.initialize_app(cred)
-                print(f"Firebase initialized successfully from JSON secret for project: {firebase_config.get('project_id')}")
-                return True
-            except json.JSONDecodeError as e:
-                print(f"Error parsing FIREBASE_SA_JSON: {e}")
-            except Exception as e:
-                print(f"Error initializing Firebase from JSON: {e}")
-        
-        # Priority 2: Fallback to individual environment variables
-        required_vars = [
-            "FIREBASE_TYPE", "FIREBASE_PROJECT_ID", "FIREBASE_PRIVATE_KEY_ID",
-            "FIREBASE_PRIVATE_KEY", "FIREBASE_CLIENT_EMAIL", "FIREBASE_CLIENT_ID"
-        ]
-        
-        missing_vars = [var for var in required_vars if not os.getenv(var)]
-        if missing_vars:
-            print(f"Firebase initialization skipped. Missing environment variables: {missing_vars}")
-            return False
-            
-        private_key = os.getenv("FIREBASE_PRIVATE_KEY")
-        if private_key:
-            private_key = private_key.replace('\\n', '\n')
-        
-        firebase_config = {
-            "type": os.getenv("FIREBASE_TYPE"),
-            "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-            "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-            "private_key": private_key,
-            "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-            "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-            "auth_uri": os.getenv("FIREBASE_AUTH_URI", "https://accounts.google.com/o/oauth2/auth"),
-            "token_uri": os.getenv("FIREBASE_TOKEN_URI", "https://oauth2.googleapis.com/token"),
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL")
-        }
-        
-        cred = credentials.Certificate(firebase_config)
-        firebase_admin.initialize_app(cred)
-        print(f"Firebase initialized successfully from environment variables for project: {firebase_config.get('project_id')}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to initialize Firebase: {e}")
-        return False
-
-# Initialize Firebase when module loads
-init_firebase()
-
 def generate_otp() -> str:
     """Generate 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
 
-async def send_verification_email(email: str, otp: str, full_name: str):
-    """Send verification email with OTP"""
-    try:
-        smtp_server = os.getenv('SMTP_HOST', 'smtp.gmail.com')
-        smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        smtp_username = os.getenv('SMTP_USER', 'support@dev.magnaglobal.id')
-        smtp_password = os.getenv('SMTP_PASS', 'oocdxcxzhmgcteqf')
-        
-        # Generate HTML content using template
-        html_content = build_verification_email_html(
-            user_name=full_name,
-            otp=otp
-        )
-        
-        msg = MIMEMultipart('alternative')
-        msg['From'] = smtp_username
-        msg['To'] = email
-        msg['Subject'] = f'Email Verification - {email}'
-        
-        # Plain text fallback
-        text_body = f"""
-        Hi {full_name},
-        
-        Thank you for registering! Please verify your email address using the OTP below:
-        
-        Verification Code: {otp}
-        
-        This code will expire in 10 minutes.
-        
-        Best regards,
-        Support Team
-        """
-        
-        text_part = MIMEText(text_body, 'plain')
-        html_part = MIMEText(html_content, 'html')
-        
-        msg.attach(text_part)
-        msg.attach(html_part)
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        server.send_message(msg)
-        server.quit()
-        
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        raise HTTPException(status_code=500, detail="Failed to send verification email")
+async def send_verification_email(db, email: str, otp: str, full_name: str):
+    """Queue verification email with OTP"""
+    # Generate HTML content using template
+    html_content = build_verification_email_html(
+        user_name=full_name,
+        otp=otp
+    )
+
+    # Plain text fallback
+    text_body = f"""
+    Hi {full_name},
+    
+    Thank you for registering! Please verify your email address using the OTP below:
+    
+    Verification Code: {otp}
+    
+    This code will expire in 10 minutes.
+    
+    Best regards,
+    Support Team
+    """
+
+    await mailer.enqueue(db, email, f'Email Verification - {email}', text=text_body, html=html_content)
+
+async def send_reset_password_email(db, email: str, otp: str, full_name: str):
+    """Queue reset password email with OTP"""
+    # Generate HTML content using template
+    html_content = build_reset_password_email_html(
+        user_name=full_name,
+        otp=otp
+    )
+
+    # Plain text fallback
+    text_body = f"""
+    Hi {full_name},
+    
+    You requested to reset your password. Please use the OTP below to reset your password:
+    
+    Reset Password Code: {otp}
+    
+    This code will expire in 10 minutes.
+    
+    If you didn't request this, please ignore this email.
+    
+    Best regards,
+    Support Team
+    """
 
-async def send_reset_password_email(email: str, otp: str, full_name: str):
-    """Send reset password email with OTP"""
+    await mailer.enqueue(db, email, f'Reset Password - {email}', text=text_body, html=html_content)
+
+async def rehash_password(id_user: str, password: str, old_hash: str):
+    """Re-hash a password whose bcrypt cost differs from the current policy"""
     try:
-        smtp_server = os.getenv('SMTP_HOST', 'smtp.gmail.com')
-        smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        smtp_username = os.getenv('SMTP_USER', 'support@dev.magnaglobal.id')
-        smtp_password = os.getenv('SMTP_PASS', 'oocdxcxzhmgcteqf')
-        
-        # Generate HTML content using template
-        html_content = build_reset_password_email_html(
-            user_name=full_name,
-            otp=otp
-        )
-        
-        msg = MIMEMultipart('alternative')
-        msg['From'] = smtp_username
-        msg['To'] = email
-        msg['Subject'] = f'Reset Password - {email}'
-        
-        # Plain text fallback
-        text_body = f"""
-        Hi {full_name},
-        
-        You requested to reset your password. Please use the OTP below to reset your password:
-        
-        Reset Password Code: {otp}
-        
-        This code will expire in 10 minutes.
-        
-        If you didn't request this, please ignore this email.
-        
-        Best regards,
-        Support Team
-        """
-        
-        text_part = MIMEText(text_body, 'plain')
-        html_part = MIMEText(html_content, 'html')
-        
-        msg.attach(text_part)
-        msg.attach(html_part)
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        server.send_message(msg)
-        server.quit()
-        
+        new_hash = await passwords.hash_password(password)
+        async with database.acquire() as conn:
+            await queries.execute(conn, 'user_rehash_password', new_hash, id_user, old_hash)
     except Exception as e:
-        print(f"Failed to send email: {e}")
-        raise HTTPException(status_code=500, detail="Failed to send reset password email")
+        print(f"Failed to rehash password for {id_user}: {e}")
 
 @router.post('/login')
-async def login(user: UserLogin, db=Depends(get_db)):
+async def login(user: UserLogin, background_tasks: BackgroundTasks, db=Depends(get_db)):
     try:
-        query = 'SELECT * FROM users WHERE username = $1'
-        result = await db.fetchrow(query, user.username)
+        result = await queries.fetchrow(db, 'user_by_username', user.username)
         if not result:
             raise HTTPException(status_code=401, detail='Invalid username or password')
             
         user_data = dict(result)
         
-        if not bcrypt.checkpw(user.password.encode('utf-8'), user_data['password'].encode('utf-8')):
+        if not await passwords.verify_password(user.password, user_data['password']):
             raise HTTPException(status_code=401, detail='Invalid username or password')
+        if passwords.needs_rehash(user_data['password']):
+            background_tasks.add_task(rehash_password, user_data['id_user'], user.password, user_data['password'])
             
         # Check if email is verified
         if not user_data.get('is_verified', False):
@@ -303,13 +187,7 @@ async def login(user: UserLogin, db=Depends(get_db)):
                 }
             )
             
-        expiration = datetime.utcnow() + timedelta(hours=1)
-        token = jwt.encode({
-            'id_user': user_data['id_user'],
-            'username': user_data['username'],
-            'role': user_data['role'],
-            'exp': expiration
-        }, SECRET_KEY, algorithm='HS256')
+        token = security.create_access_token(user_data, timedelta(hours=1))
         
         user_data['billing_account_id'] = user_data.pop('billing_account_id')
         return {
@@ -326,33 +204,28 @@ async def login(user: UserLogin, db=Depends(get_db)):
 async def register(user: UserCreate, db=Depends(get_db)):
     try:
         # Check username
-        username_check = await db.fetchrow('SELECT 1 FROM users WHERE username = $1', user.username)
+        username_check = await queries.fetchrow(db, 'user_username_exists', user.username)
         if username_check:
             raise HTTPException(status_code=400, detail='Username sudah digunakan')
             
         # Check email
-        email_check = await db.fetchrow('SELECT 1 FROM users WHERE email = $1', user.email)
+        email_check = await queries.fetchrow(db, 'user_email_exists', user.email)
         if email_check:
             raise HTTPException(status_code=400, detail='Email sudah digunakan')
             
         # Check phone number
-        phone_check = await db.fetchrow('SELECT 1 FROM users WHERE phone = $1', user.phone)
+        phone_check = await queries.fetchrow(db, 'user_phone_exists', user.phone)
         if phone_check:
             raise HTTPException(status_code=400, detail='Nomor telepon sudah digunakan')
             
         id_user = generate_unique_id('USER')
-        hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = await passwords.hash_password(user.password)
         
-        company_query = 'SELECT company_name, billing_account_id FROM customers WHERE company_id = $1'
-        company = await db.fetchrow(company_query, user.company_id)
+        company = await get_cached_customer(db, user.company_id)
         if not company:
             raise HTTPException(status_code=404, detail='Company not found')
         
-        user_query = '''
-            INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name, billing_account_id, email, phone, is_verified) 
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-        '''
-        await db.execute(user_query, id_user, user.role, user.full_name, user.username, hashed_password, 
+        await queries.execute(db, 'user_insert', id_user, user.role, user.full_name, user.username, hashed_password,
                         user.company_id, company['company_name'], company['billing_account_id'], 
                         user.email, user.phone, False)
         
@@ -369,23 +242,30 @@ async def register(user: UserCreate, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=f'Failed to register user: {str(e)}')
 
 @router.get('/', response_model=List[User])
-async def get_users(db=Depends(get_db)):
+async def get_users(response: Response, page: PageParams = Depends(page_params), db=Depends(get_db)):
     try:
-        query = 'SELECT id_user, role, full_name, username, company_id, company_name, billing_account_id, email, phone FROM users'
-        results = await db.fetch(query)
-        return [dict(result) for result in results]
+        if page.stream:
+            return stream_ndjson('users_all')
+        if page.limit:
+            results = await fetch_page(db, 'users_page', 'id_user', page, response)
+        else:
+            results = await queries.fetch(db, 'users_all')
+        return records_response(results, User, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get users: {str(e)}')
 
+@router.post('/batch', response_model=BatchResult[User])
+async def get_users_by_ids(body: BatchRequest, db=Depends(get_db)):
+    try:
+        ids = body.unique_ids()
+        return collect(ids, await queries.fetch(db, 'users_by_ids', ids), 'id_user')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to get users by ids: {str(e)}')
+
 @router.get('/{id_user}', response_model=User)
 async def get_user_by_id(id_user: str, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT id_user, role, full_name, username, company_id, company_name, billing_account_id, email, phone
-            FROM users
-            WHERE id_user = $1
-        '''
-        user = await db.fetchrow(query, id_user)
+        user = await queries.fetchrow(db, 'user_by_id', id_user)
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
         return dict(user)
@@ -397,15 +277,10 @@ async def get_user_by_id(id_user: str, db=Depends(get_db)):
 @router.get('/company/{company_id}', response_model=List[User])
 async def get_users_by_company_id(company_id: str, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT id_user, role, full_name, username, company_id, company_name, billing_account_id, email, phone 
-            FROM users 
-            WHERE company_id = $1
-        '''
-        results = await db.fetch(query, company_id)
+        results = await queries.fetch(db, 'users_by_company', company_id)
         if not results:
             raise HTTPException(status_code=404, detail='No users found for the given company ID')
-        return [dict(result) for result in results]
+        return records_response(results, User)
     except HTTPException:
         raise
     except Exception as e:
@@ -418,22 +293,21 @@ async def update_user(id_user: str, user: UserUpdate, db=Depends(get_db)):
         
         # Check username if being updated
         if 'username' in update_data:
-            username_check = await db.fetchrow('SELECT 1 FROM users WHERE username = $1 AND id_user != $2', update_data['username'], id_user)
+            username_check = await queries.fetchrow(db, 'user_username_taken', update_data['username'], id_user)
             if username_check:
                 raise HTTPException(status_code=400, detail='Username sudah digunakan')
                 
         # Check email if being updated
         if 'email' in update_data:
             # Get current email to compare
-            current_email_query = 'SELECT email FROM users WHERE id_user = $1'
-            current_user = await db.fetchrow(current_email_query, id_user)
+            current_user = await queries.fetchrow(db, 'user_email', id_user)
             
             if not current_user:
                 raise HTTPException(status_code=404, detail='User not found')
             
             # Check if email is actually being changed
             if current_user['email'] != update_data['email']:
-                email_check = await db.fetchrow('SELECT 1 FROM users WHERE email = $1 AND id_user != $2', update_data['email'], id_user)
+                email_check = await queries.fetchrow(db, 'user_email_taken', update_data['email'], id_user)
                 if email_check:
                     raise HTTPException(status_code=400, detail='Email sudah digunakan')
                 # Set user as unverified only when email is actually changed
@@ -443,18 +317,16 @@ async def update_user(id_user: str, user: UserUpdate, db=Depends(get_db)):
                 
         # Check phone if being updated
         if 'phone' in update_data:
-            phone_check = await db.fetchrow('SELECT 1 FROM users WHERE phone = $1 AND id_user != $2', update_data['phone'], id_user)
+            phone_check = await queries.fetchrow(db, 'user_phone_taken', update_data['phone'], id_user)
             if phone_check:
                 raise HTTPException(status_code=400, detail='Nomor telepon sudah digunakan')
         
         if 'password' in update_data and update_data['password']:
-            update_data['password'] = bcrypt.hashpw(update_data['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            update_data['password'] = await passwords.hash_password(update_data['password'])
         elif 'password' in update_data and not update_data['password']:
             del update_data['password']
-        set_clause = ', '.join([f"{key} = ${i+1}" for i, key in enumerate(update_data.keys())])
-        values = list(update_data.values()) + [id_user]
-        query = f"UPDATE users SET {set_clause} WHERE id_user = ${len(values)}"
-        result = await db.execute(query, *values)
+        values = queries.partial_update_args(queries.USER_UPDATE_FIELDS, id_user, update_data)
+        result = await queries.execute(db, 'user_update', *values)
         if result == 'UPDATE 0':
             raise HTTPException(status_code=404, detail='User not found')
         return {'message': 'User updated successfully'}
@@ -465,8 +337,7 @@ async def update_user(id_user: str, user: UserUpdate, db=Depends(get_db)):
 @router.delete('/project')
 async def remove_user_from_project(user_project: UserProject, db=Depends(get_db)):
     try:
-        check_query = 'SELECT on_group FROM user_projects WHERE id_user = $1 AND project_id = $2'
-        record = await db.fetchrow(check_query, user_project.id_user, user_project.project_id)
+        record = await queries.fetchrow(db, 'user_project_on_group', user_project.id_user, user_project.project_id)
         if not record:
             raise HTTPException(status_code=404, detail='User-project relation not found')
         if record['on_group']:
@@ -474,8 +345,8 @@ async def remove_user_from_project(user_project: UserProject, db=Depends(get_db)
                 status_code=403,
                 detail='User got access from group. Remove user from group to revoke access.'
             )
-        query = 'DELETE FROM user_projects WHERE id_user = $1 AND project_id = $2'
-        await db.execute(query, user_project.id_user, user_project.project_id)
+        await queries.execute(db, 'user_project_delete', user_project.id_user, user_project.project_id)
+        await cache.invalidate(db, 'user_projects', user_project.id_user)
         return {'message': 'User removed from project'}
     except HTTPException:
         raise
@@ -485,12 +356,10 @@ async def remove_user_from_project(user_project: UserProject, db=Depends(get_db)
 @router.delete('/{id_user}')
 async def delete_user(id_user: str, db=Depends(get_db)):
     try:
-        delete_comments_query = 'DELETE FROM ticket_comments WHERE id_user = $1'
-        await db.execute(delete_comments_query, id_user)
-        delete_user_query = 'DELETE FROM users WHERE id_user = $1'
-        result = await db.execute(delete_user_query, id_user)
+        result = await queries.execute(db, 'user_delete', id_user)
         if result == 'DELETE 0':
             raise HTTPException(status_code=404, detail='User not found')
+        await cache.invalidate(db, 'user_projects', id_user)
         return {'message': 'User and related comments deleted successfully'}
     except HTTPException:
         raise
@@ -500,34 +369,29 @@ async def delete_user(id_user: str, db=Depends(get_db)):
 @router.post('/project')
 async def add_user_to_project(user_project: UserProject, db=Depends(get_db)):
     try:
-        check_query = 'SELECT 1 FROM user_projects WHERE id_user = $1 AND project_id = $2'
-        exists = await db.fetchrow(check_query, user_project.id_user, user_project.project_id)
+        exists = await queries.fetchrow(db, 'user_project_exists', user_project.id_user, user_project.project_id)
         if exists:
             raise HTTPException(status_code=400, detail='User already assigned to this project')
         
         # Ambil billing_account_id dari tabel projects
-        project_query = 'SELECT billing_account_id FROM projects WHERE project_id = $1'
-        project = await db.fetchrow(project_query, user_project.project_id)
+        project = await queries.fetchrow(db, 'project_billing_account', user_project.project_id)
         if not project:
             raise HTTPException(status_code=404, detail='Project not found')
         
-        query = 'INSERT INTO user_projects (id_user, project_id, billing_id, on_group) VALUES ($1, $2, $3, $4)'
-        await db.execute(query, user_project.id_user, user_project.project_id, project['billing_account_id'], None)
+        await queries.execute(db, 'user_project_insert', user_project.id_user, user_project.project_id, project['billing_account_id'], None)
+        await cache.invalidate(db, 'user_projects', user_project.id_user)
         return {'message': 'User added to project'}
     except HTTPException:
         raise
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(status_code=404, detail='User not found')
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to add user to project: {str(e)}')
 
 @router.get('/project/{id_user}', response_model=List[UserProjectResponse])
 async def get_projects_for_user(id_user: str, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT up.project_id, up.billing_id 
-            FROM user_projects up 
-            WHERE up.id_user = $1
-        '''
-        results = await db.fetch(query, id_user)
+        results = await cache.user_projects.get_or_load(id_user, lambda: load_user_projects(db, id_user))
         return [{"project_id": row['project_id'], "billing_id": row['billing_id']} for row in results]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get projects for user: {str(e)}')
@@ -535,8 +399,7 @@ async def get_projects_for_user(id_user: str, db=Depends(get_db)):
 @router.get('/project/{project_id}', response_model=List[str])
 async def get_users_for_project(project_id: str, db=Depends(get_db)):
     try:
-        query = 'SELECT id_user FROM user_projects WHERE project_id = $1'
-        results = await db.fetch(query, project_id)
+        results = await queries.fetch(db, 'project_user_ids', project_id)
         return [row['id_user'] for row in results]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get users for project: {str(e)}')
@@ -544,8 +407,7 @@ async def get_users_for_project(project_id: str, db=Depends(get_db)):
 @router.post('/reset-password-request')
 async def reset_password_request(request: ResetPasswordRequest, db=Depends(get_db)):
     try:
-        query = 'SELECT id_user, full_name, is_verified FROM users WHERE email = $1'
-        user = await db.fetchrow(query, request.email)
+        user = await queries.fetchrow(db, 'user_otp_target', request.email)
         
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
@@ -557,15 +419,10 @@ async def reset_password_request(request: ResetPasswordRequest, db=Depends(get_d
         otp = generate_otp()
         expires = datetime.utcnow() + timedelta(minutes=10)
         
-        update_query = '''
-            UPDATE users 
-            SET verification_code = $1, verification_expires = $2 
-            WHERE email = $3
-        '''
-        await db.execute(update_query, otp, expires, request.email)
+        await queries.execute(db, 'user_set_verification_code', otp, expires, request.email)
         
-        # Send reset password email
-        await send_reset_password_email(request.email, otp, user['full_name'])
+        # Queue reset password email
+        await send_reset_password_email(db, request.email, otp, user['full_name'])
         
         return {'message': 'Reset password code sent to your email'}
         
@@ -577,12 +434,7 @@ async def reset_password_request(request: ResetPasswordRequest, db=Depends(get_d
 @router.post('/reset-password-confirm')
 async def reset_password_confirm(reset_data: ResetPasswordConfirm, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT id_user, verification_code, verification_expires, is_verified 
-            FROM users 
-            WHERE email = $1
-        '''
-        user = await db.fetchrow(query, reset_data.email)
+        user = await queries.fetchrow(db, 'user_verification_state', reset_data.email)
         
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
@@ -600,14 +452,9 @@ async def reset_password_confirm(reset_data: ResetPasswordConfirm, db=Depends(ge
             raise HTTPException(status_code=400, detail='Invalid reset password code')
             
         # Hash new password and update
-        hashed_password = bcrypt.hashpw(reset_data.new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = await passwords.hash_password(reset_data.new_password)
         
-        update_query = '''
-            UPDATE users 
-            SET password = $1, verification_code = NULL, verification_expires = NULL 
-            WHERE email = $2
-        '''
-        await db.execute(update_query, hashed_password, reset_data.email)
+        await queries.execute(db, 'user_reset_password', hashed_password, reset_data.email)
         
         return {'message': 'Password reset successfully. You can now login with your new password.'}
         
@@ -619,12 +466,7 @@ async def reset_password_confirm(reset_data: ResetPasswordConfirm, db=Depends(ge
 @router.post('/verify-email')
 async def verify_email(verification: UserVerification, db=Depends(get_db)):
     try:
-        query = '''
-            SELECT id_user, verification_code, verification_expires, is_verified 
-            FROM users 
-            WHERE email = $1
-        '''
-        user = await db.fetchrow(query, verification.email)
+        user = await queries.fetchrow(db, 'user_verification_state', verification.email)
         
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
@@ -639,12 +481,7 @@ async def verify_email(verification: UserVerification, db=Depends(get_db)):
             raise HTTPException(status_code=400, detail='Invalid verification code')
             
         # Update user as verified
-        update_query = '''
-            UPDATE users 
-            SET is_verified = TRUE, verification_code = NULL, verification_expires = NULL 
-            WHERE email = $1
-        '''
-        await db.execute(update_query, verification.email)
+        await queries.execute(db, 'user_confirm_email', verification.email)
         
         return {'message': 'Email verified successfully. You can now login.'}
         
@@ -656,8 +493,7 @@ async def verify_email(verification: UserVerification, db=Depends(get_db)):
 @router.post('/resend-verification')
 async def resend_verification(resend: ResendVerification, db=Depends(get_db)):
     try:
-        query = 'SELECT id_user, full_name, is_verified FROM users WHERE email = $1'
-        user = await db.fetchrow(query, resend.email)
+        user = await queries.fetchrow(db, 'user_otp_target', resend.email)
         
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
@@ -669,15 +505,10 @@ async def resend_verification(resend: ResendVerification, db=Depends(get_db)):
         otp = generate_otp()
         expires = datetime.utcnow() + timedelta(minutes=10)
         
-        update_query = '''
-            UPDATE users 
-            SET verification_code = $1, verification_expires = $2 
-            WHERE email = $3
-        '''
-        await db.execute(update_query, otp, expires, resend.email)
+        await queries.execute(db, 'user_set_verification_code', otp, expires, resend.email)
         
-        # Send verification email
-        await send_verification_email(resend.email, otp, user['full_name'])
+        # Queue verification email
+        await send_verification_email(db, resend.email, otp, user['full_name'])
         
         return {'message': 'Verification code resent successfully'}
         
@@ -689,8 +520,7 @@ async def resend_verification(resend: ResendVerification, db=Depends(get_db)):
 @router.post('/send-verification')
 async def send_verification_code(resend: ResendVerification, db=Depends(get_db)):
     try:
-        query = 'SELECT id_user, full_name, is_verified FROM users WHERE email = $1'
-        user = await db.fetchrow(query, resend.email)
+        user = await queries.fetchrow(db, 'user_otp_target', resend.email)
         
         if not user:
             raise HTTPException(status_code=404, detail='User not found')
@@ -702,15 +532,10 @@ async def send_verification_code(resend: ResendVerification, db=Depends(get_db))
         otp = generate_otp()
         expires = datetime.utcnow() + timedelta(minutes=10)
         
-        update_query = '''
-            UPDATE users 
-            SET verification_code = $1, verification_expires = $2 
-            WHERE email = $3
-        '''
-        await db.execute(update_query, otp, expires, resend.email)
+        await queries.execute(db, 'user_set_verification_code', otp, expires, resend.email)
         
-        # Send verification email
-        await send_verification_email(resend.email, otp, user['full_name'])
+        # Queue verification email
+        await send_verification_email(db, resend.email, otp, user['full_name'])
         
         return {'message': 'Verification code sent successfully'}
         
@@ -722,21 +547,16 @@ async def send_verification_code(resend: ResendVerification, db=Depends(get_db))
 @router.post('/google-signin')
 async def google_signin(request: GoogleSignInRequest, db=Depends(get_db)):
     try:
-        # Check if Firebase is initialized, try to initialize if not
-        if not firebase_admin._apps:
-            print("Firebase not initialized, attempting to initialize...")
-            if not init_firebase():
-                raise HTTPException(
-                    status_code=500, 
-                    detail="Firebase initialization failed. Please check FIREBASE_SA_JSON secret configuration."
-                )
-        
         # Verify Firebase token
         try:
-            decoded_token = auth.verify_id_token(request.firebase_token)
-        except Exception as e:
+            decoded_token = await firebase_tokens.verify_id_token(request.firebase_token)
+        except firebase_tokens.ExpiredIdToken:
+            raise HTTPException(status_code=401, detail='Firebase token expired')
+        except firebase_tokens.InvalidIdToken as e:
             print(f"Firebase token verification error: {e}")
             raise HTTPException(status_code=401, detail=f"Invalid Firebase token: {str(e)}")
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
             
         firebase_uid = decoded_token['uid']
         firebase_email = decoded_token.get('email')
@@ -746,8 +566,7 @@ async def google_signin(request: GoogleSignInRequest, db=Depends(get_db)):
             raise HTTPException(status_code=400, detail='Email not found in Google account')
         
         # Check if user exists in PostgreSQL database
-        query = 'SELECT * FROM users WHERE email = $1'
-        result = await db.fetchrow(query, firebase_email)
+        result = await queries.fetchrow(db, 'user_by_email', firebase_email)
         
         if not result:
             raise HTTPException(
@@ -764,19 +583,12 @@ async def google_signin(request: GoogleSignInRequest, db=Depends(get_db)):
         # Check if user is verified
         if not user_data.get('is_verified', False):
             # Auto-verify user for Google sign-in
-            update_query = 'UPDATE users SET is_verified = TRUE WHERE email = $1'
-            await db.execute(update_query, firebase_email)
+            await queries.execute(db, 'user_mark_verified', firebase_email)
             user_data['is_verified'] = True
         
         # Generate JWT token
-        expiration = datetime.utcnow() + timedelta(hours=24)  # Longer expiration for Google sign-in
-        token = jwt.encode({
-            'id_user': user_data['id_user'],
-            'username': user_data['username'],
-            'role': user_data['role'],
-            'firebase_uid': firebase_uid,
-            'exp': expiration
-        }, SECRET_KEY, algorithm='HS256')
+        # Longer expiration for Google sign-in
+        token = security.create_access_token(user_data, timedelta(hours=24), firebase_uid=firebase_uid)
         
         return {
             'message': 'Google Sign-in successful',
@@ -785,10 +597,6 @@ async def google_signin(request: GoogleSignInRequest, db=Depends(get_db)):
             'provider': 'google'
         }
         
-    except auth.InvalidIdTokenError:
-        raise HTTPException(status_code=401, detail='Invalid Firebase token')
-    except auth.ExpiredIdTokenError:
-        raise HTTPException(status_code=401, detail='Firebase token expired')
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,172 @@
+"""Query-plan regression check for the registered hot queries.
+
+Builds a scratch schema in the configured (local) database, applies every
+migration to it, seeds it with synthetic data, then runs ``EXPLAIN`` on the
+hot statements from ``queries.py`` with both custom and generic plans. Exits
+non-zero if any of them plans a sequential scan. The scratch schema is dropped
+afterwards, so existing tables are never touched.
+
+Usage (from the repository root, against a local Postgres)::
+
+    python -m scripts.check_query_plans
+"""
+import asyncio
+import json
+from datetime import date, datetime
+import sys
+import migrate
+import queries
+from pagination import MAX_BATCH_IDS
+from database import connect_to_db, close_db_connection
+
+SCHEMA = 'plan_check'
+
+# Rows in the tables batch lookups read (customers, users, projects). A batch
+# of MAX_BATCH_IDS ids must stay a small fraction of the table: against a few
+# thousand rows, fetching 500 of them by a sequential scan is the planner's
+# right choice and not a missing index, and would fail the check.
+LOOKUP_ROWS = 100_000
+
+SEED_SQL = f'''
+INSERT INTO customers (company_id, company_name, billing_account_id, maintenance, limit_ticket, ticket_usage)
+SELECT 'COMP-' || g, 'Company ' || g, 'BILL-' || g, 'Yes', 1000000, 0
+FROM generate_series(1, {LOOKUP_ROWS}) g;
+
+INSERT INTO users (id_user, role, full_name, username, password, company_id, company_name, billing_account_id, email, phone, is_verified)
+SELECT 'USER_' || g, 'Customer', 'User ' || g, 'user' || g, 'x', 'COMP-' || (g % 5000 + 1), 'Company', 'BILL',
+       'user' || g || '@example.com', '08' || g, TRUE
+FROM generate_series(1, {LOOKUP_ROWS}) g;
+
+INSERT INTO tickets (ticket_id, product_list, describe_issue, detail_issue, priority, contact, company_id, company_name, attachment, id_user, status)
+SELECT 'TICKET-' || lpad(g::text, 8, '0'), 'Compute Engine', 'Issue ' || g, repeat('detail ', 20),
+       (ARRAY['Low', 'Medium', 'High'])[g % 3 + 1], 'contact@example.com', 'COMP-' || (g % 5000 + 1), 'Company',
+       NULL, 'USER_' || (g % 20000 + 1), (ARRAY['Open', 'In Progress', 'Closed'])[g % 3 + 1]
+FROM generate_series(1, 100000) g;
+
+INSERT INTO ticket_comments (ticket_id, id_user, comment)
+SELECT 'TICKET-' || lpad((g % 100000 + 1)::text, 8, '0'), 'USER_' || (g % 20000 + 1), 'comment ' || g
+FROM generate_series(1, 200000) g;
+
+INSERT INTO groups (group_id, group_name, company_id)
+SELECT 'GRP-' || g, 'Group ' || g, 'COMP-' || (g % 5000 + 1)
+FROM generate_series(1, 2000) g;
+
+INSERT INTO user_groups (id_user, group_id)
+SELECT 'USER_' || g, 'GRP-' || (g % 2000 + 1)
+FROM generate_series(1, 20000) g;
+
+INSERT INTO projects (project_id, company_id, billing_account_id)
+SELECT 'PROJ-' || g, 'COMP-' || (g % 5000 + 1), 'BILL-' || (g % 5000 + 1)
+FROM generate_series(1, {LOOKUP_ROWS}) g;
+
+INSERT INTO group_projects (group_id, project_id)
+SELECT 'GRP-' || (g % 2000 + 1), 'PROJ-' || g
+FROM generate_series(1, 10000) g;
+
+INSERT INTO user_projects (id_user, project_id, billing_id, on_group)
+SELECT 'USER_' || (g % 20000 + 1), 'PROJ-' || ((g * 7) % 10000 + 1), 'BILL', NULL
+FROM generate_series(1, 50000) g
+ON CONFLICT DO NOTHING;
+
+ANALYZE;
+'''
+
+def _filters(**values) -> list:
+    return queries.ticket_filter_args(values)
+
+# Sample arguments for every statement whose plan is checked. All HOT_QUERIES
+# must appear here; the other entries are frequent lookups worth guarding too.
+SAMPLE_ARGS = {
+    'ticket_by_id': ('TICKET-00000042',),
+    queries.ticket_list(company=True): ('COMP-7', *_filters()),
+    queries.ticket_list(company=True, paged=True): ('COMP-7', *_filters(), '', 50),
+    queries.ticket_list(paged=True): (*_filters(), '', 50),
+    queries.ticket_list(company=True, sort='created_at', descending=True, paged=True,
+                        after=False): ('COMP-7', *_filters(status=['Open']), 50),
+    queries.ticket_list(company=True, sort='created_at', descending=True,
+                        paged=True): ('COMP-7', *_filters(), datetime(2030, 1, 1), 'TICKET-99999999', 50),
+    queries.ticket_list(sort='created_at', descending=True, paged=True, after=False): (*_filters(), 50),
+    queries.ticket_list(paged=True, after=False): (*_filters(id_user=['USER_42']), 50),
+    queries.ticket_list(company=True, search=True, paged=True, after=False): ('COMP-7', *_filters(), 'issue', 50),
+    'user_role_company': ('USER_42',),
+    'user_by_username': ('user42',),
+    'user_by_email': ('user42@example.com',),
+    'user_by_id': ('USER_42',),
+    'users_by_company': ('COMP-7',),
+    'user_email_exists': ('user42@example.com',),
+    'user_phone_exists': ('0842',),
+    'customer_by_id': ('COMP-7',),
+    'customer_by_billing_account': ('BILL-7',),
+    'comments_by_ticket': ('TICKET-00000042',),
+    'comments_by_ticket_page': ('TICKET-00000042', datetime(2024, 1, 1), 0, 50),
+    'comment_summary': ([f'TICKET-{n:08d}' for n in range(1, 51)],),
+    'ticket_version': ('TICKET-00000042',),
+    'company_ticket_version': ('COMP-7',),
+    'comments_version': ('TICKET-00000042',),
+    'ticket_stats_by_company': ('COMP-7',),
+    'ticket_daily_stats_by_company': ('COMP-7', date(2024, 1, 1)),
+    'user_project_exists': ('USER_42', 'PROJ-42'),
+    'user_projects_with_billing': ('USER_42',),
+    'project_user_ids': ('PROJ-42',),
+    'group_member_ids': ('GRP-7',),
+    'group_members_detail': ('GRP-7',),
+    'groups_for_user': ('USER_42',),
+    'groups_by_company': ('COMP-7',),
+    'group_project_ids': ('GRP-7',),
+    'projects_by_company': ('COMP-7',),
+    # Full batches, as large as the batch routes accept
+    'users_by_ids': ([f'USER_{n}' for n in range(1, MAX_BATCH_IDS + 1)],),
+    'tickets_by_ids': ([f'TICKET-{n:08d}' for n in range(1, MAX_BATCH_IDS + 1)],),
+    'customers_by_ids': ([f'COMP-{n}' for n in range(1, MAX_BATCH_IDS + 1)],),
+    'projects_by_ids': ([f'PROJ-{n}' for n in range(1, MAX_BATCH_IDS + 1)],),
+}
+
+def seq_scans(plan: dict) -> list:
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+async def explain(conn, name: str, args: tuple) -> list:
+    raw = await conn.fetchval('EXPLAIN (FORMAT JSON) ' + queries.QUERIES[name], *args)
+    plan = json.loads(raw) if isinstance(raw, str) else raw
+    return seq_scans(plan[0]['Plan'])
+
+async def main() -> int:
+    missing = [name for name in queries.HOT_QUERIES if name not in SAMPLE_ARGS]
+    if missing:
+        print(f'No sample arguments for hot queries: {missing}')
+        return 1
+
+    conn = await connect_to_db()
+    failures = []
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await conn.execute(f'CREATE SCHEMA {SCHEMA}')
+        await conn.execute(f'SET search_path TO {SCHEMA}')
+        await migrate.apply_migrations(conn)
+        print('Seeding plan-check data...')
+        await conn.execute(SEED_SQL)
+
+        for mode in ('force_custom_plan', 'force_generic_plan'):
+            await conn.execute(f'SET plan_cache_mode = {mode}')
+            for name, args in SAMPLE_ARGS.items():
+                scans = await explain(conn, name, args)
+                status = 'SEQ SCAN on ' + ', '.join(scans) if scans else 'ok'
+                print(f'{mode:20} {name:30} {status}')
+                if scans:
+                    failures.append((mode, name, scans))
+    finally:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await close_db_connection(conn)
+
+    if failures:
+        print(f'{len(failures)} plan(s) regressed to a sequential scan')
+        return 1
+    print('All checked plans use indexes')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
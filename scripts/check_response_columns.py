@@ -0,0 +1,64 @@
+"""Response-model coverage check for the list and lookup statements.
+
+Routes that return rows through ``fast_json.records_response`` (or the batch
+``collect``) skip pydantic validation, so a field of the response model that
+the statement does not select is written with the field's default instead of
+failing. This check prepares every statement below in a scratch schema with
+all migrations applied and exits non-zero if its result columns do not cover
+every field of the route's response model.
+
+Usage (from the repository root, against a local Postgres)::
+
+    python -m scripts.check_response_columns
+"""
+import asyncio
+import sys
+import migrate
+import queries
+from database import connect_to_db, close_db_connection
+from routes.customers import Customer
+from routes.groups import Group, UserGroup
+from routes.projects import Project
+from routes.users import User
+
+SCHEMA = 'response_check'
+
+# Response model -> the statements whose rows the routes return as that model
+RESPONSE_QUERIES = {
+    Customer: ('customers_all', 'customers_page', 'customer_by_id', 'customers_by_ids'),
+    Group: ('groups_all', 'groups_page', 'group_by_id', 'groups_by_company'),
+    UserGroup: ('group_members_detail',),
+    Project: ('projects_all', 'projects_page', 'project_by_id', 'projects_by_ids', 'projects_by_company'),
+    User: ('users_all', 'users_page', 'user_by_id', 'users_by_ids', 'users_by_company'),
+}
+
+async def main() -> int:
+    conn = await connect_to_db()
+    failures = []
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await conn.execute(f'CREATE SCHEMA {SCHEMA}')
+        await conn.execute(f'SET search_path TO {SCHEMA}')
+        await migrate.apply_migrations(conn)
+
+        for model, names in RESPONSE_QUERIES.items():
+            for name in names:
+                statement = await conn.prepare(queries.QUERIES[name])
+                columns = {attribute.name for attribute in statement.get_attributes()}
+                missing = [field for field in model.model_fields if field not in columns]
+                status = 'missing ' + ', '.join(missing) if missing else 'ok'
+                print(f'{model.__name__:12} {name:30} {status}')
+                if missing:
+                    failures.append((model.__name__, name, missing))
+    finally:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await close_db_connection(conn)
+
+    if failures:
+        print(f'{len(failures)} statement(s) do not cover their response model')
+        return 1
+    print('All checked statements cover their response models')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
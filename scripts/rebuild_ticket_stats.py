@@ -0,0 +1,33 @@
+"""Rebuild the ticket dashboard rollups (ticket_stats, ticket_daily_stats).
+
+Recounts each company from its tickets, in its own short transaction under
+the customer row lock, so it is safe to run while the API is serving traffic.
+Use it to backfill after a bulk load that bypassed the triggers or to repair
+drift.
+
+Usage (from the repository root)::
+
+    python -m scripts.rebuild_ticket_stats [COMPANY_ID ...]
+"""
+import asyncio
+import sys
+import ticket_stats
+from database import connect_to_db, close_db_connection
+
+async def main(company_ids: list) -> int:
+    conn = await connect_to_db()
+    try:
+        if company_ids:
+            drifted = [company_id for company_id in company_ids
+                       if await ticket_stats.rebuild_company(conn, company_id)]
+        else:
+            drifted = await ticket_stats.rebuild_all(conn)
+    finally:
+        await close_db_connection(conn)
+    for company_id in drifted:
+        print(f'{company_id}: rollups repaired')
+    print(f'{len(drifted)} compan{"y" if len(drifted) == 1 else "ies"} repaired')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(sys.argv[1:])))
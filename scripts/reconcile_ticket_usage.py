@@ -0,0 +1,34 @@
+"""Repair drift between customers.ticket_usage and the real ticket counts.
+
+Safe to run while the API is serving traffic: each company is fixed in its own
+short transaction under the customer row lock. Intended for a periodic job.
+
+Usage (from the repository root)::
+
+    python -m scripts.reconcile_ticket_usage [COMPANY_ID ...]
+"""
+import asyncio
+import sys
+import quota
+from database import connect_to_db, close_db_connection
+
+async def main(company_ids: list) -> int:
+    conn = await connect_to_db()
+    try:
+        if company_ids:
+            drift = {}
+            for company_id in company_ids:
+                fixed = await quota.reconcile_company(conn, company_id)
+                if fixed:
+                    drift[company_id] = {'recorded': fixed[0], 'actual': fixed[1]}
+        else:
+            drift = await quota.reconcile_all(conn)
+    finally:
+        await close_db_connection(conn)
+    for company_id, counts in drift.items():
+        print(f"{company_id}: ticket_usage {counts['recorded']} -> {counts['actual']}")
+    print(f'{len(drift)} compan{"y" if len(drift) == 1 else "ies"} repaired')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(sys.argv[1:])))
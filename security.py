@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import Depends, HTTPException, Query
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+from typing import Optional
+import hashlib
+import os
+import time
+import jwt
+
+# Access tokens are HS256 JWTs signed with SECRET_KEY. To rotate, move the
+# old value to SECRET_KEY_PREVIOUS (comma separated) and set a new
+# SECRET_KEY: new tokens use the new key, tokens signed with a previous key
+# stay valid until they expire, and dropping a key from the list revokes the
+# tokens signed with it. Each token names its key in the ``kid`` header.
+#
+# Scoped tokens (a ``scope`` claim) are short-lived tokens for one use that
+# cannot send an Authorization header, such as the browser EventSource of
+# /api/tickets/stream. They travel in URLs and logs, so they are valid only
+# where that scope is asked for and never as a bearer access token.
+JWT_ALGORITHM = 'HS256'
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+
+class AuthUser(BaseModel):
+    id_user: str
+    username: Optional[str] = None
+    role: str
+    company_id: Optional[str] = None
+
+def key_id(secret: str) -> str:
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+
+_signing_kid: Optional[str] = None
+_keys = {}
+
+def set_keys(current: Optional[str], previous: list = ()):
+    """Install the signing key and the previous keys still accepted."""
+    global _signing_kid
+    _keys.clear()
+    for secret in [current, *previous]:
+        if secret:
+            _keys[key_id(secret)] = secret
+    _signing_kid = key_id(current) if current else None
+
+set_keys(
+    os.getenv('SECRET_KEY'),
+    [key.strip() for key in os.getenv('SECRET_KEY_PREVIOUS', '').split(',') if key.strip()],
+)
+if _signing_kid is None:
+    print("SECRET_KEY is not set; login and authenticated routes will fail")
+
+def create_access_token(user_data: dict, expires_in: timedelta, **extra_claims) -> str:
+    if _signing_kid is None:
+        raise RuntimeError('SECRET_KEY is not set')
+    now = datetime.now(timezone.utc)
+    claims = {
+        'id_user': user_data['id_user'],
+        'username': user_data['username'],
+        'role': user_data['role'],
+        'company_id': user_data['company_id'],
+        'iat': now,
+        'exp': now + expires_in,
+        **extra_claims,
+    }
+    return jwt.encode(claims, _keys[_signing_kid], algorithm=JWT_ALGORITHM, headers={'kid': _signing_kid})
+
+class TokenCache:
+    """LRU of verified tokens keyed by token hash, each kept until its exp.
+
+    Entries remember which key verified them, so a key that has been rotated
+    out stops matching even for tokens already in the cache.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str, scope: Optional[str] = None):
+        entry = self._items.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, exp, kid, token_scope = entry
+        if token_scope != scope:
+            # Not the kind of token asked for; decode_token rejects it
+            self.misses += 1
+            return None
+        if exp <= time.time() or kid not in _keys:
+            del self._items[digest]
+            self.misses += 1
+            return None
+        self._items.move_to_end(digest)
+        self.hits += 1
+        return user
+
+    def put(self, digest: str, user: AuthUser, exp: float, kid: str, scope: Optional[str] = None):
+        self._items[digest] = (user, exp, kid, scope)
+        self._items.move_to_end(digest)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {'entries': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+_cache = TokenCache(AUTH_CACHE_SIZE)
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={'WWW-Authenticate': 'Bearer'})
+
+def decode_token(token: str, scope: Optional[str] = None) -> AuthUser:
+    """The user of a valid token: an access token, or with ``scope`` a
+    scoped token of that scope."""
+    digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    user = _cache.get(digest, scope)
+    if user is not None:
+        return user
+    try:
+        kid = jwt.get_unverified_header(token).get('kid')
+        # Tokens without a kid predate rotation support: try every key
+        candidates = [kid] if kid else list(_keys)
+        for candidate in candidates:
+            if candidate not in _keys:
+                continue
+            try:
+                claims = jwt.decode(token, _keys[candidate], algorithms=[JWT_ALGORITHM],
+                                    options={'require': ['exp']})
+                break
+            except jwt.InvalidSignatureError:
+                continue
+        else:
+            raise _unauthorized('Invalid token')
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized('Token expired')
+    except jwt.InvalidTokenError:
+        raise _unauthorized('Invalid token')
+    if 'role' not in claims or 'id_user' not in claims or claims.get('scope') != scope:
+        raise _unauthorized('Invalid token')
+    user = AuthUser(**{field: claims.get(field) for field in AuthUser.model_fields})
+    _cache.put(digest, user, claims['exp'], candidate, scope)
+    return user
+
+def create_scoped_token(user: AuthUser, scope: str, expires_in: timedelta) -> str:
+    """A short-lived token for ``user`` that only decode_token(token, scope) accepts."""
+    return create_access_token(user.model_dump(), expires_in, scope=scope)
+
+_bearer = HTTPBearer(auto_error=False)
+
+async def current_user(credentials: HTTPAuthorizationCredentials = Depends(_bearer)) -> AuthUser:
+    """Dependency: the user of the request's bearer token, or 401."""
+    if credentials is None:
+        raise _unauthorized('Not authenticated')
+    return decode_token(credentials.credentials)
+
+def bearer_or_scoped_user(scope: str):
+    """Dependency factory for routes a browser opens without headers: the
+    user of the bearer token, or else of a ``token`` query parameter holding
+    a scoped token of ``scope``."""
+    async def dependency(
+        token: Optional[str] = Query(None, description=f"Scoped token ({scope}) for clients that cannot send headers"),
+        credentials: HTTPAuthorizationCredentials = Depends(_bearer),
+    ) -> AuthUser:
+        if credentials is not None:
+            return decode_token(credentials.credentials)
+        if token:
+            return decode_token(token, scope)
+        raise _unauthorized('Not authenticated')
+    return dependency
+
+def auth_stats() -> dict:
+    return {'signing_key': _signing_kid, 'accepted_keys': len(_keys), 'token_cache': _cache.stats()}
@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+from fastapi import HTTPException, Response
+import pagination
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+class CursorTest(unittest.TestCase):
+    def test_round_trip(self):
+        for value in ('TICKET-1', ['2024-05-01T10:00:00', 'TICKET-1'], 'ünïcode/+?'):
+            cursor = encode_cursor(value)
+            self.assertNotIn('=', cursor)
+            self.assertEqual(decode_cursor(cursor), value)
+
+    def assert_invalid(self, fn, *args):
+        with self.assertRaises(HTTPException) as raised:
+            fn(*args)
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(raised.exception.detail, 'Invalid cursor')
+
+    def test_tampered_cursor(self):
+        cursor = encode_cursor('TICKET-1')
+        self.assert_invalid(decode_cursor, cursor[:-2] + '!!')
+        self.assert_invalid(decode_cursor, 'x' + cursor)
+
+    def test_cursor_of_the_wrong_shape(self):
+        self.assert_invalid(pagination._page, 10, encode_cursor(42), False, False)
+        # A [sort value, key] pair only where the list can be sorted
+        pair = encode_cursor(['2024-05-01', 'TICKET-1'])
+        self.assert_invalid(pagination._page, 10, pair, False, False)
+        self.assertEqual(pagination._page(10, pair, False, True).after, ['2024-05-01', 'TICKET-1'])
+
+    def test_cursor_without_limit_gets_max_page(self):
+        page = pagination._page(None, encode_cursor('TICKET-1'), False, False)
+        self.assertEqual(page.limit, pagination.MAX_PAGE_SIZE)
+        self.assertIsNone(pagination._page(None, None, False, False).limit)
+
+class FetchPageTest(unittest.IsolatedAsyncioTestCase):
+    async def fetch_page(self, rows, limit=2, after=None):
+        response = Response()
+        page = pagination.PageParams(limit=limit, after=after)
+        with mock.patch.object(pagination.queries, 'fetch', mock.AsyncMock(return_value=rows)) as fetch:
+            results = await pagination.fetch_page(None, 'tickets_page', 'ticket_id', page, response, 'COMP-1')
+        # One row more than the page, to know whether another page follows
+        fetch.assert_awaited_once_with(None, 'tickets_page', 'COMP-1', after or '', limit + 1)
+        return results, response
+
+    async def test_full_page_sets_next_cursor(self):
+        rows = [{'ticket_id': 'T1'}, {'ticket_id': 'T2'}, {'ticket_id': 'T3'}]
+        results, response = await self.fetch_page(rows)
+        self.assertEqual(results, rows[:2])
+        self.assertEqual(decode_cursor(response.headers[NEXT_CURSOR_HEADER]), 'T2')
+
+    async def test_last_page_has_no_next_cursor(self):
+        rows = [{'ticket_id': 'T3'}, {'ticket_id': 'T4'}]
+        results, response = await self.fetch_page(rows, after='T2')
+        self.assertEqual(results, rows)
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+import passwords
+
+def bcrypt_hash(cost: int) -> str:
+    return f'$2b${cost:02d}$' + 'x' * 53
+
+class PickRoundsTest(unittest.TestCase):
+    def pick(self, seconds: float, target_ms: float = 250) -> int:
+        with mock.patch.object(passwords, 'BCRYPT_MIN_ROUNDS', 10), \
+                mock.patch.object(passwords, 'BCRYPT_MAX_ROUNDS', 14), \
+                mock.patch.object(passwords, '_time_hash', return_value=seconds) as time_hash:
+            cost = passwords.pick_rounds(target_ms)
+        time_hash.assert_called_once_with(10)
+        return cost
+
+    def test_highest_cost_within_target(self):
+        # 20 ms at cost 10: 160 ms at 13, 320 ms at 14
+        self.assertEqual(self.pick(0.020), 13)
+
+    def test_cost_equal_to_target_is_allowed(self):
+        self.assertEqual(self.pick(0.025, target_ms=200), 13)
+
+    def test_clamped_to_max(self):
+        self.assertEqual(self.pick(0.0001), 14)
+
+    def test_clamped_to_min(self):
+        self.assertEqual(self.pick(1.0), 10)
+
+class NeedsRehashTest(unittest.TestCase):
+    def needs_rehash(self, cost, rounds=12, pinned=None) -> bool:
+        hashed = bcrypt_hash(cost) if isinstance(cost, int) else cost
+        with mock.patch.object(passwords, 'rounds', rounds), \
+                mock.patch.object(passwords, 'BCRYPT_ROUNDS', pinned), \
+                mock.patch.object(passwords, 'BCRYPT_MAX_ROUNDS', 14):
+            return passwords.needs_rehash(hashed)
+
+    def test_calibrated_cost_tolerates_one_round(self):
+        # Workers that calibrated 11 and 12 must not rehash each other's hashes
+        self.assertFalse(self.needs_rehash(11, rounds=12))
+        self.assertFalse(self.needs_rehash(12, rounds=11))
+        self.assertFalse(self.needs_rehash(12, rounds=12))
+
+    def test_calibrated_cost_upgrades_weak_hashes(self):
+        self.assertTrue(self.needs_rehash(10, rounds=12))
+
+    def test_calibrated_cost_downgrades_above_max(self):
+        self.assertFalse(self.needs_rehash(14, rounds=12))
+        self.assertTrue(self.needs_rehash(15, rounds=12))
+
+    def test_pinned_cost_must_match(self):
+        self.assertFalse(self.needs_rehash(12, rounds=12, pinned=12))
+        self.assertTrue(self.needs_rehash(11, rounds=11, pinned=12))
+        self.assertTrue(self.needs_rehash(13, rounds=13, pinned=12))
+
+    def test_unparseable_hash(self):
+        self.assertTrue(self.needs_rehash('not a bcrypt hash'))
+
+if __name__ == '__main__':
+    unittest.main()
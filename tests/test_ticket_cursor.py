@@ -0,0 +1,46 @@
+import unittest
+from fastapi.testclient import TestClient
+import main
+from database import get_db
+from pagination import encode_cursor
+
+class FakeConnection:
+    """Just enough of a connection for the routes to reach the cursor check."""
+
+    def get_server_pid(self):
+        return 0
+
+    async def fetchval(self, sql, *args):
+        return None
+
+async def fake_db():
+    yield FakeConnection()
+
+class InvalidTicketCursorTest(unittest.TestCase):
+    def setUp(self):
+        main.app.dependency_overrides[get_db] = fake_db
+        # Without the context manager the lifespan (database pool) does not run
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        main.app.dependency_overrides.clear()
+
+    def assert_invalid_cursor(self, path: str, params: dict):
+        response = self.client.get(path, params=params)
+        self.assertEqual(response.status_code, 400, response.text)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_undecodable_cursor(self):
+        self.assert_invalid_cursor('/api/tickets/', {'limit': 10, 'cursor': 'garbage!!'})
+
+    def test_cursor_of_another_sort(self):
+        # A ticket_id cursor where a (created_at, ticket_id) pair is expected
+        self.assert_invalid_cursor('/api/tickets/', {'sort': '-created_at', 'cursor': encode_cursor('TICKET-1')})
+
+    def test_cursor_with_bad_sort_value(self):
+        cursor = encode_cursor(['not a date', 'TICKET-1'])
+        self.assert_invalid_cursor('/api/tickets/', {'sort': 'created_at', 'cursor': cursor})
+        self.assert_invalid_cursor('/api/tickets/company/COMP-1', {'sort': 'created_at', 'cursor': cursor})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+from datetime import date
+import queries
+
+# Dashboard counts per company: tickets by status, priority and product, and
+# tickets created per day. The ticket_stats / ticket_daily_stats rollups are
+# kept current by the statement triggers from migration 0007, in the same
+# transaction as the ticket write, so a read is a handful of index rows no
+# matter how many tickets there are. Counts with company_id=None are summed
+# over all companies.
+
+DIMENSIONS = ('status', 'priority', 'product')
+
+async def company_stats(db, company_id: str = None, since: date = date.min) -> dict:
+    if company_id is None:
+        rows = await queries.fetch(db, 'ticket_stats_all')
+        daily = await queries.fetch(db, 'ticket_daily_stats_all', since)
+    else:
+        rows = await queries.fetch(db, 'ticket_stats_by_company', company_id)
+        daily = await queries.fetch(db, 'ticket_daily_stats_by_company', company_id, since)
+    counts = {dimension: {} for dimension in DIMENSIONS}
+    for row in rows:
+        counts[row['dimension']][row['value']] = row['total']
+    return {
+        'company_id': company_id,
+        'total': sum(counts['status'].values()),
+        **counts,
+        'daily': [{'day': row['day'], 'total': row['total']} for row in daily],
+    }
+
+async def rebuild_company(conn, company_id: str) -> bool:
+    """Recount one company's rollups from its tickets. Returns whether they
+    had drifted."""
+    async with conn.transaction():
+        # The stats triggers take the customer row lock before touching the
+        # counters, so no ticket write of this company can interleave
+        await queries.fetchval(conn, 'customer_lock_usage', company_id)
+        before = await company_stats(conn, company_id)
+        await queries.execute(conn, 'ticket_stats_clear_company', company_id)
+        await queries.execute(conn, 'ticket_daily_stats_clear_company', company_id)
+        await queries.execute(conn, 'ticket_stats_fill_company', company_id)
+        await queries.execute(conn, 'ticket_daily_stats_fill_company', company_id)
+        return await company_stats(conn, company_id) != before
+
+async def rebuild_all(conn) -> list:
+    """Recount every company, one short transaction each; returns the ids
+    whose rollups had drifted."""
+    drifted = []
+    for row in await queries.fetch(conn, 'ticket_stats_company_ids'):
+        if await rebuild_company(conn, row['company_id']):
+            drifted.append(row['company_id'])
+    return drifted